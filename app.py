@@ -6,23 +6,18 @@ from dotenv import load_dotenv
 import streamlit as st
 from streamlit_chat import message as st_message
 import time
-import pandas as pd
 import json
 from datetime import datetime
-import streamlit.components.v1 as components
 from pathlib import Path
 
-# own classes
-from scrap.scraper import WebScrapper
-from rag.summarization import WebSummarizer
-from rag.ingest import EmbeddingIngestor
-from rag.chatbot import ChatBot
-from parse.parsing import LLMParser
+# own classes (light ones only: crawl4ai, langchain, torch and couchbase are imported
+# by the page or action that needs them, so the Home page starts without them)
+from scrap.cache import CachePolicy
+from parse.parsing import LLMParser, StreamingLLMParser
 from config.ai_models import list_models
-from couch_db.couchdb2 import couchbase_data
-from utils.dialog import show_details_dialog
-from utils.experiments import prepare_boxplot_time
-from utils.experiments import prepare_barplot_time
+from couch_db.writer import get_result_writer, new_experiment_key
+from utils.jobs import get_job_manager, ACTIVE
+from utils.tasks import crawl_ingest_task, summarize_task
 
 # Set Windows event loop policy
 if sys.platform == "win32":
@@ -36,8 +31,8 @@ if "url_submitted" not in st.session_state:
     st.session_state.url_submitted = False
 if "extraction_done" not in st.session_state:
     st.session_state.extraction_done = False
-if "extracted_text" not in st.session_state:
-    st.session_state.extracted_text = ""
+if "extracted" not in st.session_state:
+    st.session_state.extracted = None     # crawled urls, character count and path of the markdown file
 if "embedding_done" not in st.session_state:
     st.session_state.embedding_done = False
 if "vectorstore" not in st.session_state:
@@ -46,6 +41,8 @@ if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 if "summary" not in st.session_state:
     st.session_state.summary = ""
+if "jobs" not in st.session_state:
+    st.session_state.jobs = {}     # background job ids of this session by step (crawl, summary)
 
 # ---------------------------
 # Page Config in streamlit
@@ -54,6 +51,38 @@ if "summary" not in st.session_state:
 st.set_page_config(layout="wide", page_title="Web-ChatBot")
 st.title("Project Chatbot with Multiple LLMs + RAG")
 
+# ---------------------------
+# Background jobs
+# ---------------------------
+
+# polls a running job every second without rerunning the whole page; once it has
+# finished the page reruns, and finished_job() hands its result over
+@st.fragment(run_every = 1.0)
+def job_progress(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None or job["status"] not in ACTIVE:
+        st.rerun()
+
+    st.progress(job["progress"] or 0.0, text = job["message"] or f"{job['kind'].capitalize()} {job['status']}...")
+    if st.button("Cancel", key = f"cancel_{job_id}"):
+        get_job_manager().cancel(job_id)
+
+# function to follow the background job of one step of this session: shows its progress
+# while it is active, returns its final state once (then forgets it), else None
+def finished_job(step):
+    job_id = st.session_state.jobs.get(step)
+    if job_id is None:
+        return None
+
+    job = get_job_manager().get(job_id)
+    if job is None or job["status"] not in ACTIVE:
+        del st.session_state.jobs[step]
+        get_job_manager().release(job_id)
+        return job or {"status": "lost", "error": None}
+
+    job_progress(job_id)
+    return None
+
 # ---------------------------
 # Streamlit UI
 # ---------------------------
@@ -94,17 +123,65 @@ if page == "Home":
 
 elif page == "AI Chatbot":
 
+    from rag.ingest import load_vectorstore
+    from rag.index_store import read_manifest
+    from rag.index_factory import INDEX_KINDS
+    from rag.registry import chatbot_registry
+    from rag.chatbot import ask_all_models
+
+    # reopen the persisted index (mmap, read-only, lazy chunk text) instead of re-embedding after a restart
+    if st.session_state.vectorstore is None and not st.session_state.get("index_load_attempted"):
+        st.session_state.index_load_attempted = True
+        st.session_state.vectorstore = load_vectorstore()
+
+    manifest = read_manifest("faiss_db") or {}
+    indexed_sources = manifest.get("sources", {}) if st.session_state.vectorstore else {}
+    if indexed_sources:
+        st.caption(f"Saved index loaded: {len(indexed_sources)} source(s) available for chat")
+
+    # function to read the first non-empty lines of the crawled markdown
+    def extracted_preview(path, n_lines = 5):
+        lines = []
+        with open(path, "r", encoding = "utf-8") as file:
+            for line in file:
+                if line.strip():
+                    lines.append(line.rstrip("\n"))
+                    if len(lines) == n_lines:
+                        break
+        return "\n".join(lines)
+
     # chatbot formulary
     with st.form("url_form"):
         url_input = st.text_input("Enter a URL to crawl:")
+        crawl_depth = st.number_input("Follow same-domain links (depth)", min_value = 0, max_value = 3, value = 0)
+        max_pages = st.number_input("Max pages", min_value = 1, max_value = 200, value = 50)
+        cache_mode = st.selectbox("Crawl cache", CachePolicy.MODES, index = 0,
+                                  help = "use: reuse cached pages (revalidated after TTL), refresh: re-crawl and update, bypass: no cache")
+        cache_ttl = st.number_input("Cache TTL (hours)", min_value = 0.0, value = 24.0)
+        # defaults to the kind the persisted index is configured with
+        current_kind = (manifest.get("index") or {}).get("kind", "flat")
+        index_type = st.selectbox("Vector index", INDEX_KINDS, index = INDEX_KINDS.index(current_kind),
+                                  help = "flat: exact search; ivf_flat / hnsw / ivf_pq: approximate, for large multi-site corpora")
         submit_url = st.form_submit_button("Submit URL")
 
         if submit_url and url_input:
+            # jobs of the previous url are no longer wanted
+            for job_id in st.session_state.jobs.values():
+                get_job_manager().cancel(job_id)
+            st.session_state.jobs = {}
+
             st.session_state.url_submitted = True
             st.session_state.extraction_done = False
-            st.session_state.embedding_done = False
+            # a url already in the saved index can be chatted with right away
+            st.session_state.embedding_done = url_input in indexed_sources
             st.session_state.chat_history = []
             st.session_state.summary = ""
+            st.session_state.extracted = None
+            # crawl and embedding run as one background job, page by page (widget interactions
+            # no longer restart it); the index is only reconfigured when another kind was picked
+            st.session_state.jobs["crawl"] = get_job_manager().submit(
+                "crawl", crawl_ingest_task, url_input, crawl_depth, max_pages, cache_mode, cache_ttl * 3600,
+                index_type if index_type != current_kind else None, label = url_input)
     
     if st.session_state.url_submitted:
         col1, col2 = st.columns(2)
@@ -113,65 +190,101 @@ elif page == "AI Chatbot":
             st.header("1. Web-Scrapping")
 
             if not st.session_state.extraction_done:
-                with st.spinner("Extracting website..."):
-                    scraper = WebScrapper()
-                    extracted = asyncio.run(scraper.crawl(url_input))
-                    st.session_state.extracted_text = extracted
+                job = finished_job("crawl")
+                if job is not None and job["status"] == "done":
+                    # only urls and counts are kept in the session, the markdown stays on disk
+                    result = job["result"]
+                    st.session_state.extracted = {key: result[key] for key in ("urls", "chars", "path")}
+                    st.session_state.ingest_stats = result["stats"]
                     st.session_state.extraction_done = True
-                st.success("Extraction complete!")
-
-            preview = "\n".join([line for line in st.session_state.extracted_text.splitlines() if line.strip()][:5])
-            st.text_area("Extracted Text Preview", preview, height=150)
-
-            st.download_button(
-                label="Download Extracted Text",
-                data=st.session_state.extracted_text,
-                file_name="extract_text.txt",
-                mime="text/plain",
-            )
-
-            st.markdown("---")
-
-            st.header("2. Web-Summarization")
-
-            if st.button("Summarize Web Page", key="summarize_button"):
-                with st.spinner("Summarizing..."):
-                    summarizer = WebSummarizer()
-                    st.session_state.summary = summarizer.summarize(st.session_state.extracted_text)
-                st.success("Summarization complete!")            
-
-            if st.session_state.summary:
-                st.subheader("Summarized Output")
-                
-                # LLM parsing
-                parser = LLMParser()
-                main_text, think_text = parser.parse_llm_response(st.session_state.summary)
-                
-                # Reasoning in expander (only if present)
-                if think_text:
-                    with st.expander("Thinking/Reasoning", expanded=False):
-                        st.markdown(think_text)
+                    # the job persisted the index page by page: reopen it for chatting
+                    st.session_state.vectorstore = load_vectorstore()
+                    st.session_state.embedding_done = st.session_state.vectorstore is not None
+                    if len(result["urls"]) > 1:
+                        st.caption(f"Crawled {len(result['urls'])} pages")
+                    st.success("Extraction complete!")
+                    if st.session_state.vectorstore is None:
+                        st.error("No page could be indexed, the chatbot is not available for this url.")
+                elif job is not None:
+                    st.error(f"Extraction {job['status']}{': ' + job['error'] if job['error'] else ''}")
+
+        if st.session_state.extraction_done and os.path.exists(st.session_state.extracted["path"]):
+            with col1:
+                st.text_area("Extracted Text Preview", extracted_preview(st.session_state.extracted["path"]), height=150)
+
+                with open(st.session_state.extracted["path"], "rb") as extracted_file:
+                    st.download_button(
+                        label="Download Extracted Text",
+                        data=extracted_file,
+                        file_name="extract_text.txt",
+                        mime="text/plain",
+                    )
 
-                # Main summary/answer
-                if main_text:
-                    st.markdown(main_text)
-                else:
-                    st.markdown("No summary content generated!")
+                st.markdown("---")
+
+                st.header("2. Web-Summarization")
+
+                model_names = list_models()
+                summary_model = st.selectbox(
+                    label = "Summarization model",
+                    options = model_names,
+                    index = model_names.index("Deepseek") if "Deepseek" in model_names else 0,
+                    key = "summary_model"
+                )
+
+                if st.button("Summarize Web Page", key="summarize_button") and "summary" not in st.session_state.jobs:
+                    # large pages are summarized map-reduce; unchanged chunks come from cache/summaries
+                    st.session_state.jobs["summary"] = get_job_manager().submit(
+                        "summary", summarize_task, st.session_state.extracted["path"], summary_model, label = summary_model)
+
+                job = finished_job("summary")
+                if job is not None and job["status"] == "done":
+                    st.session_state.summary = job["result"]["summary"]
+                    stats = job["result"]["stats"]
+                    st.success(f"Summarization complete! ({stats['chunks']} chunks, {stats['calls']} model calls, "
+                               f"{stats['cached']} from cache)")
+                elif job is not None:
+                    st.error(f"Summarization {job['status']}{': ' + job['error'] if job['error'] else ''}")
+
+                if st.session_state.summary:
+                    st.subheader("Summarized Output")
+                    
+                    # LLM parsing
+                    parser = LLMParser()
+                    main_text, think_text = parser.parse_llm_response(st.session_state.summary)
+                    
+                    # Reasoning in expander (only if present)
+                    if think_text:
+                        with st.expander("Thinking/Reasoning", expanded=False):
+                            st.markdown(think_text)
+
+                    # Main summary/answer
+                    if main_text:
+                        st.markdown(main_text)
+                    else:
+                        st.markdown("No summary content generated!")
 
         with col2:
             st.header("3. Create Embeddings")
 
-            if st.session_state.extraction_done and not st.session_state.embedding_done:
-                if st.button("Create Embeddings"):
-                    with st.spinner("Creating embeddings..."):
-                        embeddings = EmbeddingIngestor()
-                        st.session_state.vectorstore = embeddings.create_embeddings(st.session_state.extracted_text)
+            if "crawl" in st.session_state.jobs and not st.session_state.embedding_done:
+                st.info("Pages are embedded as they are crawled.")
+                # pages already committed can be chatted with before the crawl ends
+                if url_input in manifest.get("sources", {}) and st.button("Chat with the pages indexed so far"):
+                    vectorstore = load_vectorstore()
+                    if vectorstore is not None:
+                        st.session_state.vectorstore = vectorstore
                         st.session_state.embedding_done = True
-                    st.success("Vectors are created!")
+                        st.rerun()
+                    st.error("The index could not be opened, try again once the crawl has finished.")
 
             elif st.session_state.embedding_done:
                 st.info("Embeddings have been created.")
 
+            if st.session_state.embedding_done and st.session_state.get("ingest_stats"):
+                with st.expander("Ingest throughput", expanded = False):
+                    st.json(st.session_state.ingest_stats)
+
             st.markdown("---")
 
             st.header("4. ChatBot")
@@ -184,13 +297,11 @@ elif page == "AI Chatbot":
                 if st.button("New Experiment", key="new_experiment") and user_input:
 
                     if url_input and user_input:
-                        experiment_key = couchbase_data.init_experiment(url_input, user_input)
-
-                        if experiment_key:
-                            st.session_state.current_experiment = experiment_key
-                            st.success(f"Experiment registered: {experiment_key}!")
-                        else:
-                            st.error("Error to register experiment!")
+                        # registered through the background writer: the UI does not wait on the database
+                        experiment_key = new_experiment_key()
+                        get_result_writer().submit_experiment(experiment_key, url_input, user_input)
+                        st.session_state.current_experiment = experiment_key
+                        st.success(f"Experiment registered: {experiment_key}!")
                 
                 selected_model = st.selectbox(
                     label = "--- Select LLM model ---",
@@ -199,45 +310,123 @@ elif page == "AI Chatbot":
                     help = "Select the LLM model for Chatbot"
                 )                
                 
+                # answer cache is off by default: cached answers would distort the benchmark timings
+                use_answer_cache = st.checkbox("Serve repeated questions from the answer cache", value = False,
+                                               help = "Cached answers are shown but not recorded as benchmark results")
+
+                # keep the local ollama models loaded (started once per process)
+                chatbot_registry.preload_all()
+
                 # register details of experiment in couchbase
                 if st.button("Send", key="send_button") and user_input:
 
-                    if not st.session_state.current_experiment:
+                    if not st.session_state.get("current_experiment"):
                         st.warning("Please, register the experiment first!")
                     else:
-                        # start chatbot
-                        start_time = time.time()
-                        chatbot = ChatBot(st.session_state.vectorstore, selected_model)   
-                        bot_answer = chatbot.qa(user_input)
-                    
-                        end_time = time.time()
-                        total_time = (end_time - start_time)/60
+                        # warm chain from the registry: setup cost stays out of the measured time
+                        chatbot = chatbot_registry.get(st.session_state.vectorstore, selected_model)
+
+                        # start chatbot: stream tokens into the page, routing <think> text to its expander
+                        stream_area = st.empty()
+                        with stream_area.container():
+                            st_message(user_input, is_user=True, key="streaming_user")
+                            with st.expander("Thinking / Reasoning", expanded=False):
+                                think_box = st.empty()
+                            answer_box = st.empty()
+
+                        stream_parser = StreamingLLMParser()
+                        metrics = {}
+                        for token in chatbot.stream_qa(user_input, metrics, use_cache = use_answer_cache):
+                            main_delta, think_delta = stream_parser.feed(token)
+                            if think_delta:
+                                think_box.markdown(stream_parser.think_text)
+                            if main_delta:
+                                answer_box.markdown(stream_parser.main_text + "▌")
+                        stream_parser.flush()
+                        # the finished answer is rendered with the chat history below
+                        stream_area.empty()
+
+                        bot_answer = "".join(
+                            [f"<think>{stream_parser.think_text}</think>" if stream_parser.think_text else "",
+                             stream_parser.main_text])
+                        total_time = metrics["total"]/60
 
                         st.session_state.chat_history.append({
                             "user": user_input, 
                             "bot": bot_answer, 
-                            "time": total_time
+                            "time": total_time,
+                            "model": selected_model,
+                            "ttft": metrics["ttft"],
+                            "tokens_per_sec": metrics["tokens_per_sec"],
+                            "prompt_tokens": metrics["prompt_tokens"]
                         })
 
-                        # save to file
-                        chat_file_content = "\n\n".join([f"User: {chat['user']}\nBot: {chat['bot']}\nTime: {chat.get('time', 0):.2f} min" for chat in st.session_state.chat_history])                        
-                        with open(f"history/chat_history.txt", "w", encoding="utf-8") as cf:
-                            cf.write(chat_file_content)
+                        # save to file (append only the new exchange)
+                        with open(f"history/chat_history.txt", "a", encoding="utf-8") as cf:
+                            cf.write(f"User: {user_input}\nBot: {bot_answer}\nTime: {total_time:.2f} min\n\n")
 
-                        try:                            
-                            # insert results chatbot in couchbase
-                            success = couchbase_data.insert(
+                        # queue results for the background writer (batched, WAL-backed)
+                        if metrics.get("cached"):
+                            st.info("Answer served from cache: not recorded in the experiment.")
+                        else:
+                            get_result_writer().submit_run(
                                 experiment_key = st.session_state.current_experiment,
                                 model_name = selected_model,
                                 answer = bot_answer,                                
                                 time = total_time,
-                                score = None
+                                score = None,
+                                ttft = metrics["ttft"],
+                                tokens_per_sec = metrics["tokens_per_sec"],
+                                output_tokens = metrics["output_tokens"],
+                                prompt_tokens = metrics["prompt_tokens"],
+                                stages = metrics["stages"]
                             )
 
-                            if not success:
-                                st.warning("Failed to save QA in couchbase!")
-                        except Exception as e:
-                            st.error(f"Couchbase error: {str(e)}")
+                # benchmark mode: same question and context to every model concurrently
+                if st.button("Ask all models", key="ask_all_button") and user_input:
+
+                    if not st.session_state.get("current_experiment"):
+                        st.warning("Please, register the experiment first!")
+                    else:
+                        chatbots = {}
+                        for model_name in list_models():
+                            try:
+                                chatbots[model_name] = chatbot_registry.get(st.session_state.vectorstore, model_name)
+                            except ValueError as e:
+                                st.warning(f"Skipping {model_name}: {str(e)}")
+
+                        if not chatbots:
+                            st.warning("No model is available to answer!")
+                            st.stop()
+
+                        with st.spinner(f"Asking {len(chatbots)} models..."):
+                            start_time = time.time()
+                            results = asyncio.run(ask_all_models(chatbots, user_input))
+                            wall_time = (time.time() - start_time)/60
+                        st.success(f"All models answered in {wall_time:.2f} minutes")
+
+                        for result in results:
+                            if result["error"]:
+                                st.error(f"{result['model_name']} failed: {result['error']}")
+                                continue
+
+                            st.session_state.chat_history.append({
+                                "user": user_input,
+                                "bot": result["answer"],
+                                "time": result["time"],
+                                "model": result["model_name"],
+                                "prompt_tokens": result["prompt_tokens"]
+                            })
+
+                            get_result_writer().submit_run(
+                                experiment_key = st.session_state.current_experiment,
+                                model_name = result["model_name"],
+                                answer = result["answer"],
+                                time = result["time"],
+                                score = None,
+                                prompt_tokens = result["prompt_tokens"],
+                                stages = result["stages"]
+                            )
 
                 # clear conversation button
                 if st.button("Clear conversation", key = "clear_button"):
@@ -250,7 +439,14 @@ elif page == "AI Chatbot":
                         parser = LLMParser()
 
                         # print user question in frontend
-                        st.markdown(f"Time: {chat.get('time', 0):.2f} minutes")
+                        stream_info = ""
+                        if chat.get("ttft") is not None:
+                            stream_info += f" | TTFT: {chat['ttft']:.2f} s"
+                        if chat.get("tokens_per_sec") is not None:
+                            stream_info += f" | {chat['tokens_per_sec']:.1f} tokens/s"
+                        if chat.get("prompt_tokens") is not None:
+                            stream_info += f" | prompt: {chat['prompt_tokens']} tokens"
+                        st.markdown(f"Model: {chat.get('model', '-')} | Time: {chat.get('time', 0):.2f} minutes{stream_info}")
                         st_message(chat["user"], is_user=True)
                         
                         # print the bot answer in fronted
@@ -273,29 +469,59 @@ elif page == "AI Chatbot":
 
 elif page == "Reports":
 
-    st.header("Experiment Reports")
+    import pandas as pd
+    from couch_db.couchdb2 import couchbase_data
+    from utils.dialog import show_details_dialog
 
-    # read data from couchbase
-    experiment_data = couchbase_data.read_documents()
+    st.header("Experiment Reports")
 
-    if not experiment_data:
-        st.warning("No data found in couchbase")
+    if not couchbase_data.available():
+        st.error("Couchbase is not reachable: reports are unavailable until it is back.")
         st.stop()
 
-    experiment_keys = list(experiment_data.keys())
+    # filters (pushed down to the query, answers are never loaded here)
+    filter_cols = st.columns(4)
+    date_from = filter_cols[0].date_input("From", value = None)
+    date_to = filter_cols[1].date_input("To", value = None)
+    model_filter = filter_cols[2].selectbox("Model", ["All"] + list_models())
+    url_filter = filter_cols[3].text_input("URL contains")
+
+    filters = {
+        "date_from": date_from.strftime("%Y-%m-%d") if date_from else None,
+        "date_to": date_to.strftime("%Y-%m-%d 23:59:59") if date_to else None,
+        "model_name": None if model_filter == "All" else model_filter,
+        "url": url_filter or None
+    }
+
+    # keyset pagination: stack of cursors (last key of each previous page), reset when filters change
+    if st.session_state.get("report_filters") != filters:
+        st.session_state.report_filters = filters
+        st.session_state.report_cursors = [None]
+
+    experiments_per_page = 10
+    experiments = couchbase_data.query_experiments(
+        limit = experiments_per_page,
+        before_key = st.session_state.report_cursors[-1],
+        **filters
+    )
 
-    if not experiment_keys:
+    if not experiments:
         st.warning("No experiments found in the database!")
-        st.stop()
+
+    nav_prev, nav_page, nav_next = st.columns([1, 2, 1])
+    if nav_prev.button("Previous", disabled = len(st.session_state.report_cursors) == 1):
+        st.session_state.report_cursors.pop()
+        st.rerun()
+    nav_page.markdown(f"Page {len(st.session_state.report_cursors)}")
+    if nav_next.button("Next", disabled = len(experiments) < experiments_per_page):
+        st.session_state.report_cursors.append(experiments[-1]["experiment_key"])
+        st.rerun()
 
     st.markdown("---")
 
     # create expanders frontend (like accordion)
-    for experiment_key in experiment_keys:
-        experiment = experiment_data[experiment_key]
-
-        if not isinstance(experiment, dict):
-            continue
+    for experiment in experiments:
+        experiment_key = experiment["experiment_key"]
         
         with st.expander(f"**Experiment:** \n{experiment_key}", expanded = False):
             
@@ -306,20 +532,18 @@ elif page == "Reports":
             
             st.markdown("---")
 
-            # generation of each response in each accordion
-            df = pd.DataFrame({
-                'Model': experiment.get('model_name', []),
-                'Answer': experiment.get('answer', []),
-                'Time': experiment.get('time', []),
-                'Score': experiment.get('score', [])
-            })            
+            # runs are only queried once the user asks for them
+            if not st.toggle("Load conversations", key = f"load_{experiment_key}"):
+                continue
 
             # display the current page
             st.subheader("Report of conversations")
 
             # pagination logic
             page_size = 5
-            total_items = len(df)
+            # with a model filter only that model's runs are paged through
+            total_items = couchbase_data.count_runs(experiment_key, model_name = filters["model_name"]) \
+                if filters["model_name"] else (experiment.get("n_runs") or 0)
             total_pages = max(1, (total_items - 1) // page_size + 1)
 
             # Fix Duplicate ID by providing a unique key
@@ -330,10 +554,21 @@ elif page == "Reports":
                 value = 1,
                 key = f"page_num_{experiment_key}"
             )
-            
-            start_idx = (page_num - 1) * page_size
-            end_idx = start_idx + page_size
-            current_df_slice = df.iloc[start_idx:end_idx]
+
+            runs = couchbase_data.query_runs(
+                experiment_key,
+                limit = page_size,
+                offset = (page_num - 1) * page_size,
+                model_name = filters["model_name"]
+            )
+
+            current_df_slice = pd.DataFrame({
+                'Model': [run.get('model_name') for run in runs],
+                'Time': [run.get('time') for run in runs],
+                'TTFT': [run.get('ttft') for run in runs],
+                'Prompt tokens': [run.get('prompt_tokens') for run in runs],
+                'Score': [run.get('score') for run in runs]
+            })
 
             event = st.dataframe(
                 data = current_df_slice,
@@ -341,12 +576,15 @@ elif page == "Reports":
                     "Model": st.column_config.TextColumn(
                         "Model", width = "medium"
                     ),
-                    "Answer": st.column_config.TextColumn(
-                        "Answer", width = "large"
-                    ),
                     "Time": st.column_config.NumberColumn(
                         "Time (min)", format="%.2f", width = "small"
                     ),
+                    "TTFT": st.column_config.NumberColumn(
+                        "TTFT (s)", format="%.2f", width = "small"
+                    ),
+                    "Prompt tokens": st.column_config.NumberColumn(
+                        "Prompt tokens", format="%d", width = "small"
+                    ),
                     "Score": st.column_config.NumberColumn(
                         "Score", format="%.2f", width = "small"
                     )
@@ -360,21 +598,28 @@ elif page == "Reports":
 
             st.markdown("---")
 
-            # Trigger dialog if a row is selected
+            # Trigger dialog if a row is selected: the answer is fetched only now
             if event and event.selection and event.selection.rows:
-                selected_row_idx = event.selection.rows[0]
-                selected_data = current_df_slice.iloc[selected_row_idx]                
-                show_details_dialog(selected_data['Model'], selected_data['Answer'])
+                selected_run = runs[event.selection.rows[0]]
+                answer = couchbase_data.read_answer(selected_run["run_key"])
+                show_details_dialog(selected_run['model_name'], answer or "")
 
 
 elif page == "Benchmarks":
 
-    # read data from couchbase
-    experiment_data = couchbase_data.read_documents()
-    
-    # preprocess charts data
-    box_time_data = prepare_boxplot_time(experiment_data)
-    bar_time_data = prepare_barplot_time(experiment_data)        
+    import streamlit.components.v1 as components
+    from couch_db.couchdb2 import couchbase_data
+    from couch_db.aggregation import get_aggregator
+
+    if not couchbase_data.available():
+        st.error("Couchbase is not reachable: benchmarks are unavailable until it is back.")
+        st.stop()
+
+    # chart-ready aggregates from couchbase (cached until new results are inserted)
+    aggregator = get_aggregator(couchbase_data)
+    box_time_data = aggregator.boxplot_time()
+    bar_time_data = aggregator.barplot_time()
+    stage_data = aggregator.stage_breakdown()
     
     # serialize to JSON strings
     box_models_json = json.dumps(box_time_data[0])
@@ -385,6 +630,10 @@ elif page == "Benchmarks":
     bar_keys_json = json.dumps(bar_time_data[0])
     bar_series_json = json.dumps(bar_time_data[1])
 
+    # mean per-stage latency per model (stacked bars)
+    stage_models_json = json.dumps(stage_data[0])
+    stage_series_json = json.dumps(stage_data[1])
+
     # Load HTML template and JS scripts
     html_template = Path("static/html/charts.html").read_text(encoding="utf-8")
     
@@ -404,6 +653,10 @@ elif page == "Benchmarks":
         "__BAR_KEYS__", bar_keys_json
     ).replace(
         "__BAR_SERIES__", bar_series_json
+    ).replace(
+        "__STAGE_MODELS__", stage_models_json
+    ).replace(
+        "__STAGE_SERIES__", stage_series_json
     )
 
     # Render
@@ -0,0 +1,76 @@
+import time
+import argparse
+import numpy as np
+import faiss
+from rag.ingest import EmbeddingIngestor
+from rag.index_factory import IndexSpec, INDEX_KINDS, build_index, index_kind
+
+# function to measure recall@k and per-query latency of an index against exact search
+def evaluate(index, queries, ground_truth, k):
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    hits = sum(len(set(found[i]) & set(ground_truth[i])) for i in range(len(queries)))
+    return hits / (len(queries) * k), latency_ms
+
+# function to check that the index serves MMR search, which reconstructs candidate vectors by id
+def supports_mmr(index):
+    try:
+        index.reconstruct(0)
+        return True
+    except RuntimeError:
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description = "Recall@k vs latency of ANN index types over the persisted corpus")
+    parser.add_argument("--index-path", default = "faiss_db")
+    parser.add_argument("--k", type = int, default = 5)
+    parser.add_argument("--queries", type = int, default = 200, help = "chunks sampled as queries")
+    parser.add_argument("--nlist", type = int, default = 256)
+    parser.add_argument("--nprobe", type = int, nargs = "+", default = [1, 4, 16, 64])
+    parser.add_argument("--ef-search", type = int, nargs = "+", default = [16, 64, 256])
+    args = parser.parse_args()
+
+    ingestor = EmbeddingIngestor(index_path = args.index_path)
+    if ingestor.vector_db is None:
+        print(f"No index found in {args.index_path}")
+        return
+
+    # corpus vectors come from the embedding cache
+    vector_db = ingestor.vector_db
+    texts = [vector_db.docstore.search(chunk_id).page_content for chunk_id in vector_db.index_to_docstore_id.values()]
+    vectors = np.asarray(ingestor.model.embed_documents(texts), dtype = np.float32)
+
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace = False)]
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, args.k)
+
+    print(f"corpus: {len(vectors)} chunks, {len(queries)} queries, k = {args.k}")
+    print(f"{'index':<28}{'recall@k':>10}{'ms/query':>12}{'build s':>10}{'mmr':>6}")
+
+    for kind in INDEX_KINDS:
+        knobs = {"ivf_flat": args.nprobe, "ivf_pq": args.nprobe, "hnsw": args.ef_search}.get(kind, [None])
+        for knob in knobs:
+            spec = IndexSpec(kind = kind, nlist = args.nlist)
+            if kind.startswith("ivf"):
+                spec.nprobe = knob
+            elif kind == "hnsw":
+                spec.ef_search = knob
+
+            start = time.perf_counter()
+            index = build_index(spec, vectors)
+            build_s = time.perf_counter() - start
+
+            recall, latency_ms = evaluate(index, queries, ground_truth, args.k)
+            label = spec.factory_string() + (f" ({'nprobe' if kind.startswith('ivf') else 'efSearch'}={knob})" if knob else "")
+            if index_kind(index) != kind:
+                label = f"{spec.factory_string()} (too small, flat)"
+            mmr = "ok" if supports_mmr(index) else "FAIL"
+            print(f"{label:<28}{recall:>10.3f}{latency_ms:>12.3f}{build_s:>10.2f}{mmr:>6}")
+
+if __name__ == "__main__":
+    main()
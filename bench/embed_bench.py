@@ -0,0 +1,49 @@
+import time
+import argparse
+import itertools
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from rag.embedding_engine import EmbeddingEngine, BACKENDS
+
+# function to time one engine configuration over the chunks (after a warm-up batch)
+def run_config(texts, backend, batch_size, num_threads, processes):
+    engine = EmbeddingEngine(backend = backend, batch_size = batch_size, num_threads = num_threads,
+                             processes = processes, pool_min_texts = 1)
+    try:
+        engine.embed_documents(texts[:batch_size])
+
+        start = time.perf_counter()
+        engine.embed_documents(texts)
+        seconds = time.perf_counter() - start
+    finally:
+        engine.close()
+
+    return len(texts) / seconds
+
+def main():
+    parser = argparse.ArgumentParser(description = "Chunks/sec of the embedding engine per configuration")
+    parser.add_argument("--file", default = "history/output.md", help = "markdown file split into chunks")
+    parser.add_argument("--max-chunks", type = int, default = 2000)
+    parser.add_argument("--backends", nargs = "+", default = ["torch"], choices = BACKENDS)
+    parser.add_argument("--batch-sizes", type = int, nargs = "+", default = [16, 64, 256])
+    parser.add_argument("--threads", type = int, nargs = "+", default = [1, 4])
+    parser.add_argument("--processes", type = int, nargs = "+", default = [0])
+    args = parser.parse_args()
+
+    with open(args.file, "r", encoding = "utf-8") as file:
+        text = file.read()
+    splitter = RecursiveCharacterTextSplitter(chunk_size = 500, chunk_overlap = 50)
+    texts = splitter.split_text(text)[:args.max_chunks]
+
+    print(f"{len(texts)} chunks from {args.file}")
+    print(f"{'backend':<12}{'batch':>7}{'threads':>9}{'procs':>7}{'chunks/s':>11}")
+
+    for backend, batch_size, num_threads, processes in itertools.product(
+            args.backends, args.batch_sizes, args.threads, args.processes):
+        try:
+            rate = run_config(texts, backend, batch_size, num_threads, processes)
+            print(f"{backend:<12}{batch_size:>7}{num_threads:>9}{processes:>7}{rate:>11.1f}")
+        except Exception as ex:
+            print(f"{backend:<12}{batch_size:>7}{num_threads:>9}{processes:>7}  failed: {ex}")
+
+if __name__ == "__main__":
+    main()
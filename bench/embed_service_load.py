@@ -0,0 +1,40 @@
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from rag.embedding_service import EmbeddingClient, ping, start_service, DEFAULT_ADDRESS
+
+# function to embed queries from `clients` concurrent threads; returns texts/sec
+def run_load(client, clients, queries_per_client):
+    def session(n):
+        for i in range(queries_per_client):
+            client.embed_query(f"question {n}.{i} about the crawled page")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = clients) as pool:
+        list(pool.map(session, range(clients)))
+    return clients * queries_per_client / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Query throughput of the shared embedding service vs concurrent users")
+    parser.add_argument("--clients", type = int, nargs = "+", default = [1, 4, 16])
+    parser.add_argument("--queries", type = int, default = 50, help = "queries per client")
+    args = parser.parse_args()
+
+    if not ping() and not start_service():
+        print(f"Embedding service is not reachable on {DEFAULT_ADDRESS}")
+        return
+
+    client = EmbeddingClient()
+    client.embed_query("warm-up")
+
+    print(f"{'clients':>8}{'texts/s':>10}{'mean batch':>12}")
+    for clients in args.clients:
+        before = client.stats()
+        rate = run_load(client, clients, args.queries)
+        after = client.stats()
+        batches = after["batches"] - before["batches"]
+        mean_batch = (after["texts"] - before["texts"]) / batches if batches else 0
+        print(f"{clients:>8}{rate:>10.1f}{mean_batch:>12.1f}")
+
+if __name__ == "__main__":
+    main()
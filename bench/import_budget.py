@@ -0,0 +1,73 @@
+import sys
+import time
+import argparse
+import subprocess
+
+# packages that must not be loaded to render the Home page (each costs seconds or a connection)
+HEAVY_PACKAGES = ["torch", "sentence_transformers", "transformers", "langchain", "langchain_core",
+                  "langchain_community", "langchain_ollama", "langchain_openai", "faiss", "crawl4ai",
+                  "playwright", "couchbase", "datasets", "onnxruntime"]
+
+# Home is the default page, so running the script bare (outside `streamlit run`) renders it
+HOME_PAGE = "import runpy; runpy.run_path('app.py', run_name = '__main__')"
+
+# function to run code in a fresh interpreter under -X importtime;
+# returns (wall seconds, [(cumulative us, depth, module)])
+def profile_imports(code):
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                             capture_output = True, text = True)
+    wall_s = time.perf_counter() - start
+
+    if process.returncode != 0:
+        raise RuntimeError(f"profiled code failed:\n{process.stderr[-2000:]}")
+
+    imports = []
+    for line in process.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((int(cumulative), depth, name.strip()))
+
+    return wall_s, imports
+
+def main():
+    parser = argparse.ArgumentParser(description = "Import-time budget of the Home page (guards cold start regressions)")
+    parser.add_argument("--budget", type = float, default = 1.0, help = "max total import time in seconds")
+    parser.add_argument("--module", help = "profile `import MODULE` instead of the Home page")
+    parser.add_argument("--top", type = int, default = 15, help = "slowest top-level imports to list")
+    parser.add_argument("--allow-heavy", action = "store_true", help = "do not fail when heavy packages are loaded")
+    args = parser.parse_args()
+
+    code = f"import {args.module}" if args.module else HOME_PAGE
+    try:
+        wall_s, imports = profile_imports(code)
+    except RuntimeError as ex:
+        print(f"FAIL: {ex}")
+        sys.exit(2)
+
+    # top-level entries (depth 0) partition the total import time
+    top_level = sorted((entry for entry in imports if entry[1] == 0), reverse = True)
+    total_s = sum(cumulative for cumulative, _, _ in top_level) / 1e6
+    loaded = {name.split(".")[0] for _, _, name in imports}
+    heavy = sorted(loaded & set(HEAVY_PACKAGES))
+
+    print(f"{'module':<40}{'cumulative ms':>15}")
+    for cumulative, _, name in top_level[:args.top]:
+        print(f"{name:<40}{cumulative / 1000:>15.1f}")
+    print(f"\nimports: {total_s:.2f} s (budget {args.budget:.2f} s), process wall time: {wall_s:.2f} s")
+
+    failures = []
+    if total_s > args.budget:
+        failures.append(f"import time {total_s:.2f} s is over the {args.budget:.2f} s budget")
+    if heavy and not args.allow_heavy:
+        failures.append(f"heavy packages loaded: {', '.join(heavy)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
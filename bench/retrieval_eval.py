@@ -0,0 +1,106 @@
+import re
+import json
+import time
+import random
+import argparse
+from config.ai_models import get_rag_settings
+from rag.ingest import load_vectorstore
+from rag.index_store import lexical_index_of
+from rag.context import retrieve_candidates, lexical_is_decisive
+from utils.experiments import percentile
+
+IDENTIFIER = re.compile(r"[A-Za-z_][\w.\-]*[_.\-\d][\w.\-]*")
+
+# function to read labelled queries: {"question": ..., "expected": substring of a relevant chunk}
+def load_queries(path):
+    with open(path, "r", encoding = "utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+# function to build queries from the corpus itself: a window of words around an
+# identifier-like token (or any window) of a sampled chunk, expected back in the top k
+def synthetic_queries(vector_db, n, window = 8, seed = 0):
+    rng = random.Random(seed)
+    ids = list(vector_db.index_to_docstore_id.values())
+    queries = []
+
+    for chunk_id in rng.sample(ids, min(n, len(ids))):
+        words = vector_db.docstore.search(chunk_id).page_content.split()
+        if len(words) < window:
+            continue
+        anchors = [i for i, word in enumerate(words) if IDENTIFIER.fullmatch(word.strip(".,:;()`'\""))]
+        center = rng.choice(anchors) if anchors else rng.randrange(len(words))
+        start = max(0, min(center - window // 2, len(words) - window))
+        queries.append({"question": " ".join(words[start:start + window]), "chunk_id": chunk_id})
+
+    return queries
+
+def is_hit(query, docs, vector_db):
+    if "expected" in query:
+        return any(query["expected"].lower() in doc.page_content.lower() for doc in docs)
+
+    expected_text = vector_db.docstore.search(query["chunk_id"]).page_content
+    return any(doc.page_content == expected_text for doc in docs)
+
+# function to run every query through one retrieval mode: hit rate and per-query latency
+def evaluate(vector_db, lexical, queries, settings):
+    hits, latencies_ms, skipped = 0, [], 0
+
+    for query in queries:
+        start = time.perf_counter()
+        docs = retrieve_candidates(vector_db, query["question"], settings, lexical)
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+
+        hits += is_hit(query, docs, vector_db)
+        if settings["hybrid"] and settings["skip_dense_ratio"] is not None:
+            skipped += lexical_is_decisive(lexical.search(query["question"], k = 2), settings["skip_dense_ratio"])
+
+    latencies_ms.sort()
+    return {
+        "hit_rate": hits / len(queries),
+        "mean_ms": sum(latencies_ms) / len(latencies_ms),
+        "p50_ms": percentile(latencies_ms, 0.5),
+        "p95_ms": percentile(latencies_ms, 0.95),
+        "dense_skipped": skipped / len(queries)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = "Hit rate and latency of dense vs hybrid (BM25 + dense) retrieval")
+    parser.add_argument("--index-path", default = "faiss_db")
+    parser.add_argument("--queries", help = "JSONL with question / expected; default: synthetic queries from the corpus")
+    parser.add_argument("--n", type = int, default = 200, help = "number of synthetic queries")
+    parser.add_argument("--model", default = "Deepseek", help = "model whose retrieval settings are used")
+    parser.add_argument("--k", type = int, default = 5)
+    parser.add_argument("--skip-dense-ratio", type = float, default = 2.0)
+    args = parser.parse_args()
+
+    vector_db = load_vectorstore(args.index_path)
+    if vector_db is None:
+        return
+    lexical = lexical_index_of(vector_db)
+    if lexical is None:
+        print(f"No lexical index in {args.index_path}: re-open it once with EmbeddingIngestor to build it")
+        return
+
+    queries = load_queries(args.queries) if args.queries else synthetic_queries(vector_db, args.n)
+    if not queries:
+        print("No queries to evaluate")
+        return
+    base = dict(get_rag_settings(args.model), k = args.k)
+    modes = {
+        "dense": dict(base, hybrid = False),
+        "hybrid (rrf)": dict(base, hybrid = True, skip_dense_ratio = None),
+        "hybrid + lexical skip": dict(base, hybrid = True, skip_dense_ratio = args.skip_dense_ratio)
+    }
+
+    print(f"{len(queries)} queries, k = {args.k}, {base['search_type']} dense search")
+    print(f"{'mode':<24}{'hit rate':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'skipped':>10}")
+
+    for mode, settings in modes.items():
+        # warm-up: first query pays model / page-cache loading
+        retrieve_candidates(vector_db, queries[0]["question"], settings, lexical)
+        result = evaluate(vector_db, lexical, queries, settings)
+        print(f"{mode:<24}{result['hit_rate']:>10.3f}{result['mean_ms']:>10.2f}{result['p50_ms']:>10.2f}"
+              f"{result['p95_ms']:>10.2f}{result['dense_skipped']:>10.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config.ai_models import list_models
+from scrap.scraper import WebScrapper
+from scrap.cache import CachePolicy
+from rag.ingest import EmbeddingIngestor
+from rag.index_store import index_lock
+from rag.registry import chatbot_registry
+from rag.chatbot import BACKEND_LIMITS, backend_of
+from couch_db.writer import ResultWriter, JsonlSink, SqliteSink, build_sink, new_experiment_key
+from utils.experiments import percentile
+
+# function to read a suite: JSONL (one case per line) or YAML ({defaults..., cases: [...]});
+# a case is {"url": ..., "questions": [...] or "question": ..., "models": [...] (optional)}
+def load_suite(path):
+    with open(path, "r", encoding = "utf-8") as file:
+        if path.endswith((".yaml", ".yml")):
+            import yaml     # only needed for YAML suites
+            suite = yaml.safe_load(file)
+        else:
+            suite = {"cases": [json.loads(line) for line in file if line.strip()]}
+
+    cases = []
+    for case in suite["cases"]:
+        questions = case.get("questions") or [case["question"]]
+        models = case.get("models") or suite.get("models") or list_models()
+        cases.append({"url": case["url"], "questions": questions, "models": models})
+
+    return suite, cases
+
+def build_writer(kind = None, output = None):
+    if output and kind == "jsonl":
+        sink = JsonlSink(output)
+    elif output and kind == "sqlite":
+        sink = SqliteSink(output)
+    else:
+        sink = build_sink(kind)
+
+    # own WAL: the streamlit app may be writing through the default one
+    os.makedirs("history", exist_ok = True)
+    return ResultWriter(sink, wal_path = "history/results_wal_runner.jsonl")
+
+# function to crawl every url of the suite with one browser (page cache honoured)
+def crawl_pages(urls, cache_mode):
+    scraper = WebScrapper(cache_policy = CachePolicy(mode = cache_mode))
+
+    async def crawl():
+        return {url: markdown async for url, markdown in scraper.crawl_many(urls)}
+
+    return asyncio.run(crawl())
+
+# function to run one question through one model, fully streamed and timed
+def run_once(chatbot, question):
+    metrics = {}
+    answer = "".join(chatbot.stream_qa(question, metrics, use_cache = False))
+    return answer, metrics
+
+class BenchmarkRunner:
+    """
+    Headless benchmark over a url x question x model matrix: pages are crawled
+    and ingested once, each model gets warm-up runs (not recorded), then every
+    (question, model) pair runs `repetitions` times on the thread pool of its backend,
+    sized by BACKEND_LIMITS, so a slow backend only queues its own runs. Results go to
+    the result writer.
+    """
+
+    def __init__(self, cases, writer, repetitions = 5, warmup = 1, limits = None):
+        self.cases = cases
+        self.writer = writer
+        self.repetitions = repetitions
+        self.warmup = warmup
+        self.limits = dict(BACKEND_LIMITS, **(limits or {}))
+        self.results = {}   # model -> list of metrics dicts
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def run_job(self, chatbot, model_name, experiment_key, question):
+        try:
+            answer, metrics = run_once(chatbot, question)
+        except Exception as ex:
+            print(f"{model_name} failed on {experiment_key}: {ex}")
+            with self.lock:
+                self.errors[model_name] = self.errors.get(model_name, 0) + 1
+            return
+
+        self.writer.submit_run(experiment_key = experiment_key, model_name = model_name, answer = answer,
+                               time = metrics["total"]/60, score = None, ttft = metrics["ttft"],
+                               tokens_per_sec = metrics["tokens_per_sec"],
+                               output_tokens = metrics["output_tokens"], prompt_tokens = metrics["prompt_tokens"],
+                               stages = metrics["stages"])
+        with self.lock:
+            self.results.setdefault(model_name, []).append(metrics)
+
+    def run(self, vector_db):
+        models = sorted({model for case in self.cases for model in case["models"]})
+        chatbots = {model: chatbot_registry.get(vector_db, model) for model in models}
+
+        # warm-up: loads the model into memory and fills connection pools, not recorded
+        first_question = self.cases[0]["questions"][0]
+        for model, chatbot in chatbots.items():
+            for _ in range(self.warmup):
+                try:
+                    run_once(chatbot, first_question)
+                except Exception as ex:
+                    print(f"Warm-up of {model} failed: {ex}")
+
+        pools = {backend: ThreadPoolExecutor(max_workers = limit, thread_name_prefix = f"bench-{backend}")
+                 for backend, limit in self.limits.items()}
+        try:
+            futures = []
+            for n, case in enumerate(self.cases):
+                for m, question in enumerate(case["questions"]):
+                    # keys sort by start time, the suffix keeps them unique within a second
+                    experiment_key = f"{new_experiment_key()} #{n:03d}.{m:03d}"
+                    self.writer.submit_experiment(experiment_key, case["url"], question)
+
+                    for model in case["models"]:
+                        for _ in range(self.repetitions):
+                            pool = pools[backend_of(model)]
+                            futures.append(pool.submit(self.run_job, chatbots[model], model, experiment_key, question))
+
+            for future in futures:
+                future.result()
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
+
+        return self.summary()
+
+    # function to compute per-model latency percentiles (seconds) and median throughput
+    def summary(self):
+        rows = []
+        for model, runs in sorted(self.results.items()):
+            totals = sorted(run["total"] for run in runs)
+            ttfts = sorted(run["ttft"] for run in runs if run["ttft"] is not None)
+            speeds = sorted(run["tokens_per_sec"] for run in runs if run["tokens_per_sec"] is not None)
+            prompts = sorted(run["prompt_tokens"] for run in runs if run["prompt_tokens"] is not None)
+            rows.append({
+                "model": model,
+                "runs": len(runs),
+                "errors": self.errors.get(model, 0),
+                "p50_s": percentile(totals, 0.5),
+                "p90_s": percentile(totals, 0.9),
+                "p99_s": percentile(totals, 0.99),
+                "ttft_p50_s": percentile(ttfts, 0.5),
+                "tokens_per_sec_p50": percentile(speeds, 0.5),
+                "prompt_tokens_p50": percentile(prompts, 0.5)
+            })
+
+        for model, errors in self.errors.items():
+            if model not in self.results:
+                rows.append({"model": model, "runs": 0, "errors": errors})
+
+        return rows
+
+def print_summary(rows):
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else format("-", ">" + spec.split(".")[0])
+
+    print(f"{'model':<12}{'runs':>6}{'errors':>8}{'p50 s':>9}{'p90 s':>9}{'p99 s':>9}{'ttft p50':>10}"
+          f"{'tok/s p50':>11}{'prompt tok':>12}")
+    for row in rows:
+        print(f"{row['model']:<12}{row['runs']:>6}{row['errors']:>8}{fmt(row.get('p50_s'), '9.2f')}"
+              f"{fmt(row.get('p90_s'), '9.2f')}{fmt(row.get('p99_s'), '9.2f')}{fmt(row.get('ttft_p50_s'), '10.2f')}"
+              f"{fmt(row.get('tokens_per_sec_p50'), '11.1f')}{fmt(row.get('prompt_tokens_p50'), '12.0f')}")
+
+def main():
+    parser = argparse.ArgumentParser(description = "Headless url x question x model benchmark")
+    parser.add_argument("suite", help = "JSONL or YAML suite of urls, questions and models")
+    parser.add_argument("--repetitions", type = int, help = "measured runs per (question, model), default 5")
+    parser.add_argument("--warmup", type = int, help = "unrecorded warm-up runs per model, default 1")
+    parser.add_argument("--limit", nargs = "*", default = [], metavar = "BACKEND=N",
+                        help = "threads (concurrent requests) per backend, e.g. ollama=2 openai=8")
+    parser.add_argument("--sink", default = None, choices = ["couchbase", "jsonl", "sqlite"],
+                        help = "result sink, default: result_sink of couch_db/config.json")
+    parser.add_argument("--output", help = "file of the jsonl / sqlite sink")
+    parser.add_argument("--index-path", default = "faiss_db")
+    parser.add_argument("--cache", default = "use", choices = CachePolicy.MODES, help = "crawl cache mode")
+    parser.add_argument("--summary-json", help = "also write the summary table as JSON (regression tracking)")
+    args = parser.parse_args()
+
+    suite, cases = load_suite(args.suite)
+    limits = {backend: int(limit) for backend, limit in (item.split("=") for item in args.limit)}
+
+    pages = crawl_pages(sorted({case["url"] for case in cases}), args.cache)
+    # waits while the streamlit app (or another runner) ingests into the same index
+    with index_lock(args.index_path):
+        ingestor = EmbeddingIngestor(index_path = args.index_path)
+        ingestor.begin()
+        for url, markdown in pages.items():
+            ingestor.add_url(url, markdown)
+    print(f"Crawled and indexed {len(pages)} page(s)")
+    for url in sorted({case["url"] for case in cases} - pages.keys()):
+        print(f"Warning: {url} could not be crawled, its questions use the rest of the index")
+
+    writer = build_writer(args.sink, args.output)
+    runner = BenchmarkRunner(cases, writer,
+                             repetitions = args.repetitions or suite.get("repetitions", 5),
+                             warmup = args.warmup if args.warmup is not None else suite.get("warmup", 1),
+                             limits = limits)
+
+    start_time = time.perf_counter()
+    rows = runner.run(ingestor.vector_db)
+    writer.close()
+    print(f"Benchmark finished in {time.perf_counter() - start_time:.1f} s")
+
+    print_summary(rows)
+    if args.summary_json:
+        with open(args.summary_json, "w", encoding = "utf-8") as file:
+            json.dump(rows, file, indent = 2)
+
+if __name__ == "__main__":
+    main()
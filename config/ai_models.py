@@ -1,25 +1,63 @@
 import json
 import os
+import copy
+import threading
 from dotenv import load_dotenv
 
+MODELS_PATH = "config/models.json"
+
+# retrieval / prompt packing defaults, overridden by the "rag" block of each model
+RAG_DEFAULTS = {
+    "context_budget": 2048,     # max prompt tokens (template + question + context)
+    "chars_per_token": 4.0,
+    "search_type": "mmr",       # "mmr" or "similarity"
+    "k": 8,
+    "fetch_k": 24,
+    "lambda_mult": 0.6,
+    "score_threshold": None,    # min cosine similarity of a retrieved chunk
+    "hybrid": True,             # BM25 + dense, fused with reciprocal rank fusion
+    "lexical_k": 20,
+    "rrf_k": 60,
+    "skip_dense_ratio": 2.0     # best/second BM25 score above which the dense pass is skipped (None: never)
+}
+
+# models.json is re-read only when the file changes
+_models_cache = {"mtime": None, "data": None}
+_models_lock = threading.Lock()
+
+def load_models():
+    with _models_lock:
+        mtime = os.path.getmtime(MODELS_PATH)
+
+        if _models_cache["mtime"] != mtime:
+            with open(MODELS_PATH) as f:
+                _models_cache["data"] = json.load(f)
+            _models_cache["mtime"] = mtime
+
+        return copy.deepcopy(_models_cache["data"])
+
+# function to get the chat client config of a model (without the "rag" settings)
 def get_model(model_name):    
-    with open("config/models.json") as f:
-        data = json.load(f)
+    data = load_models()
+    data[model_name].pop("rag", None)
 
-        if model_name == "OpenAI":
-            load_dotenv()   # load environment variables
-            api_key = os.getenv("OPENAI_CHAT_API_KEY")
+    if model_name == "OpenAI":
+        load_dotenv()   # load environment variables
+        api_key = os.getenv("OPENAI_CHAT_API_KEY")
 
-            if api_key is None:
-                raise ValueError("API key for OpenAI not found ...")
-            else:
-                data[model_name]["api_key"] = api_key
+        if api_key is None:
+            raise ValueError("API key for OpenAI not found ...")
+        else:
+            data[model_name]["api_key"] = api_key
     
     return data[model_name]
 
+def get_rag_settings(model_name):
+    data = load_models()
+    return dict(RAG_DEFAULTS, **data[model_name].get("rag", {}))
+
 def list_models():
-    with open("config/models.json") as f:
-        data = json.load(f)
+    data = load_models()
     keys_models = list(data.keys())
 
     return keys_models
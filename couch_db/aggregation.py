@@ -0,0 +1,141 @@
+import threading
+from couchbase.exceptions import CouchbaseException
+import couchbase.subdocument as SD
+from couchbase.options import MutateInOptions
+from couchbase.exceptions import CasMismatchException
+from utils.experiments import (boxplot_from_times, barplot_from_times, stage_bars_from_means, prepare_boxplot_time,
+                               prepare_barplot_time, prepare_stage_breakdown, histogram_box_stats, LLM_STAGES,
+                               TIME_BUCKET_RATIO, MIN_TIME)
+
+class BenchmarkAggregator:
+    """
+    Chart-ready benchmark numbers computed by SQL++ over the run documents (only
+    model, experiment and time are projected, never answers). Results are cached
+    per CAS of the index document, which every insert bumps, so a dashboard render
+    costs one tiny sub-document lookup until new results arrive. The queries are
+    REQUEST_PLUS, so a result cached under a CAS includes every run written before it.
+    The time boxplot reads the per-model time histograms the inserts keep in the index
+    document, so its cost does not grow with the number of runs.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.lock = threading.Lock()
+        self.cache = {}     # chart name -> (version, data)
+
+    # current data version: the CAS of the index document
+    def version(self):
+        result = self.manager.collection.lookup_in(self.manager.index_key, [SD.exists("experiments")])
+        return result.cas
+
+    def cached(self, name, compute):
+        version = self.version()
+
+        with self.lock:
+            entry = self.cache.get(name)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+
+        data = compute()
+
+        with self.lock:
+            self.cache[name] = (version, data)
+
+        return data
+
+    def compute_boxplot_time(self):
+        result = self.manager.collection.lookup_in(self.manager.index_key,
+                                                   [SD.exists("time_hist_complete"), SD.get("time_hist")])
+        if result.exists(0):
+            histograms = result.content_as[dict](1) if result.exists(1) else {}
+        else:
+            histograms = self.backfill_time_histograms(result.cas)
+
+        return boxplot_from_times(histograms, stats = histogram_box_stats)
+
+    # function to build the time histograms from the runs written before they were kept
+    # (bucketed server-side, one row per model and bucket) and store them, unless a run
+    # was inserted since cas (that insert already counted itself: the next render retries)
+    def backfill_time_histograms(self, cas):
+        rows = self.manager.query(
+            f"SELECT r.model_name, b AS bucket, COUNT(*) AS runs FROM `{self.manager.bucket}` r "
+            f"LET b = FLOOR(LN(GREATEST(r.time, {MIN_TIME})) / LN({TIME_BUCKET_RATIO})) "
+            f"WHERE r.type = 'run' AND r.time IS NUMBER AND META(r).id LIKE $prefix "
+            f"GROUP BY r.model_name, b", consistent = True)
+
+        histograms = {}
+        for row in rows:
+            histograms.setdefault(row["model_name"], {})[str(int(row["bucket"]))] = row["runs"]
+
+        try:
+            self.manager.collection.mutate_in(self.manager.index_key,
+                                              [SD.upsert("time_hist", histograms), SD.upsert("time_hist_complete", True)],
+                                              MutateInOptions(cas = cas))
+        except CasMismatchException:
+            pass
+
+        return histograms
+
+    def compute_barplot_time(self):
+        rows = self.manager.query(
+            f"SELECT r.experiment_key, r.model_name, AVG(r.time) AS time FROM `{self.manager.bucket}` r "
+            f"WHERE r.type = 'run' AND META(r).id LIKE $prefix GROUP BY r.experiment_key, r.model_name", consistent = True)
+
+        times_by_experiment = {}
+        for row in rows:
+            times_by_experiment.setdefault(row["experiment_key"], {})[row["model_name"]] = row["time"]
+
+        return barplot_from_times(times_by_experiment)
+
+    # stage sums are divided by the model's run count, so a stage some runs skip is averaged as 0
+    def compute_stage_breakdown(self):
+        # same filter as complete_stages: runs with the model stages (no cached answers)
+        conditions = " AND ".join(["r.type = 'run'", "META(r).id LIKE $prefix"]
+                                  + [f"r.stages.`{stage}` IS VALUED" for stage in LLM_STAGES])
+        rows = self.manager.query(
+            f"SELECT r.model_name, s.name AS stage, SUM(s.val) AS seconds, COUNT(*) AS runs "
+            f"FROM `{self.manager.bucket}` r UNNEST OBJECT_PAIRS(r.stages) AS s "
+            f"WHERE {conditions} GROUP BY r.model_name, s.name", consistent = True)
+
+        # every matched run has each LLM stage exactly once: its row counts the model's runs
+        # (one query, so the counts and the sums always come from the same runs)
+        runs = {row["model_name"]: row["runs"] for row in rows if row["stage"] == LLM_STAGES[0]}
+        means_by_model = {}
+        for row in rows:
+            means_by_model.setdefault(row["model_name"], {})[row["stage"]] = row["seconds"] / runs[row["model_name"]]
+
+        return stage_bars_from_means(means_by_model)
+
+    # function to get (models, observations, outliers) for the time boxplot
+    def boxplot_time(self):
+        try:
+            return self.cached("boxplot_time", self.compute_boxplot_time)
+        except CouchbaseException as ex:
+            print(f"Aggregation query failed, computing from documents: {ex}")
+            return prepare_boxplot_time(self.manager.read_documents())
+
+    # function to get (experiment keys, series) for the time barplot
+    def barplot_time(self):
+        try:
+            return self.cached("barplot_time", self.compute_barplot_time)
+        except CouchbaseException as ex:
+            print(f"Aggregation query failed, computing from documents: {ex}")
+            return prepare_barplot_time(self.manager.read_documents())
+
+    # function to get (models, series) for the stacked stage latency chart
+    def stage_breakdown(self):
+        try:
+            return self.cached("stage_breakdown", self.compute_stage_breakdown)
+        except CouchbaseException as ex:
+            print(f"Aggregation query failed, computing from documents: {ex}")
+            return prepare_stage_breakdown(self.manager.read_documents())
+
+# one aggregator (and cache) per manager, shared by every streamlit session
+_aggregators = {}
+_aggregators_lock = threading.Lock()
+
+def get_aggregator(manager):
+    with _aggregators_lock:
+        if id(manager) not in _aggregators:
+            _aggregators[id(manager)] = BenchmarkAggregator(manager)
+        return _aggregators[id(manager)]
@@ -7,6 +7,3 @@ def read_dbconfig():
     return data
 
 settings = read_dbconfig()
-
-print("config: ", settings["couchbase_config"])
-print("bench: ", settings["couchbase_bench"])
@@ -1,159 +1,494 @@
+import uuid
+import threading
+import couchbase.subdocument as SD
 from couchbase.cluster import Cluster
-from couchbase.options import ClusterOptions
+from couchbase.options import ClusterOptions, ClusterTimeoutOptions, ReplaceOptions, QueryOptions
 from couchbase.auth import PasswordAuthenticator
-from couchbase.exceptions import DocumentNotFoundException, CouchbaseException
-from datasets import Dataset
-from datetime import datetime
+from couchbase.n1ql import QueryScanConsistency
+from couchbase.exceptions import (DocumentNotFoundException, DocumentExistsException,
+                                  CasMismatchException, CouchbaseException, TimeoutException,
+                                  AmbiguousTimeoutException, UnAmbiguousTimeoutException,
+                                  ServiceUnavailableException, TemporaryFailException, RequestCanceledException)
+from datetime import datetime, timedelta
 from couch_db.config import settings
+from utils.experiments import time_bucket
+from utils.tracing import traced
+
+# fields stored in each model run document (and exposed as parallel lists per experiment)
+RUN_FIELDS = ["model_name", "answer", "time", "ttft", "tokens_per_sec", "prompt_tokens", "output_tokens", "score", "stages"]
+LAYOUT_VERSION = "per_experiment_v1"
+# errors worth retrying later (cluster slow, unreachable or busy); init_experiment and
+# insert raise them instead of reporting the write as failed
+TRANSIENT_ERRORS = (TimeoutException, AmbiguousTimeoutException, UnAmbiguousTimeoutException,
+                    ServiceUnavailableException, TemporaryFailException, RequestCanceledException)
 
 class CouchbaseExperimentManager:
+    """
+    Storage layout (keys prefixed by the configured document name):
+    - <document>::index                      {"experiments": [experiment keys], "time_hist": {model: {bucket: runs}}}
+    - <document>::<experiment_key>           {"type": "experiment", url, question, date, "runs": [run keys]}
+    - <document>::<experiment_key>::run::<id> {"type": "run", experiment_key, model_name, answer, time, ...}
+    Appends are sub-document mutations, so concurrent writers never rewrite each other's data.
+    The cluster is only opened on first use (cluster / collection access), with bounded
+    timeouts, so importing this module never blocks or fails when Couchbase is down.
+    """
+
     _instance = None
+    CAS_RETRIES = 5
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super(CouchbaseExperimentManager, cls).__new__(cls)
             cls._instance._initialized = False
         return cls._instance
-    
-    def __init__(self, host, user, password, bucket, document):
+
+    def __init__(self, host, user, password, bucket, document, connect_timeout = 5, kv_timeout = 2.5,
+                 query_timeout = 15):
         # control initialization with pattern Singleton
         if self._initialized:
             return
-        
+
         # parameters for server connection
         self.host = host
         self.user = user
         self.password = password
-        self.bucket = bucket 
+        self.bucket = bucket
         self.document = document
-        # parameters for cluster connetion
-        self.cluster = None        
-        self.collection = None
+        self.index_key = f"{document}::index"
+        self.connect_timeout = timedelta(seconds = connect_timeout)
+        self.timeouts = ClusterTimeoutOptions(connect_timeout = self.connect_timeout,
+                                              kv_timeout = timedelta(seconds = kv_timeout),
+                                              query_timeout = timedelta(seconds = query_timeout))
+        # parameters for cluster connetion (opened lazily)
+        self._cluster = None
+        self._collection = None
+        self.connect_lock = threading.Lock()
+        self.indexes_ready = False
         self._initialized = True
-        self.connect()
 
-    # function to connect with couchbase instance
+    @property
+    def cluster(self):
+        if self._cluster is None:
+            self.connect()
+        return self._cluster
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self.connect()
+        return self._collection
+
+    # function to connect with couchbase instance; a failed attempt is retried on next use
+    @traced("couchbase.connect")
     def connect(self):
+        with self.connect_lock:
+            if self._collection is not None:
+                return
+
+            try:
+                # define cluster
+                cluster = Cluster(self.host, ClusterOptions(
+                        PasswordAuthenticator(self.user, self.password), timeout_options = self.timeouts))
+                cluster.wait_until_ready(self.connect_timeout)
+                # open bucket
+                self._cluster = cluster
+                self._collection = cluster.bucket(self.bucket).default_collection()
+                # initialize document
+                self.init_document()
+                print("Connection with Couchbase is successfully!")
+
+            except CouchbaseException as ex:
+                self._cluster = None
+                self._collection = None
+                print(f"Failure in connection with couchbase: {ex}")
+                raise
+
+    # function to check (connecting if needed) that couchbase can be reached
+    def available(self):
         try:
-            # define cluster
-            self.cluster = Cluster(self.host, ClusterOptions(
-                    PasswordAuthenticator(self.user, self.password)))            
-            # open bucket 
-            bucket = self.cluster.bucket(self.bucket)
-            self.collection = bucket.default_collection()
-            # initialize document
-            self.init_document()
-            print("Connection with Couchbase is successfully!")
+            return self.collection is not None
+        except CouchbaseException:
+            return False
 
-        except CouchbaseException as ex:
-            print(f"Failure in connection with couchbase: {ex}")
-            raise
+    def experiment_doc_key(self, experiment_key):
+        return f"{self.document}::{experiment_key}"
+
+    def run_doc_key(self, experiment_key, run_id):
+        return f"{self.document}::{experiment_key}::run::{run_id}"
 
-    # function to initialize document
+    # function to initialize the index document and migrate the legacy single document
     def init_document(self):
         try:
-            doc = self.collection.get(self.document)
-            data = doc.content_as[dict]
+            self.collection.insert(self.index_key, {"layout": LAYOUT_VERSION, "experiments": []})
+            print(f"Document '{self.index_key}' created successfully.")
+        except DocumentExistsException:
+            pass
+        except CouchbaseException as ex:
+            print(f"Error initializing index document: {ex}")
 
-            if not isinstance(data, dict):
-                data = {}
-                self.collectio.upsert(self.document, data)
+        self.migrate_legacy_document()
 
-        except DocumentNotFoundException:
-            self.collection.upsert(self.document, {})
-            print(f"Document '{self.document}' created successfully.")
-        except CouchbaseException as ex:
-            print(f"Error initializing base document: {ex}")
+    # function to split the old {experiment_key: {...lists}} document into per-experiment documents;
+    # idempotent, and the final replace is CAS-guarded against a concurrent legacy writer
+    def migrate_legacy_document(self):
+        for _ in range(self.CAS_RETRIES):
+            try:
+                result = self.collection.get(self.document)
+            except DocumentNotFoundException:
+                return
+            except CouchbaseException as ex:
+                print(f"Error reading legacy document: {ex}")
+                return
+
+            data = result.content_as[dict]
+            if data.get("migrated_to") == LAYOUT_VERSION:
+                return
+
+            for experiment_key, experiment in sorted(data.items()):
+                if not isinstance(experiment, dict):
+                    continue
+
+                n_runs = len(experiment.get("model_name", []))
+                run_keys = []
+                for i in range(n_runs):
+                    # fields added later (ttft, ...) may be shorter or missing in old experiments
+                    run = {field: (experiment.get(field) or [])[i] if i < len(experiment.get(field) or []) else None
+                           for field in RUN_FIELDS}
+                    run_key = self.run_doc_key(experiment_key, f"legacy{i:04d}")
+                    self.collection.upsert(run_key, dict(run, type = "run", experiment_key = experiment_key,
+                                                         date = experiment.get("date")))
+                    run_keys.append(run_key)
 
-    # function to initialize experiment
-    def init_experiment(self, url, question):
+                self.collection.upsert(self.experiment_doc_key(experiment_key), {
+                    "type": "experiment",
+                    "experiment_key": experiment_key,
+                    "url": experiment.get("url"),
+                    "question": experiment.get("question"),
+                    "date": experiment.get("date"),
+                    "runs": run_keys
+                })
+                self.collection.mutate_in(self.index_key, [SD.array_addunique("experiments", experiment_key)])
+
+            try:
+                self.collection.replace(self.document, {"migrated_to": LAYOUT_VERSION},
+                                        ReplaceOptions(cas = result.cas))
+                print(f"Legacy document '{self.document}' migrated to {LAYOUT_VERSION}.")
+                return
+            except CasMismatchException:
+                # the legacy document changed while migrating: migrate again
+                continue
+
+        print(f"Migration of '{self.document}' gave up after {self.CAS_RETRIES} CAS conflicts")
+
+    # function to initialize experiment; a caller-provided experiment_key (replayed
+    # by the background writer) makes the call idempotent
+    @traced("couchbase.init_experiment")
+    def init_experiment(self, url, question, experiment_key = None):
         try:
-            # generation of timestamp for the experiment key            
+            # generation of timestamp for the experiment key
             current_time = datetime.now()
             timestamp = current_time.strftime("%Y-%m-%d %H:%M:%S")
-            experiment_key = f"experiment_{timestamp}"
 
-            # get base document
-            doc = self.collection.get(self.document)
-            data = doc.content_as[dict]
+            if experiment_key is not None:
+                return self.ensure_experiment(experiment_key, url, question, timestamp)
+
+            experiment_key = f"experiment_{timestamp}"
 
             default_data = {
+                "type": "experiment",
+                "experiment_key": experiment_key,
                 "url": url,
                 "question": question,
                 "date": timestamp,
-                "model_name": [],
-                "answer": [],
-                "time": [],
-                "score": []
+                "runs": []
             }
 
-            data[experiment_key] = default_data
-            self.collection.upsert(self.document, data)
+            # insert (not upsert): an experiment created in the same second is never overwritten
+            for attempt in range(self.CAS_RETRIES):
+                try:
+                    self.collection.insert(self.experiment_doc_key(experiment_key), default_data)
+                    break
+                except DocumentExistsException:
+                    experiment_key = f"experiment_{timestamp}_{attempt + 1}"
+                    default_data["experiment_key"] = experiment_key
+            else:
+                print(f"Failure in initializing experiment: key {experiment_key} already exists")
+                return None
+
+            self.collection.mutate_in(self.index_key, [SD.array_append("experiments", experiment_key)])
             print(f"Experiment initialized with key: {experiment_key}")
 
             return experiment_key
 
+        except TRANSIENT_ERRORS:
+            raise
+
         except CouchbaseException as ex:
             print(f"Failure in initializing experiment: {ex}")
             return None
 
-    # function to insert details of experiment for each model
-    def insert(self, experiment_key, model_name, answer, time, score):
+    # function to create an experiment with a known key, keeping it if it already exists (a
+    # replay); an existing experiment with another url / question is a key collision: refused
+    def ensure_experiment(self, experiment_key, url, question, timestamp):
+        # keys are "experiment_<YYYY-mm-dd HH:MM:SS>_<suffix>": the date is the start time
+        date = experiment_key[len("experiment_"):len("experiment_") + 19] or timestamp
         try:
-            doc = self.collection.get(self.document)
-            data = doc.content_as[dict]
+            self.collection.insert(self.experiment_doc_key(experiment_key), {
+                "type": "experiment",
+                "experiment_key": experiment_key,
+                "url": url,
+                "question": question,
+                "date": date,
+                "runs": []
+            })
+        except DocumentExistsException:
+            existing = self.collection.get(self.experiment_doc_key(experiment_key)).content_as[dict]
+            if (existing.get("url"), existing.get("question")) != (url, question):
+                print(f"Failure in initializing experiment: key {experiment_key} is taken by another experiment")
+                return None
+
+        self.collection.mutate_in(self.index_key, [SD.array_addunique("experiments", experiment_key)])
+        return experiment_key
 
-            # check if document exists
-            if experiment_key not in data:
-                print(f"Experiment {experiment_key} does not found!")
-                return False
+    # function to insert details of experiment for each model; a caller-provided
+    # run_id makes re-delivery of the same run overwrite instead of duplicating
+    @traced("couchbase.insert")
+    def insert(self, experiment_key, model_name, answer, time, score, ttft = None, tokens_per_sec = None,
+               output_tokens = None, prompt_tokens = None, stages = None, run_id = None, date = None):
+        try:
+            run_key = self.run_doc_key(experiment_key, run_id or uuid.uuid4().hex[:12])
+            run = {
+                "type": "run",
+                "experiment_key": experiment_key,
+                "date": date or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "model_name": str(model_name),
+                "answer": str(answer),
+                "time": float(time),
+                "ttft": float(ttft) if ttft is not None else None,
+                "tokens_per_sec": float(tokens_per_sec) if tokens_per_sec is not None else None,
+                "prompt_tokens": int(prompt_tokens) if prompt_tokens is not None else None,
+                "output_tokens": float(output_tokens) if output_tokens is not None else None,
+                "score": float(score) if score is not None else None,
+                # per-stage latency breakdown in seconds (retrieval, packing, llm prefill / decode)
+                "stages": {str(stage): float(seconds) for stage, seconds in stages.items()} if stages else None
+            }
 
-            data[experiment_key]["model_name"].append(str(model_name))
-            data[experiment_key]["answer"].append(str(answer))
-            data[experiment_key]["time"].append(float(time))
-            data[experiment_key]["score"].append(float(score) if score is not None else None)
+            # link the run first: a missing experiment fails here without leaving an orphan run
+            if run_id is None:
+                self.collection.mutate_in(self.experiment_doc_key(experiment_key), [SD.array_append("runs", run_key)])
+                self.collection.upsert(run_key, run)
+                new_run = True
+            else:
+                self.collection.mutate_in(self.experiment_doc_key(experiment_key), [SD.array_addunique("runs", run_key)])
+                # a replayed write rewrites its run without counting it twice
+                try:
+                    self.collection.insert(run_key, run)
+                    new_run = True
+                except DocumentExistsException:
+                    self.collection.upsert(run_key, run)
+                    new_run = False
 
-            # save the document in the collection
-            self.collection.upsert(self.document, data)
+            # bump the index document CAS (invalidates cached aggregations) and count the
+            # run in the time histogram of its model, in one atomic sub-document mutation
+            specs = [SD.increment("runs_version", 1)]
+            if new_run:
+                specs.append(SD.increment(self.time_bucket_path(run["model_name"], run["time"]), 1,
+                                          create_parents = True))
+            self.collection.mutate_in(self.index_key, specs)
             inserted = True
-            print(f"Data inserted successfully into {experiment_key}!")        
+            print(f"Data inserted successfully into {experiment_key}!")
+
+        except DocumentNotFoundException:
+            inserted = False
+            print(f"Experiment {experiment_key} does not found!")
+
+        except TRANSIENT_ERRORS:
+            raise
 
         except CouchbaseException as ex:
             inserted = False
             print(f"Error in insert the data into {experiment_key}: {ex}")
 
         return inserted
-    
-    # function to read couchbase collection
+
+    # function to get the index document path counting the runs of a model in a time bucket
+    @staticmethod
+    def time_bucket_path(model_name, time):
+        model_name = model_name.replace("`", "``")
+        return f"time_hist.`{model_name}`.`{time_bucket(time)}`"
+
+    # function to fetch several documents at once, skipping missing ones
+    @traced("couchbase.get_many")
+    def get_many(self, keys):
+        if not keys:
+            return {}
+
+        result = self.collection.get_multi(keys)
+        return {key: res.content_as[dict] for key, res in result.results.items()}
+
+    # function to rebuild the legacy experiment shape {url, question, date, <field>: [...]}
+    def assemble_experiment(self, experiment, runs):
+        data = {
+            "url": experiment.get("url"),
+            "question": experiment.get("question"),
+            "date": experiment.get("date")
+        }
+        ordered_runs = [runs[key] for key in experiment.get("runs", []) if key in runs]
+        for field in RUN_FIELDS:
+            data[field] = [run.get(field) for run in ordered_runs]
+
+        return data
+
+    # function to read one experiment in the legacy shape
+    @traced("couchbase.read_experiment")
+    def read_experiment(self, experiment_key):
+        try:
+            experiment = self.collection.get(self.experiment_doc_key(experiment_key)).content_as[dict]
+            runs = self.get_many(experiment.get("runs", []))
+            return self.assemble_experiment(experiment, runs)
+        except DocumentNotFoundException:
+            return None
+
+    def list_experiment_keys(self):
+        index = self.collection.get(self.index_key).content_as[dict]
+        return sorted(index.get("experiments", []))
+
+    # function to read couchbase collection as {experiment_key: experiment}
     def read_documents(self):
         try:
-            # read data
-            result = self.collection.get(self.document)
-            # generate structure of dictionary
-            data = result.content_as[dict]
-            # convert couchbase data to python dataset
-            #dataset = Dataset.from_dict(data)
+            experiment_keys = self.list_experiment_keys()
+            experiments = self.get_many([self.experiment_doc_key(key) for key in experiment_keys])
+            run_keys = [run_key for experiment in experiments.values() for run_key in experiment.get("runs", [])]
+            runs = self.get_many(run_keys)
+
+            data = {}
+            for experiment_key in experiment_keys:
+                experiment = experiments.get(self.experiment_doc_key(experiment_key))
+                if experiment is not None:
+                    data[experiment_key] = self.assemble_experiment(experiment, runs)
 
             return data
-        
+
         except CouchbaseException as ex:
             print(f"Error to read couchbase document: {ex}")
             return None
 
+    # function to create the secondary indexes used by the reports and benchmark queries
+    def ensure_indexes(self):
+        if self.indexes_ready:
+            return
+
+        statements = [
+            f"CREATE INDEX IF NOT EXISTS idx_experiments ON `{self.bucket}`(type, experiment_key, date, url) "
+            f"WHERE type = 'experiment'",
+            f"CREATE INDEX IF NOT EXISTS idx_runs ON `{self.bucket}`(type, experiment_key, date, model_name, time) "
+            f"WHERE type = 'run'"
+        ]
+        for statement in statements:
+            self.cluster.query(statement).execute()
+        self.indexes_ready = True
+
+    # function to run a SQL++ query over this document's keys; consistent = True waits
+    # for the index to include every mutation made before the query (REQUEST_PLUS)
+    @traced("couchbase.query")
+    def query(self, statement, consistent = False, **params):
+        self.ensure_indexes()
+        params["prefix"] = f"{self.document}::%"
+        options = QueryOptions(named_parameters = params)
+        if consistent:
+            options = QueryOptions(named_parameters = params, scan_consistency = QueryScanConsistency.REQUEST_PLUS)
+        return list(self.cluster.query(statement, options).rows())
+
+    # function to page through experiments newest first with keyset pagination: pass the
+    # last experiment_key of the previous page as before_key; answers are never fetched
+    def query_experiments(self, limit = 10, before_key = None, date_from = None, date_to = None,
+                          model_name = None, url = None):
+        conditions = ["e.type = 'experiment'", "META(e).id LIKE $prefix"]
+        params = {"limit": limit}
+
+        if before_key:
+            conditions.append("e.experiment_key < $before_key")
+            params["before_key"] = before_key
+        if date_from:
+            conditions.append("e.date >= $date_from")
+            params["date_from"] = date_from
+        if date_to:
+            conditions.append("e.date <= $date_to")
+            params["date_to"] = date_to
+        if url:
+            conditions.append("CONTAINS(e.url, $url)")
+            params["url"] = url
+        if model_name:
+            conditions.append(f"e.experiment_key IN (SELECT RAW r.experiment_key FROM `{self.bucket}` r "
+                              f"WHERE r.type = 'run' AND META(r).id LIKE $prefix AND r.model_name = $model_name)")
+            params["model_name"] = model_name
+
+        try:
+            return self.query(
+                f"SELECT e.experiment_key, e.url, e.question, e.date, ARRAY_LENGTH(e.runs) AS n_runs "
+                f"FROM `{self.bucket}` e WHERE {' AND '.join(conditions)} "
+                f"ORDER BY e.experiment_key DESC LIMIT $limit", **params)
+        except CouchbaseException as ex:
+            print(f"Error querying experiments: {ex}")
+            return []
+
+    # function to read one page of runs of an experiment, projecting everything but the answer
+    def query_runs(self, experiment_key, limit = 5, offset = 0, model_name = None):
+        conditions = ["r.type = 'run'", "META(r).id LIKE $prefix", "r.experiment_key = $experiment_key"]
+        params = {"experiment_key": experiment_key, "limit": limit, "offset": offset}
+
+        if model_name:
+            conditions.append("r.model_name = $model_name")
+            params["model_name"] = model_name
+
+        try:
+            return self.query(
+                f"SELECT META(r).id AS run_key, r.model_name, r.time, r.ttft, r.tokens_per_sec, r.prompt_tokens, r.score "
+                f"FROM `{self.bucket}` r WHERE {' AND '.join(conditions)} "
+                f"ORDER BY r.date, META(r).id LIMIT $limit OFFSET $offset", **params)
+        except CouchbaseException as ex:
+            print(f"Error querying runs of {experiment_key}: {ex}")
+            return []
+
+    # function to count the runs of an experiment without reading them (of one model
+    # with model_name, counted by SQL++ like the rows query_runs pages through)
+    def count_runs(self, experiment_key, model_name = None):
+        try:
+            if model_name:
+                rows = self.query(
+                    f"SELECT RAW COUNT(*) FROM `{self.bucket}` r WHERE r.type = 'run' AND META(r).id LIKE $prefix "
+                    f"AND r.experiment_key = $experiment_key AND r.model_name = $model_name",
+                    experiment_key = experiment_key, model_name = model_name)
+                return rows[0] if rows else 0
+
+            result = self.collection.lookup_in(self.experiment_doc_key(experiment_key), [SD.count("runs")])
+            return result.content_as[int](0)
+        except CouchbaseException:
+            return 0
+
+    # function to fetch only the answer of one run (when its row is opened)
+    @traced("couchbase.read_answer")
+    def read_answer(self, run_key):
+        try:
+            result = self.collection.lookup_in(run_key, [SD.get("answer")])
+            return result.content_as[str](0)
+        except CouchbaseException as ex:
+            print(f"Error reading answer of {run_key}: {ex}")
+            return None
+
     # function to read the last document
     def read_last_document(self):
         try:
-            # Read the base document
-            result = self.collection.get(self.document)
-            data = result.content_as[dict]
-            # Get the last experiment key (assuming sorted by timestamp)
-            if data:
-                last_key = sorted(data.keys())[-1]
-                return Dataset.from_dict(data[last_key])
+            experiment_keys = self.list_experiment_keys()
+            # Get the last experiment key (sorted by timestamp)
+            if experiment_keys:
+                from datasets import Dataset    # heavy, only needed here
+                data = self.read_experiment(experiment_keys[-1])
+                return Dataset.from_dict(data) if data is not None else None
             return None
         except CouchbaseException as ex:
             print(f"Error reading last experiment: {ex}")
             return None
 
-# settings for couchbase connection
+# settings for couchbase connection (nothing is opened until the first read or write)
 couchbase_data = CouchbaseExperimentManager(**settings["couchbase_bench"])
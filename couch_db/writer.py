@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+from couch_db.config import settings
+
+# Sinks' write_batch raises when the whole batch should be retried later (backend
+# unreachable, timeouts) and returns [(record, reason)] for the records the backend
+# will never accept, which the writer moves to a dead-letter file instead of retrying.
+
+class CouchbaseSink:
+    """
+    Writes result records through CouchbaseExperimentManager. Records carry their
+    own ids, so a replayed record overwrites instead of duplicating. Timeouts and an
+    unreachable cluster are raised (retried); a refused record (missing experiment,
+    key collision, invalid value) is returned as rejected.
+    """
+
+    def __init__(self, manager = None):
+        self.manager = manager
+
+    def write_batch(self, records):
+        from couch_db.couchdb2 import TRANSIENT_ERRORS
+        if self.manager is None:
+            from couch_db.couchdb2 import couchbase_data
+            self.manager = couchbase_data
+
+        if not self.manager.available():
+            raise ConnectionError("Couchbase is not reachable")
+
+        rejected = []
+        for record in records:
+            try:
+                if record["kind"] == "experiment":
+                    ok = self.manager.init_experiment(record["url"], record["question"],
+                                                      experiment_key = record["experiment_key"]) is not None
+                else:
+                    fields = {key: value for key, value in record.items() if key not in ("kind", "id")}
+                    ok = self.manager.insert(run_id = record["id"], **fields)
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as ex:
+                rejected.append((record, f"{type(ex).__name__}: {ex}"))
+                continue
+
+            if not ok:
+                rejected.append((record, "rejected by Couchbase"))
+
+        return rejected
+
+class JsonlSink:
+    """
+    Local stand-in backend: appends every record to a JSON lines file.
+    """
+
+    def __init__(self, path = "history/results.jsonl"):
+        self.path = path
+
+    def write_batch(self, records):
+        with open(self.path, "a", encoding = "utf-8") as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+
+        return []
+
+class SqliteSink:
+    """
+    Local stand-in backend: experiments and runs tables in a SQLite file,
+    keyed by record id so replays are idempotent.
+    """
+
+    RUN_COLUMNS = ["experiment_key", "model_name", "answer", "time", "ttft",
+                   "tokens_per_sec", "output_tokens", "score", "prompt_tokens", "stages"]
+
+    def __init__(self, path = "history/results.db"):
+        self.path = path
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS experiments "
+                         "(experiment_key TEXT PRIMARY KEY, url TEXT, question TEXT, date TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS runs (id TEXT PRIMARY KEY, date TEXT, "
+                         + ", ".join(self.RUN_COLUMNS) + ")")
+            # columns added after the table was created
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(runs)")}
+            for column in self.RUN_COLUMNS:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE runs ADD COLUMN {column}")
+
+    # a locked or full database (OperationalError) is retried, a record with values
+    # sqlite cannot store is rejected
+    def write_batch(self, records):
+        rejected = []
+        with sqlite3.connect(self.path) as conn:
+            for record in records:
+                try:
+                    if record["kind"] == "experiment":
+                        conn.execute("INSERT OR REPLACE INTO experiments VALUES (?, ?, ?, ?)",
+                                     (record["experiment_key"], record["url"], record["question"], record["date"]))
+                    else:
+                        columns = ["id", "date"] + self.RUN_COLUMNS
+                        # nested values (the stage breakdown) are stored as JSON text
+                        values = [record["id"], record["date"]] + [
+                            json.dumps(record.get(column)) if isinstance(record.get(column), dict) else record.get(column)
+                            for column in self.RUN_COLUMNS]
+                        conn.execute(f"INSERT OR REPLACE INTO runs ({', '.join(columns)}) "
+                                     f"VALUES ({', '.join('?' * len(values))})", values)
+                except (KeyError, sqlite3.InterfaceError, sqlite3.IntegrityError, sqlite3.ProgrammingError) as ex:
+                    rejected.append((record, f"{type(ex).__name__}: {ex}"))
+
+        return rejected
+
+class ResultWriter:
+    """
+    Background writer for benchmark results: records are appended to a local
+    write-ahead log, queued, and flushed to the sink in batches (on batch_size or
+    flush_interval). A batch the sink cannot write (outage, timeout) stays
+    unacknowledged in the WAL and is retried with capped backoff until it is written;
+    unacknowledged records are replayed at startup, so delivery is at-least-once however
+    long the sink is down and a sink outage never blocks the caller. Records the sink
+    refuses for good go to the rejected file (<wal>_rejected.jsonl, with the reason) and
+    are acknowledged, so they never hold back later results.
+    """
+
+    def __init__(self, sink, wal_path = "history/results_wal.jsonl", batch_size = 20,
+                 flush_interval = 2.0, max_backoff = 60):
+        self.sink = sink
+        self.wal_path = wal_path
+        # dead-letter file of earlier versions, which gave up on a batch after a few attempts
+        self.dead_path = wal_path.replace(".jsonl", "_dead.jsonl")
+        self.rejected_path = wal_path.replace(".jsonl", "_rejected.jsonl")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+
+        self.queue = queue.Queue()
+        self.wal_lock = threading.RLock()
+        self.unacked = 0
+        self.stopped = threading.Event()
+
+        for record in self.replay_wal():
+            self.queue.put(record)
+        self.replay_dead_letters()
+
+        self.thread = threading.Thread(target = self.run, name = "result-writer", daemon = True)
+        self.thread.start()
+
+    # function to read the records that were logged but never acknowledged
+    def replay_wal(self):
+        if not os.path.exists(self.wal_path):
+            return []
+
+        pending = {}
+        with open(self.wal_path, "r", encoding = "utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue    # torn last line after a crash
+                if entry["op"] == "put":
+                    pending[entry["record"]["id"]] = entry["record"]
+                else:
+                    pending.pop(entry["id"], None)
+
+        self.unacked = len(pending)
+        return list(pending.values())
+
+    # function to give records of an old dead-letter file back to the WAL and the queue
+    def replay_dead_letters(self):
+        if not os.path.exists(self.dead_path):
+            return
+
+        records = []
+        with open(self.dead_path, "r", encoding = "utf-8") as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+
+        with self.wal_lock:
+            self.log([{"op": "put", "record": record} for record in records])
+            self.unacked += len(records)
+        for record in records:
+            self.queue.put(record)
+        os.remove(self.dead_path)
+
+    def log(self, entries):
+        with self.wal_lock:
+            with open(self.wal_path, "a", encoding = "utf-8") as file:
+                for entry in entries:
+                    file.write(json.dumps(entry) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+
+    # function to enqueue a record, returns its id once it is safe in the WAL
+    def submit(self, record):
+        record = dict(record)
+        record.setdefault("id", uuid.uuid4().hex)
+        record.setdefault("date", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+        # logged and counted atomically, so compaction can never truncate it away
+        with self.wal_lock:
+            self.log([{"op": "put", "record": record}])
+            self.unacked += 1
+        self.queue.put(record)
+
+        return record["id"]
+
+    def submit_experiment(self, experiment_key, url, question):
+        return self.submit({"kind": "experiment", "experiment_key": experiment_key,
+                            "url": url, "question": question})
+
+    def submit_run(self, experiment_key, model_name, answer, time, score = None, **metrics):
+        return self.submit(dict(metrics, kind = "run", experiment_key = experiment_key,
+                                model_name = model_name, answer = answer, time = time, score = score))
+
+    # function to collect up to batch_size records, waiting at most flush_interval
+    def next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout = timeout))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def run(self):
+        batch, failures = [], 0
+
+        while True:
+            if not batch:
+                if self.stopped.is_set() and self.queue.empty():
+                    break
+                batch = self.next_batch()
+                if not batch:
+                    continue
+
+            if self.deliver(batch):
+                batch, failures = [], 0
+                continue
+
+            # the same batch is retried (keeping experiments ahead of their runs); on
+            # close it is left unacknowledged in the WAL and replayed at the next start
+            failures += 1
+            if self.stopped.wait(min(2 ** failures, self.max_backoff)):
+                break
+
+    # function to write one batch, acknowledging it in the WAL only once the sink accepted it
+    # (or rejected some records for good, which are kept in the rejected file)
+    def deliver(self, batch):
+        try:
+            rejected = self.sink.write_batch(batch) or []
+        except Exception as ex:
+            print(f"Result writer: batch of {len(batch)} failed, will retry: {ex}")
+            return False
+
+        if rejected:
+            self.reject(rejected)
+        self.log([{"op": "ack", "id": record["id"]} for record in batch])
+        self.compact(len(batch))
+        return True
+
+    # function to keep records the sink refused for good, for inspection / manual replay
+    def reject(self, rejected):
+        date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with open(self.rejected_path, "a", encoding = "utf-8") as file:
+            for record, reason in rejected:
+                print(f"Result writer: record {record['id']} rejected: {reason}")
+                file.write(json.dumps({"record": record, "reason": reason, "date": date}) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    # function to truncate the WAL once every logged record is acknowledged
+    def compact(self, n_acked):
+        with self.wal_lock:
+            self.unacked -= n_acked
+            if self.unacked <= 0 and self.queue.empty():
+                open(self.wal_path, "w").close()
+                self.unacked = 0
+
+    # function to stop the writer after draining the queue
+    def close(self, timeout = 30):
+        self.stopped.set()
+        self.thread.join(timeout = timeout)
+
+# function to build the sink configured in couch_db/config.json ("result_sink")
+def build_sink(kind = None):
+    kind = kind or settings.get("result_sink", {}).get("backend", "couchbase")
+
+    if kind == "couchbase":
+        return CouchbaseSink()
+    if kind == "jsonl":
+        return JsonlSink(settings.get("result_sink", {}).get("path", "history/results.jsonl"))
+    if kind == "sqlite":
+        return SqliteSink(settings.get("result_sink", {}).get("path", "history/results.db"))
+
+    raise ValueError(f"Unknown result sink '{kind}'")
+
+# one writer per process, created on first use
+_result_writer = None
+_result_writer_lock = threading.Lock()
+
+def get_result_writer():
+    global _result_writer
+
+    with _result_writer_lock:
+        if _result_writer is None:
+            _result_writer = ResultWriter(build_sink())
+        return _result_writer
+
+# keys sort by start time; the random suffix keeps experiments started in the same second apart
+def new_experiment_key():
+    return f"experiment_{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}_{uuid.uuid4().hex[:8]}"
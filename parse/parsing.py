@@ -30,4 +30,65 @@ class LLMParser:
         main_text = self.THINK_PATTERN.sub("", text).strip()
         
         return main_text, think_text
-    
\ No newline at end of file
+    
+
+class StreamingLLMParser:
+    """
+    Incremental version of LLMParser for streamed answers: feed() takes each new
+    chunk and returns (main_delta, think_delta), holding back a possible partial tag.
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self.in_think = False
+        self.pending = ""
+        self.main_text = ""
+        self.think_text = ""
+
+    def feed(self, chunk: str):
+        text = self.pending + (chunk or "")
+        self.pending = ""
+        main_delta, think_delta = "", ""
+
+        while text:
+            tag = self.CLOSE_TAG if self.in_think else self.OPEN_TAG
+            idx = text.lower().find(tag)
+
+            if idx >= 0:
+                before, text = text[:idx], text[idx + len(tag):]
+                self.in_think = not self.in_think
+            else:
+                # keep a suffix that could be the start of the tag for the next chunk
+                keep = self.partial_tag_length(text, tag)
+                before, self.pending = text[:len(text) - keep], text[len(text) - keep:]
+                text = ""
+
+            # the tag that was just toggled tells where "before" belongs
+            in_think_before = (not self.in_think) if idx >= 0 else self.in_think
+            if in_think_before:
+                think_delta += before
+            else:
+                main_delta += before
+
+        self.main_text += main_delta
+        self.think_text += think_delta
+
+        return main_delta, think_delta
+
+    def flush(self):
+        rest, self.pending = self.pending, ""
+        if self.in_think:
+            self.think_text += rest
+            return "", rest
+        self.main_text += rest
+        return rest, ""
+
+    @staticmethod
+    def partial_tag_length(text, tag):
+        lowered = text.lower()
+        for size in range(min(len(tag) - 1, len(text)), 0, -1):
+            if tag.startswith(lowered[-size:]):
+                return size
+        return 0
@@ -1,18 +1,125 @@
+import time
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
 from langchain_ollama import ChatOllama
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
 from langchain.chains import RetrievalQA
-from config.ai_models import get_model
+from config.ai_models import get_model, get_rag_settings
+from rag.context import ContextPacker, PackedRetriever, retrieve_candidates
+from rag.index_store import lexical_index_of, indexed_ids
+from utils.tracing import Trace, span
+
+# default concurrency per backend: the single local ollama server is not oversubscribed
+BACKEND_LIMITS = {"ollama": 1, "openai": 4}
+
+def backend_of(model_name):
+    return "openai" if model_name == "OpenAI" else "ollama"
+
+def config_hash(model_config):
+    encoded = json.dumps(model_config, sort_keys = True, default = str).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()[:12]
+
+# function to fingerprint the content of a vector store (its chunk ids are content hashes),
+# hashed once per id set: indexed_ids returns the same set until an ingest changes the store
+def index_fingerprint(vector_db):
+    ids = indexed_ids(vector_db)
+    cached = getattr(vector_db, "_fingerprint", None)
+    if cached is None or cached[0] is not ids:
+        cached = (ids, hashlib.sha1("\n".join(sorted(ids)).encode("utf-8")).hexdigest()[:16])
+        vector_db._fingerprint = cached
+
+    return cached[1]
+
+class AnswerCache:
+    """
+    Process-wide answer cache keyed on (index fingerprint, model config, question).
+    Exact hits match the normalized question; with similarity_threshold set, a
+    question whose embedding has cosine similarity >= threshold with a cached one
+    is also served. Entries expire after ttl seconds, LRU beyond max_entries.
+    """
+
+    def __init__(self, max_entries = 512, ttl = 3600, similarity_threshold = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()    # key -> (created, scope, unit embedding, answer)
+
+    @staticmethod
+    def normalize(question):
+        return " ".join(question.lower().split())
+
+    def key(self, scope, question):
+        return (scope, hashlib.sha1(self.normalize(question).encode("utf-8")).hexdigest())
+
+    def expired(self, created):
+        return time.time() - created > self.ttl
+
+    def get(self, scope, question, embedding = None):
+        key = self.key(scope, question)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and not self.expired(entry[0]):
+                self.entries.move_to_end(key)
+                return entry[3]
+
+            if self.similarity_threshold is None or embedding is None:
+                return None
+
+            # semantic hit: best cosine similarity among live entries of the same scope
+            best_key, best_score = None, self.similarity_threshold
+            for other_key, (created, other_scope, other_embedding, _) in self.entries.items():
+                if other_scope != scope or other_embedding is None or self.expired(created):
+                    continue
+                score = float(np.dot(embedding, other_embedding))
+                if score >= best_score:
+                    best_key, best_score = other_key, score
+
+            if best_key is None:
+                return None
+            self.entries.move_to_end(best_key)
+            return self.entries[best_key][3]
+
+    def put(self, scope, question, answer, embedding = None):
+        with self.lock:
+            self.entries[self.key(scope, question)] = (time.time(), scope, embedding, answer)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last = False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+answer_cache = AnswerCache()
+
+# function to build the chat client of a model from its config
+def build_llm(model_name, model_config, keep_alive = None):
+    if model_name == "OpenAI":
+        # stream_usage: report output token counts on streamed answers
+        return ChatOpenAI(**model_config, stream_usage = True)
+
+    if keep_alive is not None:
+        model_config = dict(model_config, keep_alive = keep_alive)
+
+    return ChatOllama(**model_config)
 
 class ChatBot:
-    def __init__(self, vector_db, model_name):
+    def __init__(self, vector_db, model_name, llm = None, model_config = None, cache = None, rag_settings = None):
         self.db = vector_db
-        model_config = get_model(model_name)
-        
-        if model_name == "OpenAI":
-            self.llm = ChatOpenAI(**model_config)
-        else:
-            self.llm = ChatOllama(**model_config)
+        self.model_name = model_name
+        self.model_config = model_config or get_model(model_name)
+        # retrieval and prompt budget of this model (config/models.json "rag")
+        self.rag = rag_settings or get_rag_settings(model_name)
+        self.packer = ContextPacker(self.rag["context_budget"], self.rag["chars_per_token"])
+        self.lexical = lexical_index_of(self.db)
+        self.llm = llm or build_llm(model_name, self.model_config)
+        self.cache = cache or answer_cache
         
         self.prompt_template = """
             You are an AI assistant tasked with answering questions based solely
@@ -28,21 +135,197 @@ class ChatBot:
         self.chain = self.build_chain()
     
     def build_chain(self):
-        prompt = PromptTemplate(template = self.prompt_template,
-                                input_variables = ["context", "question"])
-        retriever = self.db.as_retriever(search_kwargs = {"k": 5})
+        self.prompt = PromptTemplate(template = self.prompt_template,
+                                     input_variables = ["context", "question"])
+        self.retriever = PackedRetriever(retrieve_fn = self.retrieve)
 
         chain = RetrievalQA.from_chain_type(
             llm = self.llm,
             chain_type = "stuff",
-            retriever = retriever,
+            retriever = self.retriever,
             return_source_documents = True,
-            chain_type_kwargs = {"prompt": prompt},
+            chain_type_kwargs = {"prompt": self.prompt},
             verbose = True
         )
 
         return chain
 
-    def qa(self, question):
+    # cache scope and (only for semantic lookups) unit-normalized question embedding
+    def cache_lookup_args(self, question):
+        scope = (index_fingerprint(self.db), self.model_name, config_hash(dict(self.model_config, rag = self.rag)))
+        embedding = None
+
+        if self.cache.similarity_threshold is not None and self.db.embeddings is not None:
+            vector = np.asarray(self.db.embeddings.embed_query(question), dtype = np.float32)
+            embedding = vector / (np.linalg.norm(vector) or 1.0)
+
+        return scope, embedding
+
+    # function to answer a question; the answer cache is opt-in (use_cache = True), like
+    # stream_qa, so timing callers never get a cached answer by default
+    def qa(self, question, use_cache = False):
+        if use_cache:
+            scope, embedding = self.cache_lookup_args(question)
+            cached = self.cache.get(scope, question, embedding)
+            if cached is not None:
+                return cached
+
         response = self.chain.invoke(question)
-        return response["result"]
\ No newline at end of file
+
+        if use_cache:
+            self.cache.put(scope, question, response["result"], embedding)
+
+        return response["result"]
+
+    def retrieve_candidates(self, question):
+        return retrieve_candidates(self.db, question, self.rag, self.lexical)
+
+    # function to fit candidate chunks into the prompt budget left by template and question
+    def pack(self, question, docs):
+        with span("prompt.pack", candidates = len(docs)):
+            reserved = self.packer.count_tokens(self.prompt.format(context = "", question = question))
+            return self.packer.pack(docs, reserved)
+
+    def retrieve(self, question):
+        return self.pack(question, self.retrieve_candidates(question))
+
+    # function to fill the prompt the same way the "stuff" chain does
+    def format_prompt(self, question, docs):
+        context = "\n\n".join(doc.page_content for doc in docs)
+        return self.prompt.format(context = context, question = question)
+
+    # function to stream the answer token by token; metrics is filled with ttft,
+    # total latency (seconds), prompt and output tokens, decode tokens/sec and the
+    # per-stage breakdown (retrieval, packing, llm prefill / decode) when the stream ends
+    def stream_qa(self, question, metrics = None, use_cache = False):
+        metrics = metrics if metrics is not None else {}
+        start_time = time.perf_counter()
+        trace = Trace("chat.stream_qa", model = self.model_name)
+
+        if use_cache:
+            with trace.activate(), span("answer_cache.lookup"):
+                scope, embedding = self.cache_lookup_args(question)
+                cached = self.cache.get(scope, question, embedding)
+            if cached is not None:
+                elapsed = time.perf_counter() - start_time
+                metrics.update({"ttft": elapsed, "total": elapsed, "prompt_tokens": None, "output_tokens": None,
+                                "tokens_per_sec": None, "cached": True, "stages": trace.finish(cached = True)})
+                yield cached
+                return
+
+        # spans are only opened around code that does not yield
+        with trace.activate():
+            docs = self.retrieve(question)
+            with span("prompt.format"):
+                prompt_text = self.format_prompt(question, docs)
+        llm_start = time.perf_counter()
+
+        first_token_time = None
+        prompt_tokens = None
+        output_tokens = None
+        chunks = 0
+
+        answer_parts = []
+
+        for chunk in self.llm.stream(prompt_text):
+            if chunk.content:
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                chunks += 1
+                answer_parts.append(chunk.content)
+                yield chunk.content
+
+            # backends report the real token counts in the last chunk
+            usage = getattr(chunk, "usage_metadata", None)
+            if usage and usage.get("output_tokens"):
+                output_tokens = usage["output_tokens"]
+            if usage and usage.get("input_tokens"):
+                prompt_tokens = usage["input_tokens"]
+
+        end_time = time.perf_counter()
+        output_tokens = output_tokens or chunks
+        decode_time = end_time - (first_token_time or end_time)
+
+        # prefill: request until the first token (queueing + prompt processing), decode: the rest
+        trace.record("llm.prefill", llm_start, first_token_time or end_time)
+        trace.record("llm.decode", first_token_time or end_time, end_time)
+
+        metrics.update({
+            "ttft": (first_token_time - start_time) if first_token_time else None,
+            "total": end_time - start_time,
+            "prompt_tokens": prompt_tokens or self.packer.count_tokens(prompt_text),
+            "output_tokens": output_tokens,
+            "tokens_per_sec": output_tokens / decode_time if decode_time > 0 else None,
+            "cached": False,
+            "stages": trace.finish(output_tokens = output_tokens)
+        })
+
+        if use_cache:
+            self.cache.put(scope, question, "".join(answer_parts), embedding)
+
+    # function to answer with an already retrieved context; metrics gets the prompt tokens sent,
+    # and the llm.prefill / llm.decode stages are recorded on trace (same stages as stream_qa)
+    async def aqa_with_docs(self, question, docs, metrics = None, trace = None):
+        prompt_text = self.format_prompt(question, docs)
+        llm_start = time.perf_counter()
+        first_token_time = None
+        prompt_tokens = None
+        answer_parts = []
+
+        async for chunk in self.llm.astream(prompt_text):
+            if chunk.content:
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                answer_parts.append(chunk.content)
+
+            usage = getattr(chunk, "usage_metadata", None)
+            if usage and usage.get("input_tokens"):
+                prompt_tokens = usage["input_tokens"]
+
+        end_time = time.perf_counter()
+        if trace is not None:
+            trace.record("llm.prefill", llm_start, first_token_time or end_time)
+            trace.record("llm.decode", first_token_time or end_time, end_time)
+
+        if metrics is not None:
+            metrics["prompt_tokens"] = prompt_tokens or self.packer.count_tokens(prompt_text)
+
+        return "".join(answer_parts)
+
+# function to send one question to several models concurrently: candidates are
+# retrieved once, packed into each model's own budget, and each backend runs under
+# its own concurrency limit; no chatbots, no results
+async def ask_all_models(chatbots, question, limits = None):
+    if not chatbots:
+        return []
+
+    limits = dict(BACKEND_LIMITS, **(limits or {}))
+    semaphores = {backend: asyncio.Semaphore(limit) for backend, limit in limits.items()}
+
+    # every chatbot shares the same vector store: the widest retrieval serves them all
+    widest = max(chatbots.values(), key = lambda chatbot: chatbot.rag["k"])
+    retrieval = Trace("chat.retrieve_shared")
+    with retrieval.activate():
+        candidates = await asyncio.to_thread(widest.retrieve_candidates, question)
+    retrieval_stages = retrieval.finish()
+
+    async def ask(model_name, chatbot):
+        metrics = {}
+        trace = Trace("chat.ask_all_models", model = model_name)
+        async with semaphores[backend_of(model_name)]:
+            start_time = time.time()
+            try:
+                # each task runs in its own context copy, so activating the trace here is task-local
+                with trace.activate():
+                    answer = await chatbot.aqa_with_docs(question, chatbot.pack(question, candidates), metrics,
+                                                          trace = trace)
+                error = None
+            except Exception as ex:
+                answer, error = None, str(ex)
+            total_time = (time.time() - start_time)/60
+
+        return {"model_name": model_name, "answer": answer, "time": total_time, "error": error,
+                "prompt_tokens": metrics.get("prompt_tokens"),
+                "stages": dict(retrieval_stages, **trace.finish(error = error))}
+
+    return await asyncio.gather(*(ask(model_name, chatbot) for model_name, chatbot in chatbots.items()))
\ No newline at end of file
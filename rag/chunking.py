@@ -0,0 +1,113 @@
+import re
+import hashlib
+import numpy as np
+from langchain.text_splitter import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+
+HEADERS_TO_SPLIT_ON = [("#", "h1"), ("##", "h2"), ("###", "h3")]
+
+# separators tried in order inside a section that exceeds the token budget
+MARKDOWN_SEPARATORS = ["\n\n", "\n- ", "\n* ", "\n", ". ", " ", ""]
+
+MERSENNE_PRIME = (1 << 31) - 1
+
+class MinHasher:
+    """
+    MinHash signatures over word 3-gram shingles; the share of equal signature
+    slots estimates the Jaccard similarity of two chunks.
+    """
+
+    def __init__(self, num_perm = 64, shingle_size = 3, seed = 0):
+        rng = np.random.default_rng(seed)
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype = np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype = np.uint64)
+
+    def shingles(self, text):
+        words = re.findall(r"\w+", text.lower())
+        size = self.shingle_size
+        return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+    def signature(self, text):
+        hashes = np.fromiter((int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size = 4).digest(), "big")
+                              for shingle in self.shingles(text)), dtype = np.uint64)
+        # universal hashing (a * x + b) mod p, one row per permutation: fits in uint64 for 32-bit x
+        permuted = (hashes[None, :] * self.a[:, None] + self.b[:, None]) % MERSENNE_PRIME
+        return permuted.min(axis = 1)
+
+class MarkdownChunker:
+    """
+    Structure- and token-aware splitter for crawled markdown: splits on headings,
+    then splits oversized sections by the embedding model's tokenizer, and drops
+    exact and near-duplicate chunks (MinHash + LSH bands, Jaccard >= near_dup_threshold)
+    so repeated nav bars, link lists and footers are embedded only once.
+    Exposes split_text like the langchain splitters; reset() between ingest jobs,
+    so boilerplate shared by the pages of one crawl is kept once.
+    """
+
+    def __init__(self, tokenizer, max_tokens = 256, overlap_tokens = 32, min_tokens = 8,
+                 near_dup_threshold = 0.8, num_perm = 64, bands = 16):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.near_dup_threshold = near_dup_threshold
+        # 16 bands x 4 rows: pairs above ~0.5 Jaccard share a band and get compared
+        self.hasher = MinHasher(num_perm = num_perm)
+        self.num_bands = bands
+        self.rows = num_perm // bands
+
+        self.header_splitter = MarkdownHeaderTextSplitter(headers_to_split_on = HEADERS_TO_SPLIT_ON,
+                                                          strip_headers = False)
+        self.token_splitter = RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+            tokenizer, chunk_size = max_tokens, chunk_overlap = overlap_tokens, separators = MARKDOWN_SEPARATORS)
+        self.reset()
+
+    def reset(self):
+        self.seen_hashes = set()
+        self.bands = [{} for _ in range(self.num_bands)]
+        self.dropped = {"exact": 0, "near": 0, "short": 0}
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens = False))
+
+    # function to check a chunk against the ones already kept, registering it when new
+    def is_duplicate(self, text):
+        normalized = " ".join(text.lower().split())
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        if digest in self.seen_hashes:
+            self.dropped["exact"] += 1
+            return True
+
+        signature = self.hasher.signature(normalized)
+        band_keys = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.num_bands)]
+
+        for band, key in enumerate(band_keys):
+            for other in self.bands[band].get(key, ()):
+                if np.mean(signature == other) >= self.near_dup_threshold:
+                    self.dropped["near"] += 1
+                    return True
+
+        self.seen_hashes.add(digest)
+        for band, key in enumerate(band_keys):
+            self.bands[band].setdefault(key, []).append(signature)
+
+        return False
+
+    def split_text(self, text):
+        chunks = []
+
+        for section in self.header_splitter.split_text(text):
+            content = section.page_content.strip()
+            if not content:
+                continue
+
+            pieces = [content] if self.count_tokens(content) <= self.max_tokens else self.token_splitter.split_text(content)
+
+            for piece in pieces:
+                piece = piece.strip()
+                if self.count_tokens(piece) < self.min_tokens:
+                    self.dropped["short"] += 1
+                    continue
+                if not self.is_duplicate(piece):
+                    chunks.append(piece)
+
+        return chunks
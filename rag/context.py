@@ -0,0 +1,160 @@
+import math
+from typing import Any, Callable, List
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from rag.docstore import is_live
+from rag.index_store import indexed_ids
+from utils.tracing import span
+
+# function to fetch the dense candidates: MMR (diverse) or plain similarity,
+# dropping hits below score_threshold; the embeddings are unit-norm, so the
+# squared L2 distance d returned by faiss maps to cosine similarity 1 - d / 2
+def dense_candidates(vector_db, question, settings):
+    with span("retrieve.embed_query"):
+        vector = vector_db.embeddings.embed_query(question)
+
+    # a read-only store may hold ids an ingest deleted since it was opened: over-fetch and skip them
+    options = {}
+    if getattr(vector_db.docstore, "read_only", False):
+        options = {"filter": is_live, "fetch_k": max(settings["fetch_k"], 2 * settings["k"])}
+
+    with span("retrieve.faiss_search", search_type = settings["search_type"]):
+        if settings["search_type"] == "mmr":
+            hits = vector_db.max_marginal_relevance_search_with_score_by_vector(
+                vector, k = settings["k"], fetch_k = settings["fetch_k"], lambda_mult = settings["lambda_mult"],
+                filter = options.get("filter"))
+        else:
+            hits = vector_db.similarity_search_with_score_by_vector(vector, k = settings["k"], **options)
+
+    threshold = settings.get("score_threshold")
+    return [doc for doc, distance in hits if threshold is None or 1 - float(distance) / 2 >= threshold]
+
+# function to tell whether the lexical ranking alone is trustworthy: the best
+# BM25 score leads the runner-up by skip_dense_ratio (e.g. an exact identifier);
+# a lone hit may be a weak match on one common word, so the dense pass still runs
+def lexical_is_decisive(hits, ratio):
+    if ratio is None or len(hits) < 2:
+        return False
+    return hits[0][1] >= ratio * hits[1][1]
+
+# function to fuse rankings with reciprocal rank fusion: score = sum 1 / (rrf_k + rank)
+def reciprocal_rank_fusion(rankings, rrf_k = 60):
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start = 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+
+    return sorted(scores, key = scores.get, reverse = True)
+
+# function to fetch candidate chunks for a question: dense only, or hybrid BM25 +
+# dense fused with RRF; when the lexical ranking is decisive the dense pass
+# (query embedding + faiss search) is skipped. Lexical hits are kept to the chunks of
+# the loaded index: the lexical index may already hold chunks an ingest committed after
+# this store was opened
+def retrieve_candidates(vector_db, question, settings, lexical = None):
+    if not settings.get("hybrid") or lexical is None:
+        return dense_candidates(vector_db, question, settings)
+
+    with span("retrieve.lexical") as lexical_span:
+        loaded_ids = indexed_ids(vector_db)
+        hits = [hit for hit in lexical.search(question, k = settings["lexical_k"]) if hit[0] in loaded_ids]
+        lexical_docs = {}
+        for chunk_id, _ in hits:
+            doc = vector_db.docstore.search(chunk_id)
+            if isinstance(doc, Document) and is_live(doc.metadata):
+                lexical_docs[chunk_id] = doc
+        lexical_span.set(hits = len(hits))
+
+    if lexical_is_decisive(hits, settings.get("skip_dense_ratio")):
+        return list(lexical_docs.values())[:settings["k"]]
+
+    # dense hits are keyed by content, as the chunk ids are content hashes
+    docs = {doc.page_content: doc for doc in lexical_docs.values()}
+    dense_docs = dense_candidates(vector_db, question, settings)
+    docs.update((doc.page_content, doc) for doc in dense_docs)
+
+    fused = reciprocal_rank_fusion([[doc.page_content for doc in lexical_docs.values()],
+                                    [doc.page_content for doc in dense_docs]], settings["rrf_k"])
+
+    return [docs[text] for text in fused[:settings["k"]]]
+
+class ContextPacker:
+    """
+    Packs retrieved chunks into a model's prompt budget: chunks of the same source
+    that overlap (the chunker's token overlap) are merged first, then chunks are
+    added in rank order while they fit in budget_tokens minus the tokens already
+    used by the prompt template and question. Token counts are estimated from
+    characters; the backends report the exact prompt tokens afterwards.
+    """
+
+    def __init__(self, budget_tokens, chars_per_token = 4.0, min_overlap_chars = 20):
+        self.budget_tokens = budget_tokens
+        self.chars_per_token = chars_per_token
+        self.min_overlap_chars = min_overlap_chars
+
+    def count_tokens(self, text):
+        return math.ceil(len(text) / self.chars_per_token)
+
+    # length of the longest suffix of left that is a prefix of right
+    def overlap(self, left, right):
+        for size in range(min(len(left), len(right)) - 1, self.min_overlap_chars - 1, -1):
+            if left.endswith(right[:size]):
+                return size
+        return 0
+
+    # function to merge chunks contained in or overlapping with a higher ranked one
+    def merge_overlapping(self, docs):
+        merged = []
+
+        for doc in docs:
+            text = doc.page_content
+            source = doc.metadata.get("source")
+
+            for i, kept in enumerate(merged):
+                if kept.metadata.get("source") != source:
+                    continue
+                kept_text = kept.page_content
+
+                if text in kept_text:
+                    break
+                if kept_text in text:
+                    merged[i] = Document(page_content = text, metadata = kept.metadata)
+                    break
+
+                after = self.overlap(kept_text, text)
+                if after:
+                    merged[i] = Document(page_content = kept_text + text[after:], metadata = kept.metadata)
+                    break
+                before = self.overlap(text, kept_text)
+                if before:
+                    merged[i] = Document(page_content = text + kept_text[before:], metadata = kept.metadata)
+                    break
+            else:
+                merged.append(doc)
+
+        return merged
+
+    # function to select the chunks sent to the model, best ranked first
+    def pack(self, docs, reserved_tokens = 0):
+        available = self.budget_tokens - reserved_tokens
+        packed = []
+
+        for doc in self.merge_overlapping(docs):
+            # "\n\n" joins the chunks in the stuff prompt
+            cost = self.count_tokens(doc.page_content) + 1
+            if cost <= available:
+                packed.append(doc)
+                available -= cost
+
+        return packed
+
+class PackedRetriever(BaseRetriever):
+    """
+    Retriever handed to the RetrievalQA chain: delegates to a function returning
+    the already packed documents for a question.
+    """
+
+    retrieve_fn: Callable[[str], List[Document]]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: Any = None) -> List[Document]:
+        return self.retrieve_fn(query)
@@ -0,0 +1,61 @@
+import json
+import sqlite3
+import threading
+from langchain_core.documents import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+# metadata flag of the placeholder a read-only docstore returns for a chunk an ingest
+# deleted after the reader's index snapshot was opened
+DELETED = "_deleted"
+
+# function to filter search hits (faiss `filter` callable over metadata) down to live chunks
+def is_live(metadata):
+    return not metadata.get(DELETED)
+
+class SqliteDocstore(Docstore, AddableMixin):
+    """
+    On-disk docstore for the FAISS vector store: chunk text and metadata live in
+    SQLite and are fetched by id only for the hits of a search, instead of the
+    whole pickled InMemoryDocstore being deserialized at startup. A read-only
+    store answers ids that are gone with an empty DELETED placeholder instead of
+    a "not found" string, so readers can filter them out of a search.
+    """
+
+    def __init__(self, path, read_only = False):
+        self.path = path
+        self.read_only = read_only
+        self.lock = threading.Lock()
+
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri = True, check_same_thread = False)
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread = False)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, text TEXT, metadata TEXT)")
+            self.conn.commit()
+
+    def search(self, search):
+        with self.lock:
+            row = self.conn.execute("SELECT text, metadata FROM chunks WHERE id = ?", (search,)).fetchone()
+
+        if row is None:
+            if self.read_only:
+                return Document(page_content = "", metadata = {DELETED: True})
+            return f"ID {search} not found."
+
+        return Document(page_content = row[0], metadata = json.loads(row[1]))
+
+    def add(self, texts):
+        rows = [(chunk_id, doc.page_content, json.dumps(doc.metadata)) for chunk_id, doc in texts.items()]
+
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)", rows)
+            self.conn.commit()
+
+    def delete(self, ids):
+        with self.lock:
+            self.conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in ids])
+            self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
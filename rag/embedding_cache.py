@@ -0,0 +1,234 @@
+import os
+import re
+import sys
+import json
+import atexit
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# function to take a non-blocking exclusive lock on an open file, held until it is closed;
+# False when another process holds it
+def try_lock(file):
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache for one model, as fixed-size memory-mapped tables indexed
+    by row: vectors (<model>.f32, float32), the key digest of each row (<model>.keys,
+    all zeros when free) and its last-use tick (<model>.lru), plus a small JSON header
+    (<model>.json: dim, capacity). The key -> row map and LRU order are rebuilt from
+    the key and tick tables on load, so a flush only writes back the rows that changed.
+    A row is rewritten key cleared, vector, then key, and a read checks the key before
+    and after copying the vector, so neither an eviction the index of another process
+    does not know about nor a concurrent rewrite can return another text's vector.
+    Only the process holding <model>.lock writes; the others read the cache as it was
+    when they opened it and take over writing once the lock is free.
+    """
+
+    FLUSH_EVERY = 64
+    KEY_BYTES = 32  # sha256 digest
+    LAYOUT = 2
+
+    def __init__(self, model_name, cache_dir = "cache/embeddings", max_entries = 100000):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        os.makedirs(cache_dir, exist_ok = True)
+        self.data_path = os.path.join(cache_dir, f"{safe_name}.f32")
+        self.keys_path = os.path.join(cache_dir, f"{safe_name}.keys")
+        self.ticks_path = os.path.join(cache_dir, f"{safe_name}.lru")
+        self.index_path = os.path.join(cache_dir, f"{safe_name}.json")
+        self.lock_file = open(os.path.join(cache_dir, f"{safe_name}.lock"), "a+b")
+
+        self.lock = threading.Lock()
+        self.writer = try_lock(self.lock_file)
+        self.dim = None
+        self.vectors = None
+        self.keys = None                # row -> key digest of the vector in that row
+        self.ticks = None               # row -> last use (writer only)
+        self.slots = OrderedDict()      # key -> row, least recently used first
+        self.free = []                  # rows never used (or cleared)
+        self.tick = 0
+        self.pending = 0
+        self.load()
+        atexit.register(self.flush)
+
+    # function to reopen the tables and rebuild the key -> row map in LRU order
+    # (read-only unless this process is the writer)
+    def load(self):
+        self.dim, self.vectors, self.keys, self.ticks = None, None, None, None
+        self.slots, self.free = OrderedDict(), []
+        paths = (self.index_path, self.data_path, self.keys_path, self.ticks_path)
+        if not all(os.path.exists(path) for path in paths):
+            return
+
+        with open(self.index_path, "r", encoding = "utf-8") as file:
+            header = json.load(file)
+
+        # another capacity or an older layout (JSON slot list): start over
+        if header.get("layout") != self.LAYOUT or header.get("max_entries") != self.max_entries:
+            return
+
+        self.open_tables(header["dim"], "r+" if self.writer else "r")
+        used = np.flatnonzero(self.keys.any(axis = 1))
+        ticks = self.ticks[used]
+        order = np.argsort(ticks, kind = "stable")
+        self.slots = OrderedDict((self.keys[row].tobytes().hex(), int(row)) for row in used[order])
+        self.free = sorted(set(range(self.max_entries)) - set(used.tolist()), reverse = True)
+        self.tick = int(ticks.max()) + 1 if len(ticks) else 0
+
+    def open_tables(self, dim, mode):
+        self.dim = dim
+        self.vectors = np.memmap(self.data_path, dtype = np.float32, mode = mode, shape = (self.max_entries, dim))
+        self.keys = np.memmap(self.keys_path, dtype = np.uint8, mode = mode,
+                              shape = (self.max_entries, self.KEY_BYTES))
+        self.ticks = np.memmap(self.ticks_path, dtype = np.int64, mode = mode, shape = (self.max_entries,))
+
+    # function to create empty tables and their header
+    def create(self, dim):
+        self.open_tables(dim, "w+")
+        self.free = list(range(self.max_entries - 1, -1, -1))
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding = "utf-8") as file:
+            json.dump({"model_name": self.model_name, "layout": self.LAYOUT, "dim": dim,
+                       "max_entries": self.max_entries}, file)
+        os.replace(tmp_path, self.index_path)
+
+    def key(self, text):
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha256(f"{self.model_name}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            slot = self.slots.get(key)
+            if slot is None:
+                return None
+            digest = bytes.fromhex(key)
+            if self.keys[slot].tobytes() != digest:
+                # the row was reused for another key since this process loaded the map
+                del self.slots[key]
+                return None
+            vector = self.vectors[slot].tolist()
+            if self.keys[slot].tobytes() != digest:
+                # rewritten while it was copied
+                del self.slots[key]
+                return None
+
+            self.slots.move_to_end(key)
+            if self.writer:
+                self.ticks[slot] = self.tick
+                self.tick += 1
+            return vector
+
+    # function to become the writer once no other process holds the lock,
+    # continuing from the cache as last written
+    def acquire(self):
+        if not self.writer and try_lock(self.lock_file):
+            self.writer = True
+            self.load()
+        return self.writer
+
+    def put(self, key, vector):
+        with self.lock:
+            if not self.acquire():
+                return
+
+            if self.vectors is None:
+                self.create(len(vector))
+
+            if key in self.slots:
+                slot = self.slots[key]
+                self.slots.move_to_end(key)
+            elif self.free:
+                slot = self.free.pop()
+                self.slots[key] = slot
+            else:
+                # evict the least recently used entry and reuse its row
+                _, slot = self.slots.popitem(last = False)
+                self.slots[key] = slot
+
+            # key cleared, vector, key: a row whose key matches always holds that key's vector
+            self.keys[slot] = 0
+            self.vectors[slot] = np.asarray(vector, dtype = np.float32)
+            self.keys[slot] = np.frombuffer(bytes.fromhex(key), dtype = np.uint8)
+            self.ticks[slot] = self.tick
+            self.tick += 1
+            self.pending += 1
+            flush_now = self.pending >= self.FLUSH_EVERY
+
+        if flush_now:
+            self.flush()
+
+    # function to write the changed rows back to disk
+    def flush(self):
+        with self.lock:
+            if not self.writer or self.vectors is None or self.pending == 0:
+                return
+
+            self.vectors.flush()
+            self.keys.flush()
+            self.ticks.flush()
+            self.pending = 0
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeated texts from EmbeddingCache and only
+    sends cache misses to the underlying model.
+    """
+
+    def __init__(self, embeddings, model_name, cache = None):
+        self.embeddings = embeddings
+        self.cache = cache or get_embedding_cache(model_name)
+
+    def embed_documents(self, texts):
+        keys = [self.cache.key(text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+
+        # embed each distinct missing text once
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], texts[i])
+
+        if missing:
+            new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), new_vectors))
+            for key, vector in computed.items():
+                self.cache.put(key, vector)
+            vectors = [vector if vector is not None else computed[keys[i]] for i, vector in enumerate(vectors)]
+            self.cache.flush()
+
+        return vectors
+
+    def embed_query(self, text):
+        key = self.cache.key(text)
+        vector = self.cache.get(key)
+
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(key, vector)
+
+        return vector
+
+# one cache per model per process, shared by every ingestor and chatbot
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_embedding_cache(model_name):
+    with _caches_lock:
+        if model_name not in _caches:
+            _caches[model_name] = EmbeddingCache(model_name)
+        return _caches[model_name]
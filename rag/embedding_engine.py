@@ -0,0 +1,129 @@
+import platform
+import threading
+import importlib.util
+import torch
+from sentence_transformers import SentenceTransformer
+from langchain_core.embeddings import Embeddings
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+# quantized int8 exports shipped in the sentence-transformers model repos, by instruction set
+ONNX_INT8_FILES = {
+    "avx512_vnni": "onnx/model_qint8_avx512_vnni.onnx",
+    "avx512": "onnx/model_qint8_avx512.onnx",
+    "avx2": "onnx/model_quint8_avx2.onnx",
+    "arm64": "onnx/model_qint8_arm64.onnx"
+}
+
+# function to pick the int8 export this CPU runs fastest (the avx2 one also runs on
+# older x86 CPUs, only slower); x86 features are read from /proc/cpuinfo where available
+def onnx_int8_variant():
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+
+    flags = set()
+    try:
+        with open("/proc/cpuinfo", "r", encoding = "utf-8") as file:
+            for line in file:
+                if line.startswith("flags"):
+                    flags = set(line.split(":", 1)[1].split())
+                    break
+    except OSError:
+        pass
+
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags and "avx512bw" in flags:
+        return "avx512"
+    return "avx2"
+
+class EmbeddingEngine(Embeddings):
+    """
+    sentence-transformers embedding engine for CPU boxes: configurable batch size
+    and torch intra-op threads (process-wide), an optional multi-process pool for
+    large ingests and optional ONNX / int8-quantized ONNX backends.
+    """
+
+    def __init__(self, model_name = "all-MiniLM-L6-v2", batch_size = 64, num_threads = None,
+                 backend = "torch", processes = 0, pool_min_texts = 256):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.backend = backend
+        self.pool_min_texts = pool_min_texts
+        # torch's intra-op pool is process-global: setting it here also sizes every other
+        # engine and torch user in this process, so it is only changed when asked for
+        self.num_threads = num_threads or torch.get_num_threads()
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.onnx_variant = onnx_int8_variant() if backend == "onnx-int8" else None
+        if backend != "torch" and importlib.util.find_spec("optimum") is None:
+            raise ImportError(f"The '{backend}' embedding backend needs optimum and onnxruntime: "
+                              f"pip install \"sentence-transformers[onnx]\"")
+
+        if backend == "torch":
+            self.model = SentenceTransformer(model_name, device = "cpu")
+        elif backend == "onnx":
+            self.model = SentenceTransformer(model_name, device = "cpu", backend = "onnx")
+        else:
+            self.model = SentenceTransformer(model_name, device = "cpu", backend = "onnx",
+                                             model_kwargs = {"file_name": ONNX_INT8_FILES[self.onnx_variant]})
+
+        # one worker process per requested process, each with its own model copy
+        self.pool = None
+        if processes > 0:
+            self.pool = self.model.start_multi_process_pool(target_devices = ["cpu"] * processes)
+
+    # name used for the embedding cache and index manifest: quantized vectors must not mix
+    # with full precision ones, nor with those of another int8 export
+    @property
+    def cache_name(self):
+        if self.backend == "torch":
+            return self.model_name
+        if self.onnx_variant is not None:
+            return f"{self.model_name}#{self.backend}-{self.onnx_variant}"
+        return f"{self.model_name}#{self.backend}"
+
+    # tokenizer and input window of the model, used to size chunks
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    @property
+    def max_seq_length(self):
+        return self.model.max_seq_length
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+
+        # the pool only pays off on large batches: spawning work has fixed overhead
+        if self.pool is not None and len(texts) >= self.pool_min_texts:
+            vectors = self.model.encode_multi_process(texts, self.pool, batch_size = self.batch_size)
+        else:
+            vectors = self.model.encode(texts, batch_size = self.batch_size, convert_to_numpy = True,
+                                        show_progress_bar = False)
+
+        return vectors.tolist()
+
+    def embed_query(self, text):
+        return self.model.encode([text], convert_to_numpy = True, show_progress_bar = False)[0].tolist()
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+# engines are shared per configuration: each one holds a model (and maybe a process pool)
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_embedding_engine(model_name = "all-MiniLM-L6-v2", **options):
+    key = (model_name, tuple(sorted(options.items())))
+
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = EmbeddingEngine(model_name, **options)
+        return _engines[key]
@@ -0,0 +1,378 @@
+import os
+import sys
+import time
+import queue
+import secrets
+import argparse
+import itertools
+import threading
+import subprocess
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# "auto": use the shared service, starting it when it is not running (falls back to an
+# in-process model if it cannot start); "on": the service must be reachable; "off": in-process
+SERVICE_MODE = os.getenv("EMBEDDING_SERVICE", "auto")
+# requests are pickles, so only holders of this key may connect: a random key is
+# created on first start, readable by the owner only (EMBEDDING_SERVICE_KEY overrides)
+KEY_FILE = os.getenv("EMBEDDING_SERVICE_KEY_FILE", "cache/embedding_service.key")
+
+# unix socket where available, loopback tcp on windows
+if sys.platform == "win32":
+    DEFAULT_ADDRESS = ("127.0.0.1", int(os.getenv("EMBEDDING_SERVICE_PORT", "6071")))
+else:
+    DEFAULT_ADDRESS = os.getenv("EMBEDDING_SERVICE_SOCKET", "cache/embedding_service.sock")
+
+def address_family(address):
+    return "AF_INET" if isinstance(address, tuple) else "AF_UNIX"
+
+# function to read the service key, creating it when asked; None if there is none yet
+def authkey(create = False):
+    if os.getenv("EMBEDDING_SERVICE_KEY"):
+        return os.getenv("EMBEDDING_SERVICE_KEY").encode("utf-8")
+
+    if create and not os.path.exists(KEY_FILE):
+        os.makedirs(os.path.dirname(KEY_FILE) or ".", exist_ok = True)
+        try:
+            fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as file:
+                file.write(secrets.token_hex(32).encode("ascii"))
+        except FileExistsError:
+            pass    # created concurrently by another process
+
+    try:
+        with open(KEY_FILE, "rb") as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+class DynamicBatcher:
+    """
+    Coalesces concurrent embed requests for one model: the first waiting request
+    opens a batch that collects further requests until max_batch_size texts or
+    max_wait seconds, then the whole batch is encoded in one model call and the
+    vectors are split back per request. Single-text requests (queries) are served
+    before pending multi-text ones (ingest slices), so a query never waits behind a
+    queued ingest, at most behind the batch being encoded.
+    """
+
+    QUERY, INGEST = 0, 1
+
+    def __init__(self, engine, max_batch_size = 128, max_wait = 0.01):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count()   # FIFO within a priority
+        self.stats = {"requests": 0, "batches": 0, "texts": 0}
+        self.thread = threading.Thread(target = self.run, name = "embedding-batcher", daemon = True)
+        self.thread.start()
+
+    def submit(self, texts):
+        future = Future()
+        priority = self.QUERY if len(texts) == 1 else self.INGEST
+        self.queue.put((priority, next(self.sequence), texts, future))
+        return future
+
+    def get(self, timeout = None):
+        _, _, texts, future = self.queue.get(timeout = timeout)
+        return texts, future
+
+    # function to collect requests up to max_batch_size texts, waiting at most max_wait
+    def next_batch(self):
+        batch = [self.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.get(timeout = timeout))
+            except queue.Empty:
+                break
+            size += len(batch[-1][0])
+
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            texts = [text for request_texts, _ in batch for text in request_texts]
+
+            try:
+                vectors = np.asarray(self.engine.embed_documents(texts), dtype = np.float32)
+            except Exception as ex:
+                for _, future in batch:
+                    future.set_exception(ex)
+                continue
+
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["texts"] += len(texts)
+
+            offset = 0
+            for request_texts, future in batch:
+                future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+class EmbeddingServer:
+    """
+    Local embedding worker shared by every Streamlit session: loads each model once
+    and serves ("info" | "embed" | "stats", model_name, payload) requests over a
+    multiprocessing connection, one thread per client connection, all feeding the
+    model's DynamicBatcher. Exits after idle_timeout seconds without requests (0: never).
+    """
+
+    def __init__(self, address = DEFAULT_ADDRESS, max_batch_size = 128, max_wait_ms = 10, idle_timeout = 0,
+                 engine_options = None):
+        self.address = address
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.idle_timeout = idle_timeout
+        self.engine_options = engine_options or {}
+        self.batchers = {}
+        self.lock = threading.Lock()
+        self.last_request = time.monotonic()
+
+    def batcher(self, model_name):
+        with self.lock:
+            if model_name not in self.batchers:
+                from rag.embedding_engine import get_embedding_engine
+                engine = get_embedding_engine(model_name, **self.engine_options)
+                self.batchers[model_name] = DynamicBatcher(engine, self.max_batch_size, self.max_wait)
+            return self.batchers[model_name]
+
+    def handle(self, op, model_name, payload):
+        batcher = self.batcher(model_name)
+
+        if op == "embed":
+            # large ingest requests go in max_batch_size slices; queries (higher priority) are batched
+            # ahead of the slices still waiting, so they never queue behind a whole ingest
+            futures = [batcher.submit(payload[i:i + self.max_batch_size])
+                       for i in range(0, len(payload), self.max_batch_size)]
+            return np.concatenate([future.result() for future in futures])
+        if op == "info":
+            engine = batcher.engine
+            return {"cache_name": engine.cache_name, "max_seq_length": engine.max_seq_length,
+                    "tokenizer_path": engine.tokenizer.name_or_path}
+        if op == "stats":
+            return dict(batcher.stats, max_batch_size = self.max_batch_size, max_wait_ms = self.max_wait * 1000)
+        raise ValueError(f"Unknown embedding service operation '{op}'")
+
+    def serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, model_name, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                self.last_request = time.monotonic()
+                try:
+                    conn.send(("ok", self.handle(op, model_name, payload)))
+                except Exception as ex:
+                    conn.send(("error", f"{type(ex).__name__}: {ex}"))
+
+    def watch_idle(self):
+        while True:
+            time.sleep(min(self.idle_timeout, 30))
+            if time.monotonic() - self.last_request > self.idle_timeout:
+                print(f"Embedding service idle for {self.idle_timeout} s, stopping")
+                self.close()
+                os._exit(0)
+
+    def close(self):
+        if address_family(self.address) == "AF_UNIX" and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def serve_forever(self):
+        if address_family(self.address) == "AF_UNIX":
+            # a socket file left by a dead server would make bind fail
+            if ping(self.address):
+                raise RuntimeError(f"An embedding service is already listening on {self.address}")
+            os.makedirs(os.path.dirname(self.address) or ".", exist_ok = True)
+            if os.path.exists(self.address):
+                os.remove(self.address)
+
+        listener = Listener(self.address, family = address_family(self.address), authkey = authkey(create = True))
+        if address_family(self.address) == "AF_UNIX":
+            os.chmod(self.address, 0o600)
+        print(f"Embedding service listening on {self.address} (max batch {self.max_batch_size}, "
+              f"max wait {self.max_wait * 1000:.0f} ms)")
+
+        if self.idle_timeout > 0:
+            threading.Thread(target = self.watch_idle, name = "embedding-idle", daemon = True).start()
+
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError, AuthenticationError) as ex:
+                    # failed handshake (wrong authkey, client gone): keep serving
+                    print(f"Rejected embedding service connection: {ex}")
+                    continue
+                threading.Thread(target = self.serve_connection, args = (conn,), daemon = True).start()
+        finally:
+            listener.close()
+            self.close()
+
+# function to check that a service answers on the address
+def ping(address = DEFAULT_ADDRESS):
+    key = authkey()
+    if key is None:
+        return False
+
+    try:
+        with Client(address, family = address_family(address), authkey = key):
+            return True
+    except (OSError, EOFError, AuthenticationError):
+        return False
+
+# function to start the service as a detached process and wait until it answers
+def start_service(address = DEFAULT_ADDRESS, timeout = 60, idle_timeout = 1800):
+    command = [sys.executable, "-m", "rag.embedding_service", "--idle-timeout", str(idle_timeout)]
+    if isinstance(address, tuple):
+        command += ["--port", str(address[1])]
+    else:
+        command += ["--socket", address]
+
+    # created before the server starts, so both sides read the same key
+    authkey(create = True)
+    os.makedirs("history", exist_ok = True)
+    log = open("history/embedding_service.log", "a", encoding = "utf-8")
+    options = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if sys.platform == "win32" \
+        else {"start_new_session": True}
+    subprocess.Popen(command, stdout = log, stderr = subprocess.STDOUT, **options)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if ping(address):
+            return True
+        time.sleep(0.25)
+    return False
+
+# one start at a time per process: concurrent sessions must not spawn several servers
+_start_lock = threading.Lock()
+
+# function to make sure a service answers on the address, starting it in "auto" mode
+# (the one the app starts exits after an idle timeout, so this may run again later)
+def ensure_service(address = DEFAULT_ADDRESS):
+    with _start_lock:
+        return ping(address) or (SERVICE_MODE == "auto" and start_service(address))
+
+class EmbeddingClient(Embeddings):
+    """
+    Embeddings backed by the shared EmbeddingServer. Each thread keeps its own
+    connection, so requests from concurrent sessions reach the server together and
+    are batched there. Only the tokenizer (for chunking) is loaded in this process.
+    """
+
+    def __init__(self, model_name = "all-MiniLM-L6-v2", address = DEFAULT_ADDRESS):
+        self.model_name = model_name
+        self.address = address
+        self.local = threading.local()
+        self._tokenizer = None
+        self.info = self.request("info")
+
+    def connection(self):
+        if getattr(self.local, "conn", None) is None:
+            key = authkey()
+            if key is None:
+                raise ConnectionError(f"No embedding service key in {KEY_FILE}")
+            self.local.conn = Client(self.address, family = address_family(self.address), authkey = key)
+        return self.local.conn
+
+    def request(self, op, payload = None):
+        # a broken connection is redialed once (the service may have been restarted);
+        # if that fails too the service is gone, e.g. stopped after its idle timeout,
+        # and is started again (requests are idempotent, so resending is safe)
+        for attempt in range(3):
+            try:
+                conn = self.connection()
+                conn.send((op, self.model_name, payload))
+                status, result = conn.recv()
+                break
+            except (OSError, EOFError):
+                self.local.conn = None
+                if attempt == 2 or (attempt == 1 and not ensure_service(self.address)):
+                    raise
+        if status == "error":
+            raise RuntimeError(f"Embedding service: {result}")
+        return result
+
+    @property
+    def cache_name(self):
+        return self.info["cache_name"]
+
+    @property
+    def max_seq_length(self):
+        return self.info["max_seq_length"]
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.info["tokenizer_path"])
+        return self._tokenizer
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self.request("embed", list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self.request("embed", [text])[0].tolist()
+
+    def stats(self):
+        return self.request("stats")
+
+# clients are shared per model within a process
+_clients = {}
+_clients_lock = threading.Lock()
+
+# function to get the embedding model: the shared service unless it is off or explicit
+# engine options (backend, threads, ...) ask for a dedicated in-process engine
+def get_embedder(model_name = "all-MiniLM-L6-v2", **options):
+    if SERVICE_MODE != "off" and not options:
+        with _clients_lock:
+            if model_name in _clients:
+                return _clients[model_name]
+
+            if ensure_service():
+                _clients[model_name] = EmbeddingClient(model_name)
+                return _clients[model_name]
+
+            if SERVICE_MODE == "on":
+                raise ConnectionError(f"Embedding service is not reachable on {DEFAULT_ADDRESS}")
+            print("Embedding service unavailable, loading the model in this process")
+
+    from rag.embedding_engine import get_embedding_engine
+    return get_embedding_engine(model_name, **options)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Shared embedding worker with dynamic request batching")
+    parser.add_argument("--socket", help = f"unix socket path (default {DEFAULT_ADDRESS})")
+    parser.add_argument("--port", type = int, help = "listen on 127.0.0.1:PORT instead of a unix socket")
+    parser.add_argument("--max-batch-size", type = int, default = 128, help = "texts per model call")
+    parser.add_argument("--max-wait-ms", type = float, default = 10, help = "max time a request waits for a batch")
+    parser.add_argument("--idle-timeout", type = float, default = 0, help = "exit after N idle seconds (0: never)")
+    parser.add_argument("--batch-size", type = int, help = "encode batch size of the engine")
+    parser.add_argument("--threads", type = int, help = "torch intra-op threads of the engine")
+    parser.add_argument("--backend", choices = ["torch", "onnx", "onnx-int8"])
+    args = parser.parse_args()
+
+    address = ("127.0.0.1", args.port) if args.port else (args.socket or DEFAULT_ADDRESS)
+    engine_options = {key: value for key, value in [("batch_size", args.batch_size), ("num_threads", args.threads),
+                                                    ("backend", args.backend)] if value is not None}
+
+    server = EmbeddingServer(address, max_batch_size = args.max_batch_size, max_wait_ms = args.max_wait_ms,
+                             idle_timeout = args.idle_timeout, engine_options = engine_options)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import faiss
+import numpy as np
+
+INDEX_KINDS = ["flat", "ivf_flat", "hnsw", "ivf_pq"]
+
+class IndexSpec:
+    """
+    Configuration of the FAISS index behind the vector store. Build-time parameters
+    (nlist, hnsw_m, pq_m, pq_bits) are persisted in the index manifest; query-time
+    knobs (nprobe, ef_search) are applied on load and may be changed at any time.
+    """
+
+    def __init__(self, kind = "flat", nlist = 256, hnsw_m = 32, ef_construction = 80, pq_m = 16,
+                 pq_bits = 8, nprobe = 16, ef_search = 64, train_size = 20000):
+        if kind not in INDEX_KINDS:
+            raise ValueError(f"Unknown index kind '{kind}', expected one of {INDEX_KINDS}")
+
+        self.kind = kind
+        self.nlist = nlist
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.train_size = train_size
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    # from a manifest entry, which also records the kind actually built ("active")
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{key: value for key, value in (data or {}).items() if key != "active"})
+
+    def factory_string(self, nlist = None):
+        nlist = nlist or self.nlist
+
+        if self.kind == "ivf_flat":
+            return f"IVF{nlist},Flat"
+        if self.kind == "hnsw":
+            return f"HNSW{self.hnsw_m}"
+        if self.kind == "ivf_pq":
+            return f"IVF{nlist},PQ{self.pq_m}x{self.pq_bits}"
+        return "Flat"
+
+    # smallest corpus worth training on: below it the exact flat index is used
+    def min_train_points(self):
+        if self.kind in ("ivf_flat", "ivf_pq"):
+            return max(self.nlist * 39, 2 ** self.pq_bits if self.kind == "ivf_pq" else 0)
+        return 0
+
+# function to build (and train on a sample) an index for the given vectors
+def build_index(spec, vectors):
+    vectors = np.ascontiguousarray(vectors, dtype = np.float32)
+    n, dim = vectors.shape
+
+    if spec.kind == "flat" or n < spec.min_train_points():
+        index = faiss.IndexFlatL2(dim)
+    else:
+        index = faiss.index_factory(dim, spec.factory_string(), faiss.METRIC_L2)
+        if spec.kind == "hnsw":
+            index.hnsw.efConstruction = spec.ef_construction
+
+        if not index.is_trained:
+            sample = vectors
+            if n > spec.train_size:
+                rows = np.random.default_rng(0).choice(n, spec.train_size, replace = False)
+                sample = vectors[rows]
+            index.train(sample)
+
+    if n:
+        index.add(vectors)
+    enable_reconstruct(index)
+    apply_search_params(index, spec)
+
+    return index
+
+# function to let the index return stored vectors by id, which MMR search needs
+# (index.reconstruct): IVF indexes keep no id -> inverted list map unless asked to
+def enable_reconstruct(index):
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return index
+
+    if ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+
+    return index
+
+# function to set the query-time knobs of an index
+def apply_search_params(index, spec):
+    try:
+        faiss.extract_index_ivf(index).nprobe = spec.nprobe
+    except RuntimeError:
+        pass
+
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = spec.ef_search
+
+# function to name the kind of index actually in use
+def index_kind(index):
+    if hasattr(index, "hnsw"):
+        return "hnsw"
+
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return "flat"
+
+    return "ivf_pq" if isinstance(ivf, faiss.IndexIVFPQ) else "ivf_flat"
@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+import pickle
+import hashlib
+from contextlib import contextmanager
+import faiss
+from langchain_community.vectorstores import FAISS
+from rag.docstore import SqliteDocstore
+from rag.index_factory import IndexSpec, build_index, enable_reconstruct
+from rag.lexical import get_lexical_index
+
+# on-disk layout of faiss_db (format 2): index.faiss + ids.json (position -> chunk id)
+# + docstore.sqlite (chunk text) + manifest.json (sources, format, embedding model, dim)
+# + lexical.sqlite (BM25 inverted index of the same chunks)
+INDEX_FORMAT_VERSION = 2
+INDEX_FILE = "index.faiss"
+IDS_FILE = "ids.json"
+DOCSTORE_FILE = "docstore.sqlite"
+MANIFEST_FILE = "manifest.json"
+LEXICAL_FILE = "lexical.sqlite"
+# held by the process ingesting into the dir (the streamlit app or bench.runner)
+LOCK_FILE = "ingest.lock"
+# save_local layout of the first versions: index.faiss + pickled (InMemoryDocstore, id map),
+# always embedded with the default MiniLM model
+PICKLE_FILE = "index.pkl"
+LEGACY_MODEL = "all-MiniLM-L6-v2"
+
+class StaleIndexError(Exception):
+    pass
+
+# function to hold the exclusive ingest lock of an index dir, waiting while another
+# process ingests into it; closing the file releases it
+@contextmanager
+def index_lock(index_path):
+    os.makedirs(index_path, exist_ok = True)
+    with open(os.path.join(index_path, LOCK_FILE), "a+b") as file:
+        if sys.platform == "win32":
+            import msvcrt
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after 10 seconds
+                    continue
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        yield
+
+def read_manifest(index_path):
+    path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r", encoding = "utf-8") as file:
+        return json.load(file)
+
+# function to refuse an index written in another format or with another embedding model;
+# with cache_name, also one embedded by another backend of that model (e.g. int8 ONNX)
+def check_manifest(manifest, model_name, cache_name = None):
+    if manifest.get("format_version") != INDEX_FORMAT_VERSION:
+        raise StaleIndexError(f"index format {manifest.get('format_version')} != {INDEX_FORMAT_VERSION}")
+    if manifest.get("embedding_model") != model_name:
+        raise StaleIndexError(f"index embedded with '{manifest.get('embedding_model')}', not '{model_name}'")
+    # manifests written before cache_name was recorded were built with the default torch backend
+    if cache_name is not None and manifest.get("cache_name", model_name) != cache_name:
+        raise StaleIndexError(f"index embedded as '{manifest.get('cache_name', model_name)}', not '{cache_name}'")
+
+# function to read the faiss index, memory-mapped and read-only when mmap is set
+def read_index(index_path, mmap = False):
+    path = os.path.join(index_path, INDEX_FILE)
+
+    if mmap:
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        try:
+            return enable_reconstruct(faiss.read_index(path, flags))
+        except RuntimeError:
+            # index types without mmap support are read normally
+            pass
+
+    return enable_reconstruct(faiss.read_index(path))
+
+def write_index(vector_db, index_path):
+    mapping = vector_db.index_to_docstore_id
+    write_index_files(vector_db.index, [mapping[i] for i in sorted(mapping)], index_path)
+
+# function to write the faiss index and its position -> chunk id list (atomic replaces)
+def write_index_files(index, ids, index_path):
+    os.makedirs(index_path, exist_ok = True)
+
+    tmp_path = os.path.join(index_path, INDEX_FILE + ".tmp")
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, os.path.join(index_path, INDEX_FILE))
+
+    tmp_path = os.path.join(index_path, IDS_FILE + ".tmp")
+    with open(tmp_path, "w", encoding = "utf-8") as file:
+        json.dump(ids, file)
+    os.replace(tmp_path, os.path.join(index_path, IDS_FILE))
+
+# function to open a persisted index: only the id list is loaded eagerly, chunk
+# text is read from SQLite for the hits of each search
+def open_vectorstore(index_path, embeddings, model_name, read_only = True, cache_name = None):
+    manifest = read_manifest(index_path)
+    if manifest is None:
+        raise StaleIndexError(f"no index in {index_path}")
+    check_manifest(manifest, model_name, cache_name)
+
+    with open(os.path.join(index_path, IDS_FILE), "r", encoding = "utf-8") as file:
+        ids = json.load(file)
+
+    index = read_index(index_path, mmap = read_only)
+    if index.ntotal != len(ids):
+        raise StaleIndexError(f"index holds {index.ntotal} vectors but {len(ids)} ids")
+
+    docstore = SqliteDocstore(os.path.join(index_path, DOCSTORE_FILE), read_only = read_only)
+
+    return FAISS(embeddings, index, docstore, dict(enumerate(ids)))
+
+# function to get the set of chunk ids a vector store can return, computed once per state of
+# its id mapping (an ingest grows it in place or replaces it)
+def indexed_ids(vector_db):
+    mapping = vector_db.index_to_docstore_id
+    cached = getattr(vector_db, "_indexed_ids", None)
+    if cached is None or cached[0] is not mapping or cached[1] != len(mapping):
+        cached = (mapping, len(mapping), frozenset(mapping.values()))
+        vector_db._indexed_ids = cached
+
+    return cached[2]
+
+# function to find the lexical index stored next to a vector store (None if absent)
+def lexical_index_of(vector_db):
+    path = getattr(vector_db.docstore, "path", None)
+    if path is None:
+        return None
+
+    return get_lexical_index(os.path.join(os.path.dirname(path), LEXICAL_FILE), read_only = vector_db.docstore.read_only)
+
+# function to convert an index written by save_local (index.faiss + index.pkl, no manifest)
+# into format 2, once: the vectors are kept, re-keyed by chunk content hash (the ids of
+# EmbeddingIngestor.chunk_id), and the manifest sources come from the chunks' "source"
+# metadata; the manifest is written last, so an interrupted migration is redone.
+# Returns the new manifest, None when there is no legacy index to migrate
+def migrate_pickle_index(index_path, model_name = LEGACY_MODEL):
+    pickle_path = os.path.join(index_path, PICKLE_FILE)
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(pickle_path) or os.path.exists(manifest_path):
+        return None
+
+    index = enable_reconstruct(faiss.read_index(os.path.join(index_path, INDEX_FILE)))
+    with open(pickle_path, "rb") as file:
+        old_docstore, old_mapping = pickle.load(file)
+
+    docs = {}       # chunk id -> document, first occurrence of each text
+    rows = []       # index position of each kept chunk
+    sources = {}
+    for position in sorted(old_mapping):
+        doc = old_docstore.search(old_mapping[position])
+        chunk_id = hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+        source_ids = sources.setdefault(doc.metadata.get("source", "local"), [])
+        if chunk_id not in source_ids:
+            source_ids.append(chunk_id)
+        if chunk_id not in docs:
+            docs[chunk_id] = doc
+            rows.append(position)
+
+    vectors = index.reconstruct_n(0, index.ntotal)[rows]
+    docstore = SqliteDocstore(os.path.join(index_path, DOCSTORE_FILE))
+    docstore.add(docs)
+    write_index_files(build_index(IndexSpec(), vectors), list(docs), index_path)
+
+    manifest = {"sources": sources, "format_version": INDEX_FORMAT_VERSION, "embedding_model": model_name,
+                "cache_name": model_name, "dim": index.d}
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding = "utf-8") as file:
+        json.dump(manifest, file, indent = 2)
+    os.replace(tmp_path, manifest_path)
+    os.remove(pickle_path)
+    print(f"Migrated the pickled index in {index_path}: {len(docs)} chunks of {len(sources)} source(s)")
+
+    return manifest
@@ -1,21 +1,334 @@
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.document_loaders import UnstructuredMarkdownLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from langchain_core.documents import Document
 from langchain_community.vectorstores import FAISS
+from rag.embedding_cache import CachedEmbeddings
+from rag.embedding_service import get_embedder
+from rag.chunking import MarkdownChunker
+from rag.pipeline import StageStats, StreamingSplitter, batched
+from rag.index_factory import IndexSpec, build_index, apply_search_params, index_kind
+from rag.docstore import SqliteDocstore
+from rag.lexical import get_lexical_index
+from utils.tracing import span
+from rag.index_store import (INDEX_FORMAT_VERSION, DOCSTORE_FILE, MANIFEST_FILE, LEXICAL_FILE, StaleIndexError,
+                             check_manifest, read_manifest, open_vectorstore, write_index, migrate_pickle_index)
 
 class EmbeddingIngestor:
-    def __init__(self):
-        self.model = HuggingFaceEmbeddings(model_name = "all-MiniLM-L6-v2")
-    
-    def create_embeddings(self, text):
-        with open("history/output.md", "w", encoding = "utf-8") as file:
-            file.write(text)
-        
-        loader = UnstructuredMarkdownLoader("history/output.md")
-        data = loader.load()
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size = 500, chunk_overlap = 50)
-        chunks = text_splitter.split_documents(data)
-        vector_db = FAISS.from_documents(documents=chunks, embedding=self.model)
-        vector_db.save_local("faiss_db")
-
-        return vector_db
\ No newline at end of file
+    def __init__(self, index_path = "faiss_db", model_name = "all-MiniLM-L6-v2", index_spec = None, engine_options = None):
+        # the vector store keeps this object as its embedding function, so the
+        # chatbot retriever's query embeddings go through the same cache;
+        # engine_options: batch_size, num_threads, backend, processes (see EmbeddingEngine);
+        # without them the model is served by the shared embedding service
+        self.model_name = model_name
+        self.engine = get_embedder(model_name, **(engine_options or {}))
+        self.model = CachedEmbeddings(self.engine, self.engine.cache_name)
+        # markdown-heading and token-aware chunks, sized to the model's input window,
+        # with exact / near-duplicate boilerplate (nav bars, footers) dropped before embedding
+        self.text_splitter = MarkdownChunker(self.engine.tokenizer,
+                                             max_tokens = min(256, self.engine.max_seq_length))
+        self.splitter = StreamingSplitter(self.text_splitter)
+        # persistent multi-source index: faiss files + manifest {url: [chunk hashes]}
+        self.index_path = index_path
+        self.manifest_path = os.path.join(index_path, MANIFEST_FILE)
+        self.docstore_path = os.path.join(index_path, DOCSTORE_FILE)
+        # an index saved with save_local (pickled docstore, no manifest) is converted first
+        migrate_pickle_index(index_path)
+        self.manifest = self.load_manifest()
+        # chunk ids dropped from the index, removed from the docstore only once the
+        # index without them is saved (readers of the old snapshot still resolve them)
+        self.pending_deletes = set()
+        # ANN index configuration: explicit spec, else the one persisted with the index
+        self.index_spec = index_spec or IndexSpec.from_dict(self.manifest.get("index"))
+        # BM25 inverted index of the same chunks, for hybrid retrieval
+        os.makedirs(index_path, exist_ok = True)
+        self.lexical = get_lexical_index(os.path.join(index_path, LEXICAL_FILE))
+        self.vector_db = self.load_index()
+
+    # function to read the manifest of indexed sources
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"sources": {}}
+
+        with open(self.manifest_path, "r", encoding = "utf-8") as file:
+            return json.load(file)
+
+    # function to persist the manifest (atomic replace)
+    def save_manifest(self):
+        os.makedirs(self.index_path, exist_ok = True)
+        tmp_path = self.manifest_path + ".tmp"
+
+        with open(tmp_path, "w", encoding = "utf-8") as file:
+            json.dump(self.manifest, file, indent = 2)
+        os.replace(tmp_path, self.manifest_path)
+
+    # function to load the existing index (writable)
+    def load_index(self):
+        if not self.manifest["sources"]:
+            self.lexical.clear()
+            return None
+
+        try:
+            vector_db = open_vectorstore(self.index_path, self.model, self.model_name, read_only = False,
+                                         cache_name = self.engine.cache_name)
+        except StaleIndexError as ex:
+            # never silently reuse vectors from another model or format: start a fresh index
+            print(f"Ignoring stale index in {self.index_path}: {ex}")
+            self.manifest = {"sources": {}}
+            if os.path.exists(self.docstore_path):
+                os.remove(self.docstore_path)
+            self.lexical.clear()
+            return None
+
+        apply_search_params(vector_db.index, self.index_spec)
+
+        # indexes built before the lexical index existed are backfilled from the docstore
+        if len(self.lexical) != vector_db.index.ntotal:
+            ids = list(vector_db.index_to_docstore_id.values())
+            self.lexical.clear()
+            for batch in batched(ids, 512):
+                self.lexical.add(batch, [vector_db.docstore.search(chunk_id).page_content for chunk_id in batch])
+
+        return vector_db
+
+    # function to save index and manifest together
+    def save(self):
+        if self.vector_db is not None:
+            write_index(self.vector_db, self.index_path)
+            self.manifest.update(
+                format_version = INDEX_FORMAT_VERSION,
+                embedding_model = self.model_name,
+                cache_name = self.engine.cache_name,
+                dim = self.vector_db.index.d,
+                index = dict(self.index_spec.to_dict(), active = index_kind(self.vector_db.index))
+            )
+        self.save_manifest()
+        self.flush_deletes()
+
+    # function to drop from the docstore the chunks the saved index no longer references
+    def flush_deletes(self):
+        if self.vector_db is not None and self.pending_deletes:
+            # a chunk re-added since it was dropped stays
+            live_ids = set(self.vector_db.index_to_docstore_id.values())
+            self.vector_db.docstore.delete([chunk_id for chunk_id in self.pending_deletes if chunk_id not in live_ids])
+        self.pending_deletes.clear()
+
+    # function to change the query-time knobs (nprobe for IVF, efSearch for HNSW)
+    def set_search_params(self, nprobe = None, ef_search = None):
+        self.index_spec.nprobe = nprobe or self.index_spec.nprobe
+        self.index_spec.ef_search = ef_search or self.index_spec.ef_search
+        if self.vector_db is not None:
+            apply_search_params(self.vector_db.index, self.index_spec)
+
+    # function to rebuild the faiss index with the configured spec; vectors are
+    # re-read through the embedding cache, so this costs no model passes for known chunks
+    def rebuild_index(self, exclude_ids = ()):
+        with span("ingest.rebuild_index", kind = self.index_spec.kind):
+            exclude_ids = set(exclude_ids)
+            mapping = self.vector_db.index_to_docstore_id
+            ids = [mapping[i] for i in sorted(mapping) if mapping[i] not in exclude_ids]
+            texts = [self.vector_db.docstore.search(chunk_id).page_content for chunk_id in ids]
+
+            vectors = np.asarray(self.model.embed_documents(texts), dtype = np.float32) if texts \
+                else np.zeros((0, self.vector_db.index.d), dtype = np.float32)
+
+            self.vector_db.index = build_index(self.index_spec, vectors)
+            self.vector_db.index_to_docstore_id = dict(enumerate(ids))
+            self.pending_deletes.update(exclude_ids)
+
+    # function to rebuild when the index in use differs from the configured kind
+    # (ANN kinds fall back to flat until the corpus is large enough to train on)
+    def maybe_rebuild(self):
+        ntotal = self.vector_db.index.ntotal
+        target = self.index_spec.kind if ntotal >= self.index_spec.min_train_points() else "flat"
+
+        if index_kind(self.vector_db.index) != target:
+            self.rebuild_index()
+
+    # function to switch the index configuration of an existing store
+    def configure_index(self, index_spec):
+        self.index_spec = index_spec
+
+        if self.vector_db is not None:
+            self.maybe_rebuild()
+            apply_search_params(self.vector_db.index, self.index_spec)
+            self.save()
+
+        return self.vector_db
+
+    # function to delete chunks: flat indexes remove in place, ANN indexes are rebuilt
+    # (HNSW cannot remove, IVF keeps label gaps the langchain id mapping does not expect);
+    # their text leaves the docstore on the next save()
+    def delete_ids(self, chunk_ids):
+        self.lexical.delete(chunk_ids)
+
+        if index_kind(self.vector_db.index) == "flat":
+            # not vector_db.delete(), which also drops the docstore rows right away
+            chunk_ids = set(chunk_ids)
+            mapping = self.vector_db.index_to_docstore_id
+            positions = [i for i in sorted(mapping) if mapping[i] in chunk_ids]
+            # flat removal compacts the remaining vectors in order
+            self.vector_db.index.remove_ids(np.asarray(positions, dtype = np.int64))
+            self.vector_db.index_to_docstore_id = dict(enumerate(
+                mapping[i] for i in sorted(mapping) if mapping[i] not in chunk_ids))
+            self.pending_deletes.update(chunk_ids)
+        else:
+            self.rebuild_index(exclude_ids = chunk_ids)
+
+    @staticmethod
+    def chunk_id(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    # set of chunk hashes referenced by every source except the given one
+    def referenced_ids(self, exclude_url = None):
+        ids = set()
+        for url, chunk_ids in self.manifest["sources"].items():
+            if url != exclude_url:
+                ids.update(chunk_ids)
+
+        return ids
+
+    # function to start a new ingest job: boilerplate is deduplicated across every source
+    # ingested until the next begin() (a fresh ingestor starts with an empty state)
+    def begin(self):
+        self.text_splitter.reset()
+
+    # function to stream one source into the index: split incrementally and embed
+    # only new chunks in fixed-size batches, yielding per-stage throughput after each batch
+    # (the dropped duplicate counts are those of the whole job, see begin())
+    def ingest_stream(self, url, pieces, batch_size = 64):
+        stats = StageStats()
+        stats.dropped = self.text_splitter.dropped
+        old_ids = set(self.manifest["sources"].get(url, []))
+        other_ids = self.referenced_ids(exclude_url = url)
+        indexed_ids = old_ids | other_ids
+        page_ids = {}   # insertion-ordered set of the chunk hashes of this page
+
+        def new_chunks():
+            for text in self.splitter.split(pieces, stats):
+                chunk_id = self.chunk_id(text)
+                if chunk_id in page_ids:
+                    continue
+                page_ids[chunk_id] = None
+                if chunk_id not in indexed_ids:
+                    yield chunk_id, Document(page_content = text, metadata = {"source": url})
+
+        added_ids = []
+        # lexical rows are written at commit, with the index that resolves them
+        lexical_rows = []
+        created = self.vector_db is None
+
+        try:
+            for batch in batched(new_chunks(), batch_size):
+                ids = [chunk_id for chunk_id, _ in batch]
+                docs = [doc for _, doc in batch]
+                added_ids.extend(ids)
+
+                start = time.perf_counter()
+                with span("ingest.embed", url = url, chunks = len(docs)):
+                    if self.vector_db is None:
+                        os.makedirs(self.index_path, exist_ok = True)
+                        self.vector_db = FAISS.from_documents(documents = docs, embedding = self.model, ids = ids,
+                                                              docstore = SqliteDocstore(self.docstore_path))
+                    else:
+                        self.vector_db.add_documents(docs, ids = ids)
+                stats.record("embed", len(docs), time.perf_counter() - start,
+                             chars = sum(len(doc.page_content) for doc in docs))
+                stats.mark_first_vector()
+                lexical_rows.extend(zip(ids, (doc.page_content for doc in docs)))
+
+                yield stats.summary()
+        except BaseException:
+            # closed (GeneratorExit) or failed before the commit: the source keeps its
+            # previously committed chunks and none of this call's
+            if added_ids:
+                self.rollback(added_ids, created)
+            raise
+
+        stale_ids = [chunk_id for chunk_id in old_ids if chunk_id not in page_ids and chunk_id not in other_ids]
+        changed = bool(page_ids.keys() - indexed_ids) or bool(stale_ids) or url not in self.manifest["sources"]
+
+        if changed:
+            with span("ingest.commit", url = url, stale = len(stale_ids)):
+                if stale_ids:
+                    self.delete_ids(stale_ids)
+                if self.vector_db is not None:
+                    self.maybe_rebuild()
+
+                self.manifest["sources"][url] = list(page_ids.keys())
+                self.save()
+
+            if lexical_rows:
+                start = time.perf_counter()
+                with span("ingest.lexical", chunks = len(lexical_rows)):
+                    self.lexical.add([chunk_id for chunk_id, _ in lexical_rows], [text for _, text in lexical_rows])
+                stats.record("lexical", len(lexical_rows), time.perf_counter() - start)
+
+        yield stats.summary()
+
+    # function to remove the chunks an interrupted ingest_stream added: no saved index or
+    # manifest references them yet, so their docstore rows go at once
+    def rollback(self, chunk_ids, created):
+        with span("ingest.rollback", chunks = len(chunk_ids)):
+            docstore = self.vector_db.docstore if self.vector_db is not None else None
+            if created:
+                # the index did not exist before this call
+                self.vector_db = None
+            else:
+                self.delete_ids(chunk_ids)
+                self.pending_deletes.difference_update(chunk_ids)
+
+            if docstore is None and os.path.exists(self.docstore_path):
+                docstore = SqliteDocstore(self.docstore_path)
+            if docstore is not None:
+                docstore.delete(chunk_ids)
+
+    # function to add (or refresh) one source in a single call
+    def add_url(self, url, text):
+        for _ in self.ingest_stream(url, [text]):
+            pass
+
+        return self.vector_db
+
+    # function to remove one source, keeping chunks still shared by other sources
+    def remove_url(self, url):
+        if url not in self.manifest["sources"]:
+            return self.vector_db
+
+        old_ids = self.manifest["sources"].pop(url)
+        other_ids = self.referenced_ids()
+        stale_ids = [chunk_id for chunk_id in old_ids if chunk_id not in other_ids]
+
+        if stale_ids and self.vector_db is not None:
+            self.delete_ids(stale_ids)
+
+        self.save()
+
+        return self.vector_db
+
+    def list_sources(self):
+        return list(self.manifest["sources"].keys())
+
+    def create_embeddings(self, text, url = "local"):
+        return self.add_url(url, text)
+
+
+# function to open the persisted index for querying at startup: the faiss index is
+# memory-mapped read-only and chunk text stays on disk; returns None when there is
+# no index or it was built with another format/model
+def load_vectorstore(index_path = "faiss_db", model_name = "all-MiniLM-L6-v2", engine_options = None):
+    manifest = migrate_pickle_index(index_path) or read_manifest(index_path)
+    if not manifest or not manifest.get("sources"):
+        return None
+
+    try:
+        # the model is checked before loading it, the backend (cache_name) once it is loaded
+        check_manifest(manifest, model_name)
+        engine = get_embedder(model_name, **(engine_options or {}))
+        embeddings = CachedEmbeddings(engine, engine.cache_name)
+        return open_vectorstore(index_path, embeddings, model_name, read_only = True, cache_name = engine.cache_name)
+    except (StaleIndexError, FileNotFoundError) as ex:
+        print(f"No usable index in {index_path}: {ex}")
+        return None
@@ -0,0 +1,120 @@
+import os
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter
+
+# identifiers, dotted/dashed names and version numbers stay whole (get_model,
+# langchain-core, v0.2.14), and their parts are indexed as well
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+(?:[.\-/:][a-z0-9_]+)*")
+PART_PATTERN = re.compile(r"[.\-/:_]")
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it",
+             "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "which", "with"}
+
+def tokenize(text):
+    terms = []
+
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        parts = [part for part in PART_PATTERN.split(token) if part and part not in STOPWORDS]
+        if len(parts) > 1:
+            terms.extend(parts)
+
+    return terms
+
+class BM25Index:
+    """
+    Inverted index of the chunks in SQLite (postings: term -> chunk id, term
+    frequency), kept next to the faiss index and updated with it at ingest time.
+    Queries read only the posting lists of their own terms.
+    """
+
+    def __init__(self, path, read_only = False, k1 = 1.5, b = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri = True, check_same_thread = False)
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread = False)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS docs (chunk_id TEXT PRIMARY KEY, length INTEGER)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT, chunk_id TEXT, tf INTEGER, "
+                              "PRIMARY KEY (term, chunk_id)) WITHOUT ROWID")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id)")
+            self.conn.commit()
+
+    def add(self, chunk_ids, texts):
+        docs, postings = [], []
+        for chunk_id, text in zip(chunk_ids, texts):
+            counts = Counter(tokenize(text))
+            docs.append((chunk_id, sum(counts.values())))
+            postings.extend((term, chunk_id, tf) for term, tf in counts.items())
+
+        with self.lock:
+            self.conn.executemany("DELETE FROM postings WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+            self.conn.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?)", docs)
+            self.conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+            self.conn.commit()
+
+    def delete(self, chunk_ids):
+        rows = [(chunk_id,) for chunk_id in chunk_ids]
+
+        with self.lock:
+            self.conn.executemany("DELETE FROM postings WHERE chunk_id = ?", rows)
+            self.conn.executemany("DELETE FROM docs WHERE chunk_id = ?", rows)
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM postings")
+            self.conn.execute("DELETE FROM docs")
+            self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    # function to score chunks with BM25, best first: [(chunk id, score)]
+    def search(self, query, k = 20):
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        scores = Counter()
+        with self.lock:
+            n_docs, total_length = self.conn.execute("SELECT COUNT(*), SUM(length) FROM docs").fetchone()
+            if not n_docs:
+                return []
+            avg_length = total_length / n_docs
+
+            for term in terms:
+                rows = self.conn.execute("SELECT p.tf, d.length, p.chunk_id FROM postings p "
+                                         "JOIN docs d ON d.chunk_id = p.chunk_id WHERE p.term = ?", (term,)).fetchall()
+                if not rows:
+                    continue
+
+                idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+                for tf, length, chunk_id in rows:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return scores.most_common(k)
+
+# lexical indexes are shared per file: every chatbot over the same store reads one connection
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_lexical_index(path, read_only = False):
+    if read_only and not os.path.exists(path):
+        return None
+
+    with _indexes_lock:
+        key = (path, read_only)
+        if key not in _indexes:
+            _indexes[key] = BM25Index(path, read_only = read_only)
+        return _indexes[key]
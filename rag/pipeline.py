@@ -0,0 +1,90 @@
+import time
+
+class StageStats:
+    """
+    Throughput counters for the streaming ingest stages (split, embed).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.first_vector_s = None
+        self.dropped = {}   # chunks dropped by the chunker before embedding (duplicates, too short)
+
+    def record(self, stage, items, seconds, chars = 0):
+        stats = self.stages.setdefault(stage, {"items": 0, "chars": 0, "seconds": 0.0})
+        stats["items"] += items
+        stats["chars"] += chars
+        stats["seconds"] += seconds
+
+    def mark_first_vector(self):
+        if self.first_vector_s is None:
+            self.first_vector_s = time.perf_counter() - self.started
+
+    def summary(self):
+        summary = {
+            "elapsed_s": round(time.perf_counter() - self.started, 3),
+            "first_vector_s": round(self.first_vector_s, 3) if self.first_vector_s is not None else None
+        }
+
+        for stage, stats in self.stages.items():
+            seconds = stats["seconds"] or 1e-9
+            summary[stage] = {
+                "items": stats["items"],
+                "seconds": round(stats["seconds"], 3),
+                "items_per_s": round(stats["items"] / seconds, 1),
+                "chars_per_s": round(stats["chars"] / seconds, 1)
+            }
+
+        if self.dropped:
+            summary["dropped"] = dict(self.dropped)
+
+        return summary
+
+class StreamingSplitter:
+    """
+    Splits an iterable of markdown pieces incrementally: text is buffered up to
+    window_chars, cut at the last paragraph break and handed to the text splitter,
+    so only one window is held in memory at a time.
+    """
+
+    def __init__(self, text_splitter, window_chars = 20000):
+        self.text_splitter = text_splitter
+        self.window_chars = window_chars
+
+    def split(self, pieces, stats = None):
+        buffer = ""
+
+        for piece in pieces:
+            buffer += piece
+
+            while len(buffer) >= self.window_chars:
+                cut = buffer.rfind("\n\n", 0, self.window_chars)
+                if cut <= 0:
+                    cut = self.window_chars
+                window, buffer = buffer[:cut], buffer[cut:]
+                yield from self.split_window(window, stats)
+
+        if buffer.strip():
+            yield from self.split_window(buffer, stats)
+
+    def split_window(self, window, stats):
+        start = time.perf_counter()
+        chunks = self.text_splitter.split_text(window)
+
+        if stats is not None:
+            stats.record("split", len(chunks), time.perf_counter() - start, chars = len(window))
+
+        yield from chunks
+
+def batched(items, batch_size):
+    batch = []
+
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
@@ -0,0 +1,93 @@
+import json
+import threading
+import urllib.request
+from collections import OrderedDict
+from config.ai_models import get_model, get_rag_settings, list_models
+from rag.chatbot import ChatBot, build_llm, config_hash
+from utils.tracing import span
+
+class ChatBotRegistry:
+    """
+    Process-wide cache of ready ChatBot chains keyed by (model name, config hash,
+    retrieval settings hash, vector store id). Chat clients are shared per (model, config), so their HTTP
+    connection pools to Ollama/OpenAI stay open across Streamlit reruns and sessions.
+    """
+
+    def __init__(self, max_chatbots = 32, keep_alive = "30m"):
+        self.max_chatbots = max_chatbots
+        self.keep_alive = keep_alive
+        self.lock = threading.Lock()
+        self.llms = {}
+        self.chatbots = OrderedDict()
+        self.preloaded = set()
+        self.preload_thread = None
+
+    # function to get (or build once) the llm client for a model config
+    def get_llm(self, model_name, model_config = None):
+        model_config = model_config or get_model(model_name)
+        key = (model_name, config_hash(model_config))
+
+        with self.lock:
+            if key not in self.llms:
+                self.llms[key] = build_llm(model_name, model_config, keep_alive = self.keep_alive)
+            return self.llms[key]
+
+    # function to get a ready chatbot for a vector store and model
+    def get(self, vector_db, model_name):
+        model_config = get_model(model_name)
+        rag_settings = get_rag_settings(model_name)
+        # the entry holds a reference to vector_db, so its id cannot be reused while cached
+        key = (model_name, config_hash(model_config), config_hash(rag_settings), id(vector_db))
+
+        with self.lock:
+            chatbot = self.chatbots.get(key)
+            if chatbot is not None:
+                self.chatbots.move_to_end(key)
+                return chatbot
+
+        with span("chatbot.build", model = model_name):
+            llm = self.get_llm(model_name, model_config)
+            chatbot = ChatBot(vector_db, model_name, llm = llm, model_config = model_config, rag_settings = rag_settings)
+
+        with self.lock:
+            self.chatbots[key] = chatbot
+            while len(self.chatbots) > self.max_chatbots:
+                self.chatbots.popitem(last = False)
+
+        return chatbot
+
+    # function to load an ollama model into memory ahead of the first question
+    def preload(self, model_name):
+        if model_name == "OpenAI" or model_name in self.preloaded:
+            return False
+
+        model_config = get_model(model_name)
+        base_url = model_config.get("base_url", "http://localhost:11434").rstrip("/")
+        payload = json.dumps({"model": model_config["model"], "keep_alive": self.keep_alive}).encode("utf-8")
+        request = urllib.request.Request(f"{base_url}/api/generate", data = payload,
+                                         headers = {"Content-Type": "application/json"})
+
+        try:
+            with urllib.request.urlopen(request, timeout = 120) as response:
+                response.read()
+            self.preloaded.add(model_name)
+            return True
+        except OSError as ex:
+            print(f"Failure preloading {model_name}: {ex}")
+            return False
+
+    # function to preload every ollama model in the background (once per process)
+    def preload_all(self):
+        def run():
+            for model_name in list_models():
+                self.preload(model_name)
+
+        with self.lock:
+            if self.preload_thread is None:
+                self.preload_thread = threading.Thread(target = run, name = "ollama-preload", daemon = True)
+                self.preload_thread.start()
+
+        return self.preload_thread
+
+# registry shared by every streamlit session of the process
+chatbot_registry = ChatBotRegistry()
@@ -1,14 +1,68 @@
-from langchain_ollama import ChatOllama
+import os
+import re
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.prompts import PromptTemplate
+from config.ai_models import get_model, get_rag_settings
+from parse.parsing import LLMParser
+from rag.chatbot import config_hash
+from rag.registry import chatbot_registry
+from utils.tracing import span, propagate
+
+class SummaryCache:
+    """
+    On-disk cache of partial summaries: one JSON file per (model config, prompt,
+    input text) hash, so re-summarizing an edited page only redoes changed chunks.
+    """
+
+    def __init__(self, cache_dir = "cache/summaries"):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok = True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self.path(key), "r", encoding = "utf-8") as file:
+                return json.load(file)["summary"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, summary):
+        tmp_path = self.path(key) + ".tmp"
+        with open(tmp_path, "w", encoding = "utf-8") as file:
+            json.dump({"summary": summary}, file)
+        os.replace(tmp_path, self.path(key))
 
 class WebSummarizer:
-    def __init__(self):
-        self.llm = ChatOllama(
-            model = "deepseek-r1:1.5b",
-            base_url = "http://localhost:11434",
-            temperature = 0.3,
-            max_tokens = 200
-        )
+    """
+    Map-reduce summarizer: pages that fit in the model's context budget are
+    summarized in one call; larger ones are split into model-sized chunks,
+    summarized by a bounded pool of workers and the partial summaries reduced
+    level by level until one remains.
+    """
+
+    def __init__(self, model_name = "Deepseek", max_workers = 4, cache = None):
+        self.model_name = model_name
+        self.model_config = get_model(model_name)
+        self.llm = chatbot_registry.get_llm(model_name, self.model_config)
+        # ollama runs parallel requests only up to its OLLAMA_NUM_PARALLEL setting
+        self.max_workers = max_workers
+        self.cache = cache or SummaryCache()
+        self.parser = LLMParser()
+
+        rag = get_rag_settings(model_name)
+        self.chunk_chars = int(rag["context_budget"] * rag["chars_per_token"]) - 600
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size = self.chunk_chars, chunk_overlap = 0)
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        # optional callback(stats) before and after each model call and on cache hits, for
+        # progress; it may raise to stop the summary (cancellation) before the next model call
+        self.on_progress = None
 
         self.prompt_template =  """
                 You are an AI assistant that is tasked with summarizing a web page.
@@ -18,14 +72,124 @@ class WebSummarizer:
 
                 Please provide a comprehensive and detailed summary in Markdown format.
             """
-        
+
+        self.map_template = """
+                You are an AI assistant summarizing one part of a longer web page.
+                Summarize the key points, facts and figures of this part concisely in Markdown:
+                {content}
+            """
+
+        self.reduce_template = """
+                You are an AI assistant combining partial summaries of one web page.
+                Merge them into a single summary, removing repetitions:
+                {content}
+
+                Please provide a comprehensive and detailed summary in Markdown format.
+            """
+
+    # function to split the page into chunks that fit the model: sections (headings)
+    # are packed greedily, but a chunk always starts at a section whose hash is an
+    # anchor, so an edit only shifts chunk boundaries up to the next anchor
+    def split(self, content):
+        sections = []
+        for section in re.split(r"(?m)^(?=#{1,3} )", content):
+            if section.strip():
+                sections.extend(self.splitter.split_text(section) if len(section) > self.chunk_chars else [section])
+
+        chunks, current = [], ""
+        for section in sections:
+            anchor = hashlib.sha1(section.encode("utf-8")).digest()[0] % 4 == 0
+            if current and (anchor or len(current) + len(section) > self.chunk_chars):
+                chunks.append(current)
+                current = ""
+            current += section
+        if current:
+            chunks.append(current)
+
+        return chunks
+
+    def cache_key(self, template, content):
+        encoded = f"{self.model_name}\x00{config_hash(self.model_config)}\x00{template}\x00{content}".encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    # function to run one summarization call through the cache
+    def complete(self, template, content):
+        key = self.cache_key(template, content)
+        summary = self.cache.get(key)
+        if summary is not None:
+            with self.stats_lock:
+                self.stats["cached"] += 1
+            self.report()
+            return summary
+
+        self.report()
+        prompt_text = PromptTemplate(template = template, input_variables = ["content"]).format(content = content)
+        with span("summarize.llm", model = self.model_name, chars = len(content)):
+            summary = self.llm.invoke([{"role": "user", "content": prompt_text}]).content
+        with self.stats_lock:
+            self.stats["calls"] += 1
+        self.cache.put(key, summary)
+        self.report()
+
+        return summary
+
+    def report(self):
+        if self.on_progress is not None:
+            with self.stats_lock:
+                stats = dict(self.stats)
+            self.on_progress(stats)
+
+    # function to summarize several texts with the bounded worker pool; reasoning
+    # (<think> blocks) is dropped from partial summaries before they are combined
+    def complete_all(self, template, texts):
+        pool = ThreadPoolExecutor(max_workers = self.max_workers)
+        try:
+            summaries = list(pool.map(propagate(lambda text: self.complete(template, text)), texts))
+        finally:
+            # when a call raised (e.g. cancellation), chunks not started yet are dropped
+            # instead of being paid for before the error surfaces
+            pool.shutdown(wait = False, cancel_futures = True)
+
+        return [self.parser.parse_llm_response(summary)[0] for summary in summaries]
+
+    # function to group partial summaries into reduce inputs that fit the model;
+    # at least two per group, so every level shrinks even with oversized summaries
+    def group(self, summaries):
+        groups, current, count = [], "", 0
+        for summary in summaries:
+            if count >= 2 and len(current) + len(summary) + 2 > self.chunk_chars:
+                groups.append(current)
+                current, count = "", 0
+            current += summary + "\n\n"
+            count += 1
+        groups.append(current)
+
+        return groups
+
     def summarize(self, content):
-        summary_prompt = PromptTemplate(template = self.prompt_template, input_variables = ["content"])
-        prompt_text = summary_prompt.format(content = content)
-        messages = [{
-            "role": "user",
-            "content": prompt_text
-        }]
-
-        response = self.llm.invoke(messages)
-        return response.content
\ No newline at end of file
+        with span("summarize", model = self.model_name, chars = len(content)) as summary_span:
+            summary = self.map_reduce(content)
+            summary_span.set(**self.stats)
+
+        return summary
+
+    def map_reduce(self, content):
+        self.stats = {"chunks": 0, "levels": 0, "calls": 0, "cached": 0}
+
+        if len(content) <= self.chunk_chars:
+            self.stats["chunks"] = 1
+            return self.complete(self.prompt_template, content)
+
+        chunks = self.split(content)
+        self.stats["chunks"] = len(chunks)
+        with span("summarize.map", chunks = len(chunks)):
+            summaries = self.complete_all(self.map_template, chunks)
+
+        # reduce hierarchically until the partial summaries fit in one final call
+        while True:
+            self.stats["levels"] += 1
+            groups = self.group(summaries)
+            with span("summarize.reduce", level = self.stats["levels"], groups = len(groups)):
+                if len(groups) == 1:
+                    return self.complete(self.reduce_template, groups[0])
+                summaries = self.complete_all(self.reduce_template, groups)
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import urllib.request
+import urllib.error
+
+class CachePolicy:
+    """
+    How WebScrapper uses the local page cache:
+    - "use": serve entries younger than ttl, revalidate older ones with ETag/Last-Modified
+    - "refresh": always crawl and overwrite the cached entry
+    - "bypass": no cache reads or writes (previous behaviour)
+    """
+
+    MODES = ("use", "refresh", "bypass")
+
+    def __init__(self, mode = "use", ttl = 24 * 3600, max_bytes = 200 * 1024 * 1024):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {self.MODES}")
+
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    @property
+    def reads(self):
+        return self.mode == "use"
+
+    @property
+    def writes(self):
+        return self.mode != "bypass"
+
+class PageCache:
+    """
+    Persistent url -> markdown cache: one file per page under cache_dir plus an
+    index.json with validators (etag, last_modified), fetch time and size.
+    """
+
+    def __init__(self, cache_dir = "cache/pages", max_bytes = 200 * 1024 * 1024, timeout = 5):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok = True)
+        self.index = self.load_index()
+
+    def load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+
+        with open(self.index_path, "r", encoding = "utf-8") as file:
+            return json.load(file)
+
+    def save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding = "utf-8") as file:
+            json.dump(self.index, file, indent = 2)
+        os.replace(tmp_path, self.index_path)
+
+    def page_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".md")
+
+    # function to read a cached page, returns the index entry plus markdown or None
+    def get(self, url):
+        with self.lock:
+            entry = self.index.get(url)
+            path = self.page_path(url)
+            if entry is None or not os.path.exists(path):
+                return None
+
+            with open(path, "r", encoding = "utf-8") as file:
+                markdown = file.read()
+
+            entry["last_access"] = time.time()
+            return dict(entry, markdown = markdown)
+
+    # function to store a crawled page with its validators and same-domain links
+    def put(self, url, markdown, headers = None, links = None):
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+
+        with self.lock:
+            with open(self.page_path(url), "w", encoding = "utf-8") as file:
+                file.write(markdown)
+
+            now = time.time()
+            self.index[url] = {
+                "etag": headers.get("etag"),
+                "last_modified": headers.get("last-modified"),
+                "fetched_at": now,
+                "last_access": now,
+                "size": len(markdown.encode("utf-8")),
+                "links": links or []
+            }
+            self.evict()
+            self.save_index()
+
+    # function to mark a revalidated entry as fresh again
+    def touch(self, url):
+        with self.lock:
+            if url in self.index:
+                self.index[url]["fetched_at"] = time.time()
+                self.save_index()
+
+    # function to drop least recently accessed pages until the cache fits in max_bytes
+    def evict(self):
+        total = sum(entry["size"] for entry in self.index.values())
+
+        for url in sorted(self.index, key = lambda key: self.index[key]["last_access"]):
+            if total <= self.max_bytes:
+                break
+
+            total -= self.index.pop(url)["size"]
+            path = self.page_path(url)
+            if os.path.exists(path):
+                os.remove(path)
+
+    # function to ask the origin whether a cached page changed (conditional HEAD request)
+    def not_modified(self, url, entry):
+        if not entry.get("etag") and not entry.get("last_modified"):
+            return False
+
+        request = urllib.request.Request(url, method = "HEAD")
+        if entry.get("etag"):
+            request.add_header("If-None-Match", entry["etag"])
+        if entry.get("last_modified"):
+            request.add_header("If-Modified-Since", entry["last_modified"])
+
+        try:
+            with urllib.request.urlopen(request, timeout = self.timeout) as response:
+                # some servers ignore conditional HEAD: compare the validators ourselves
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                return ((etag is not None and etag == entry.get("etag")) or
+                        (last_modified is not None and last_modified == entry.get("last_modified")))
+        except urllib.error.HTTPError as ex:
+            return ex.code == 304
+        except (urllib.error.URLError, OSError):
+            return False
+
+    # function to resolve a url from the cache according to the policy, None means crawl it
+    def lookup(self, url, policy):
+        if not policy.reads:
+            return None
+
+        entry = self.get(url)
+        if entry is None:
+            return None
+
+        if time.time() - entry["fetched_at"] <= policy.ttl:
+            return entry
+
+        if self.not_modified(url, entry):
+            self.touch(url)
+            return entry
+
+        return None
+
+# one page cache per process, shared by every scraper
+_page_cache = None
+_page_cache_lock = threading.Lock()
+
+def get_page_cache(max_bytes = 200 * 1024 * 1024):
+    global _page_cache
+
+    with _page_cache_lock:
+        if _page_cache is None:
+            _page_cache = PageCache(max_bytes = max_bytes)
+        _page_cache.max_bytes = max_bytes
+        return _page_cache
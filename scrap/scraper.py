@@ -1,13 +1,136 @@
+import asyncio
+from urllib.parse import urljoin, urldefrag, urlparse
 from crawl4ai import AsyncWebCrawler, CacheMode, CrawlerRunConfig
+from scrap.cache import CachePolicy, get_page_cache
+from utils.tracing import span
 
 class WebScrapper:
-    def __init__(self):
-        pass
-    
+    def __init__(self, max_concurrency = 4, cache_policy = None):
+        self.max_concurrency = max_concurrency
+        self.cache_policy = cache_policy or CachePolicy()
+        self.cache = get_page_cache(self.cache_policy.max_bytes) if self.cache_policy.writes else None
+
     async def crawl(self, url):
+        with span("scrape.crawl", url = url) as crawl_span:
+            cached = await self.cached_page(url)
+            crawl_span.set(cache_hit = cached is not None)
+            if cached is not None:
+                return cached["markdown"]
+
+            # crawl4ai's own cache is bypassed: freshness is handled by the local page cache
+            crawler_config = CrawlerRunConfig(cache_mode = CacheMode.BYPASS)
+
+            async with AsyncWebCrawler() as crawler:
+                result = await crawler.arun(url = url, config = crawler_config)
+                self.store_page(url, result)
+
+                return result.markdown
+
+    # function to look a url up in the local cache (revalidation runs off the event loop)
+    async def cached_page(self, url):
+        if self.cache is None:
+            return None
+
+        return await asyncio.to_thread(self.cache.lookup, url, self.cache_policy)
+
+    # function to save a successful crawl result in the local cache
+    def store_page(self, url, result):
+        if self.cache is None or not result.success:
+            return
+
+        links = [link.get("href") if isinstance(link, dict) else link
+                 for link in (result.links or {}).get("internal", [])]
+        self.cache.put(url, result.markdown, headers = result.response_headers,
+                       links = [link for link in links if link])
+
+    # function to crawl several urls with a single browser, following same-domain links
+    # up to max_depth and yielding (url, markdown) as soon as each page finishes
+    async def crawl_many(self, urls, max_depth = 0, max_pages = 50, max_concurrency = None):
         crawler_config = CrawlerRunConfig(cache_mode = CacheMode.BYPASS)
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+        domains = {urlparse(url).netloc for url in urls}
+        seen = set()
+        pending = set()
+
+        # the browser is only launched on the first cache miss
+        crawler = None
+        crawler_lock = asyncio.Lock()
+
+        async def get_crawler():
+            nonlocal crawler
+            async with crawler_lock:
+                if crawler is None:
+                    crawler = AsyncWebCrawler()
+                    await crawler.start()
+                return crawler
+
+        async def fetch(url, depth):
+            cached = await self.cached_page(url)
+            if cached is not None:
+                return url, depth, cached
+
+            async with semaphore:
+                try:
+                    with span("scrape.fetch", url = url, depth = depth):
+                        page_crawler = await get_crawler()
+                        result = await page_crawler.arun(url = url, config = crawler_config)
+                        self.store_page(url, result)
+                except Exception as ex:
+                    print(f"Failure crawling {url}: {ex}")
+                    return url, depth, None
+
+            if not result.success:
+                return url, depth, None
+
+            return url, depth, {"markdown": result.markdown, "links": result.links}
+
+        def schedule(url, depth):
+            url = urldefrag(url)[0]
+            if url in seen or len(seen) >= max_pages:
+                return
+            seen.add(url)
+            pending.add(asyncio.create_task(fetch(url, depth)))
+
+        for url in urls:
+            schedule(url, 0)
+
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    pending.discard(task)
+                    url, depth, result = task.result()
+
+                    if result is None:
+                        continue
+
+                    if depth < max_depth:
+                        for link in self.internal_links(url, result["links"], domains):
+                            schedule(link, depth + 1)
+
+                    yield url, result["markdown"]
+        finally:
+            for task in pending:
+                task.cancel()
+            if crawler is not None:
+                await crawler.close()
+
+    # function to collect the same-domain links of a page (crawl4ai links dict or cached list)
+    @staticmethod
+    def internal_links(page_url, page_links, domains):
+        if isinstance(page_links, dict):
+            page_links = page_links.get("internal", [])
+        links = []
+
+        for link in page_links or []:
+            href = link.get("href") if isinstance(link, dict) else link
+            if not href:
+                continue
 
-        async with AsyncWebCrawler() as crawler:
-            result = await crawler.arun(url = url, config = crawler_config)
+            absolute = urljoin(page_url, href)
+            parsed = urlparse(absolute)
+            if parsed.scheme in ("http", "https") and parsed.netloc in domains:
+                links.append(absolute)
 
-            return result.markdown
\ No newline at end of file
+        return links
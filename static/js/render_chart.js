@@ -136,3 +136,46 @@ function render_detail_time_barplot(containerId, bar_keys, bar_series) {
         series: bar_series
     });
 }
+
+function render_stage_barplot(containerId, model_names, stage_series) {
+    Highcharts.chart(containerId, {
+        chart: {
+            type: 'column'
+        },
+        title: {
+            text: 'Stage Analysis - Mean Latency per Pipeline Stage'
+        },
+        subtitle: {
+            text: 'Retrieval, prompt packing, LLM prefill and decoding'
+        },
+        xAxis: {
+            categories: model_names,
+            title: {
+                text: 'LLM Models'
+            }
+        },
+        yAxis: {
+            min: 0,
+            title: {
+                text: 'Time (s)'
+            },
+            stackLabels: {
+                enabled: true,
+                format: '{total:.2f} s'
+            }
+        },
+        tooltip: {
+            headerFormat: '<b>{point.x}</b><br/>',
+            pointFormat: '{series.name}: {point.y:.3f} s<br/>Total: {point.stackTotal:.2f} s'
+        },
+        plotOptions: {
+            column: {
+                stacking: 'normal'
+            }
+        },
+        credits: {
+            enabled: false
+        },
+        series: stage_series
+    });
+}
@@ -0,0 +1,170 @@
+import math
+import bisect
+import itertools
+
+# function to compute a percentile with linear interpolation over sorted values
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+
+    position = (len(sorted_values) - 1) * q
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    fraction = position - lower
+
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+
+# function to summarize one model: [low, q1, median, q3, high] with 1.5 IQR whiskers, plus outliers
+def box_stats(values):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None, []
+
+    q1, median, q3 = percentile(values, 0.25), percentile(values, 0.5), percentile(values, 0.75)
+    iqr = q3 - q1
+    low_fence, high_fence = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+
+    inliers = [v for v in values if low_fence <= v <= high_fence]
+    outliers = [v for v in values if v < low_fence or v > high_fence]
+    box = [inliers[0], q1, median, q3, inliers[-1]]
+
+    return [round(v, 4) for v in box], outliers
+
+# run times (minutes) are also counted per model in log-spaced buckets: bucket b holds
+# the times in [TIME_BUCKET_RATIO ** b, TIME_BUCKET_RATIO ** (b + 1)), i.e. 2% wide
+TIME_BUCKET_RATIO = 1.02
+MIN_TIME = 1e-6
+
+def time_bucket(time):
+    return math.floor(math.log(max(time, MIN_TIME), TIME_BUCKET_RATIO))
+
+# function to summarize one model like box_stats from its time histogram {bucket: count},
+# each time taken as the geometric middle of its bucket; one outlier per bucket
+def histogram_box_stats(histogram):
+    items = sorted((int(bucket), count) for bucket, count in histogram.items() if count > 0)
+    if not items:
+        return None, []
+
+    values = [TIME_BUCKET_RATIO ** (bucket + 0.5) for bucket, _ in items]
+    ends = list(itertools.accumulate(count for _, count in items))
+
+    # percentile() over the expanded sorted times, without expanding them
+    def quantile(q):
+        position = (ends[-1] - 1) * q
+        lower = values[bisect.bisect_right(ends, math.floor(position))]
+        upper = values[bisect.bisect_right(ends, math.ceil(position))]
+        return lower + (upper - lower) * (position - math.floor(position))
+
+    q1, median, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+    iqr = q3 - q1
+    low_fence, high_fence = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+
+    inliers = [v for v in values if low_fence <= v <= high_fence]
+    outliers = [v for v in values if v < low_fence or v > high_fence]
+    box = [inliers[0], q1, median, q3, inliers[-1]]
+
+    return [round(v, 4) for v in box], outliers
+
+# function to build highcharts boxplot data from {model_name: [times]}, or from
+# {model_name: {bucket: count}} with stats = histogram_box_stats
+def boxplot_from_times(times_by_model, stats = box_stats):
+    models, observations, outliers = [], [], []
+
+    for model_name in sorted(times_by_model):
+        box, model_outliers = stats(times_by_model[model_name])
+        if box is None:
+            continue
+
+        x = len(models)
+        models.append(model_name)
+        observations.append(box)
+        outliers.extend([x, round(v, 4)] for v in model_outliers)
+
+    return models, observations, outliers
+
+# function to build highcharts bar data from {experiment_key: {model_name: time}}
+def barplot_from_times(times_by_experiment):
+    keys = sorted(times_by_experiment)
+    model_names = sorted({model for times in times_by_experiment.values() for model in times})
+
+    series = [{
+        "name": model_name,
+        "data": [round(times_by_experiment[key][model_name], 4) if times_by_experiment[key].get(model_name) is not None else None
+                 for key in keys]
+    } for model_name in model_names]
+
+    return keys, series
+
+# function to build the stacked bar series of mean stage latency (seconds) per model
+# from {model: {stage: mean seconds}}; stages keep the pipeline order they first appear in
+def stage_bars_from_means(means_by_model):
+    model_names = sorted(means_by_model)
+    stages = []
+    for model_name in model_names:
+        for stage in means_by_model[model_name]:
+            if stage not in stages:
+                stages.append(stage)
+
+    series = [{
+        "name": stage,
+        "data": [round(means_by_model[model_name].get(stage, 0.0), 3) for model_name in model_names]
+    } for stage in stages]
+
+    return model_names, series
+
+# stages every answered (not cached) run records, in chat and ask-all mode alike
+LLM_STAGES = ("llm.prefill", "llm.decode")
+
+# function to check a run's stage breakdown can be averaged with the others
+# (cached answers and runs of older versions lack the model stages)
+def complete_stages(stages):
+    return bool(stages) and all(stage in stages for stage in LLM_STAGES)
+
+# function to prepare the stage breakdown chart from read_documents() data: every stage
+# is averaged over all runs of the model, a stage a run did not go through counting as 0
+def prepare_stage_breakdown(experiment_data):
+    totals = {}
+    runs = {}
+
+    for experiment in (experiment_data or {}).values():
+        if not isinstance(experiment, dict):
+            continue
+        for model_name, stages in zip(experiment.get("model_name", []), experiment.get("stages", [])):
+            if not complete_stages(stages):
+                continue
+            runs[model_name] = runs.get(model_name, 0) + 1
+            for stage, seconds in stages.items():
+                totals.setdefault(model_name, {})[stage] = totals.get(model_name, {}).get(stage, 0.0) + seconds
+
+    means_by_model = {model: {stage: seconds / runs[model] for stage, seconds in stages.items()}
+                      for model, stages in totals.items()}
+
+    return stage_bars_from_means(means_by_model)
+
+# function to prepare the global boxplot of time per model from read_documents() data
+def prepare_boxplot_time(experiment_data):
+    times_by_model = {}
+
+    for experiment in (experiment_data or {}).values():
+        if not isinstance(experiment, dict):
+            continue
+        for model_name, time in zip(experiment.get("model_name", []), experiment.get("time", [])):
+            times_by_model.setdefault(model_name, []).append(time)
+
+    return boxplot_from_times(times_by_model)
+
+# function to prepare the detailed barplot of mean time per model and experiment
+def prepare_barplot_time(experiment_data):
+    totals = {}
+
+    for experiment_key, experiment in (experiment_data or {}).items():
+        if not isinstance(experiment, dict):
+            continue
+        for model_name, time in zip(experiment.get("model_name", []), experiment.get("time", [])):
+            if time is not None:
+                totals.setdefault(experiment_key, {}).setdefault(model_name, []).append(time)
+
+    times_by_experiment = {key: {model: sum(values) / len(values) for model, values in models.items()}
+                           for key, models in totals.items()}
+
+    return barplot_from_times(times_by_experiment)
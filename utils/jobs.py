@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+JOBS_DIR = "history/jobs"
+ACTIVE = ("queued", "running")
+
+class JobCancelled(Exception):
+    pass
+
+class JobContext:
+    """
+    Handed to a job function as its first argument: report() publishes progress
+    (a 0-1 fraction or None when unknown, plus a message); check() raises
+    JobCancelled once the job was cancelled, called where it is safe to stop.
+    """
+
+    def __init__(self, manager, job_id):
+        self.manager = manager
+        self.job_id = job_id
+        self.cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def report(self, progress = None, message = None):
+        self.manager.update(self.job_id, progress = progress, message = message)
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+class JobManager:
+    """
+    Background jobs (crawl, ingest, summarization) on a shared thread pool, so
+    they outlive the Streamlit script run that started them. Jobs have ids,
+    progress, cooperative cancellation, and their state (plus the result, unless
+    submitted with persist_result = False, for large payloads) is persisted in
+    JOBS_DIR: a finished job can still be read after a restart, and jobs that were
+    running when the process died become "interrupted". A finished job leaves
+    memory once release() is called, or after result_ttl seconds if nobody does.
+    """
+
+    def __init__(self, max_workers = 4, jobs_dir = JOBS_DIR, keep = 200, result_ttl = 3600):
+        self.jobs_dir = jobs_dir
+        self.keep = keep
+        self.result_ttl = result_ttl
+        self.pool = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "job")
+        self.lock = threading.Lock()
+        self.jobs = {}          # job id -> state dict
+        self.contexts = {}      # job id -> JobContext of queued / running jobs
+        self.transient = set()  # ids of jobs whose result is kept in memory only
+        os.makedirs(jobs_dir, exist_ok = True)
+        self.prune()
+        self.recover()
+
+    def path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def save(self, state):
+        if state["id"] in self.transient:
+            state = dict(state, result = None)
+        tmp_path = self.path(state["id"]) + ".tmp"
+        with open(tmp_path, "w", encoding = "utf-8") as file:
+            json.dump(state, file)
+        os.replace(tmp_path, self.path(state["id"]))
+
+    # function to keep only the newest `keep` job files
+    def prune(self):
+        files = sorted((entry for entry in os.scandir(self.jobs_dir) if entry.name.endswith(".json")),
+                       key = lambda entry: entry.stat().st_mtime)
+
+        for entry in files[:max(0, len(files) - self.keep)]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    # function to mark jobs left active by a previous process as interrupted
+    def recover(self):
+        for entry in os.scandir(self.jobs_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path, "r", encoding = "utf-8") as file:
+                    state = json.load(file)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if state.get("status") in ACTIVE:
+                state["status"] = "interrupted"
+                self.save(state)
+
+    # function to run fn(context, *args, **kwargs) in the background; returns the job id
+    def submit(self, kind, fn, *args, label = None, persist_result = True, **kwargs):
+        self.evict()
+        job_id = f"{kind}-{uuid.uuid4().hex[:12]}"
+        state = {"id": job_id, "kind": kind, "label": label, "status": "queued", "progress": None,
+                 "message": None, "result": None, "error": None, "created": time.time(),
+                 "started": None, "finished": None}
+        context = JobContext(self, job_id)
+
+        with self.lock:
+            self.jobs[job_id] = state
+            self.contexts[job_id] = context
+            if not persist_result:
+                self.transient.add(job_id)
+            self.save(state)
+
+        self.pool.submit(self.run, job_id, context, fn, args, kwargs)
+        return job_id
+
+    def run(self, job_id, context, fn, args, kwargs):
+        if context.cancelled:
+            self.finish(job_id, "cancelled")
+            return
+
+        self.update(job_id, status = "running", started = time.time())
+        try:
+            result = fn(context, *args, **kwargs)
+        except JobCancelled:
+            self.finish(job_id, "cancelled")
+        except Exception as ex:
+            print(f"Job {job_id} failed: {ex}")
+            self.finish(job_id, "failed", error = f"{type(ex).__name__}: {ex}")
+        else:
+            self.finish(job_id, "done", result = result, progress = 1.0)
+
+    def update(self, job_id, **fields):
+        with self.lock:
+            state = self.jobs[job_id]
+            state.update({key: value for key, value in fields.items() if value is not None})
+            # only state changes are persisted, progress ticks stay in memory
+            if "status" in fields:
+                self.save(state)
+
+    def finish(self, job_id, status, **fields):
+        with self.lock:
+            state = self.jobs[job_id]
+            state.update(fields, status = status, finished = time.time())
+            self.contexts.pop(job_id, None)
+            try:
+                self.save(state)
+            except TypeError as ex:
+                # a result that is not JSON-serializable stays in memory only
+                print(f"Result of job {job_id} not persisted: {ex}")
+                self.save(dict(state, result = None))
+
+        self.prune()
+
+    # function to drop a finished job from memory once its result was picked up
+    # (it can still be read from its file)
+    def release(self, job_id):
+        with self.lock:
+            state = self.jobs.get(job_id)
+            if state is not None and state["status"] not in ACTIVE:
+                del self.jobs[job_id]
+                self.transient.discard(job_id)
+
+    # function to drop finished jobs nobody picked up within result_ttl
+    def evict(self):
+        deadline = time.time() - self.result_ttl
+        with self.lock:
+            expired = [job_id for job_id, state in self.jobs.items()
+                       if state["status"] not in ACTIVE and state["finished"] < deadline]
+            for job_id in expired:
+                del self.jobs[job_id]
+                self.transient.discard(job_id)
+
+    # function to read a job (from memory, or from its file after a restart); None if unknown
+    def get(self, job_id):
+        with self.lock:
+            if job_id in self.jobs:
+                return dict(self.jobs[job_id])
+
+        try:
+            with open(self.path(job_id), "r", encoding = "utf-8") as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    # function to request cancellation: queued jobs never start, running ones stop at their next check()
+    def cancel(self, job_id):
+        with self.lock:
+            context = self.contexts.get(job_id)
+        if context is None:
+            return False
+
+        context.cancel_event.set()
+        self.update(job_id, message = "Cancelling...")
+        return True
+
+    # function to list jobs of this process, newest first
+    def list(self, kind = None):
+        with self.lock:
+            jobs = [dict(state) for state in self.jobs.values() if kind is None or state["kind"] == kind]
+        return sorted(jobs, key = lambda state: state["created"], reverse = True)
+
+# one job pool per process, shared by every streamlit session
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager(max_workers = int(os.getenv("JOB_WORKERS", "4")))
+        return _manager
@@ -0,0 +1,97 @@
+import os
+import asyncio
+import hashlib
+import threading
+from contextlib import aclosing
+from utils.tracing import propagate
+
+# background job functions of the AI Chatbot page (run by utils.jobs, first argument is
+# the JobContext); heavy modules are imported on first run, results are JSON-serializable
+
+# ingests write the shared faiss_db, so they take turns (crawls and summaries run in parallel);
+# index_lock also makes them wait for bench.runner ingesting into it from another process
+_ingest_lock = threading.Lock()
+
+# crawled markdown of the last crawl of each url (preview, download and summary input)
+EXTRACTED_DIR = "history/extracted"
+
+def extracted_path(url):
+    return os.path.join(EXTRACTED_DIR, hashlib.sha256(url.encode("utf-8")).hexdigest()[:16] + ".md")
+
+# function to crawl one url (or its same-domain site up to depth) and embed each page into the
+# persisted index as soon as it is fetched, committing page by page: indexed pages are
+# queryable while the crawl goes on and no page stays in memory once it is indexed (the
+# markdown is appended to extracted_path(url)). index_kind switches the index to another
+# kind (keeping its other persisted parameters), None keeps it as configured. Cancellation
+# stops between pages, so every indexed page is committed whole.
+# Returns {urls, path, chars, stats} with the last ingest stats
+def crawl_ingest_task(context, url, depth, max_pages, cache_mode, cache_ttl, index_kind = None):
+    from scrap.scraper import WebScrapper
+    from scrap.cache import CachePolicy
+    from rag.ingest import EmbeddingIngestor
+    from rag.index_factory import IndexSpec
+    from rag.index_store import index_lock
+
+    scraper = WebScrapper(cache_policy = CachePolicy(mode = cache_mode, ttl = cache_ttl))
+    max_pages = max_pages if depth > 0 else 1
+    result = {"urls": [], "path": extracted_path(url), "chars": 0, "stats": {}}
+    os.makedirs(EXTRACTED_DIR, exist_ok = True)
+
+    context.report(0.0, "Waiting for other ingests to finish...")
+    with _ingest_lock, index_lock("faiss_db"), open(result["path"], "w", encoding = "utf-8") as extracted:
+        # opened inside the lock: it must see the index as left by the previous ingest
+        ingestor = EmbeddingIngestor()
+        if index_kind is not None and index_kind != ingestor.index_spec.kind:
+            context.report(0.0, f"Switching the index to {index_kind}...")
+            ingestor.configure_index(IndexSpec.from_dict(dict(ingestor.index_spec.to_dict(), kind = index_kind)))
+        # nav bars and footers repeated across the crawled pages are embedded once per job
+        ingestor.begin()
+
+        def ingest_page(page_url, markdown):
+            context.check()
+            result["urls"].append(page_url)
+            if not markdown:
+                return
+            extracted.write(markdown + "\n\n")
+            extracted.flush()
+            result["chars"] += len(markdown)
+
+            for stats in ingestor.ingest_stream(page_url, [markdown]):
+                embedded = stats.get("embed", {}).get("items", 0)
+                context.report(len(result["urls"]) / max_pages,
+                               f"Page {len(result['urls'])}, {page_url}: embedded {embedded} new chunks")
+                result["stats"] = stats
+
+        # one browser, concurrent fetches; each page is embedded in a worker thread, so the
+        # next pages keep downloading meanwhile. aclosing runs the crawler's cleanup (browser,
+        # pending fetches) when cancelled, as asyncio.run patched by nest_asyncio does not
+        # finalize abandoned async generators
+        async def crawl_site():
+            context.report(0.0, f"Crawling {url}...")
+            async with aclosing(scraper.crawl_many([url], max_depth = depth, max_pages = max_pages)) as crawled:
+                async for page_url, markdown in crawled:
+                    await asyncio.to_thread(propagate(ingest_page), page_url, markdown)
+
+        asyncio.run(crawl_site())
+
+    return result
+
+# function to summarize the extracted text (file written by crawl_ingest_task) map-reduce;
+# returns {summary, stats}
+def summarize_task(context, path, model_name):
+    from rag.summarization import WebSummarizer
+
+    with open(path, "r", encoding = "utf-8") as file:
+        text = file.read()
+
+    summarizer = WebSummarizer(model_name)
+
+    def on_progress(stats):
+        context.report(message = f"Summarizing: {stats['calls']} model calls, {stats['cached']} from cache, "
+                                 f"{stats['chunks']} chunks")
+        context.check()
+
+    summarizer.on_progress = on_progress
+    summary = summarizer.summarize(text)
+
+    return {"summary": summary, "stats": summarizer.stats}
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import atexit
+import secrets
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+
+# spans are appended to this file, one OTLP/JSON-style span object per line, when
+# TRACE_ENABLED=1 (stage breakdowns are collected either way); past TRACE_MAX_MB it is
+# rotated to <file>.1, so at most twice that is kept
+TRACE_FILE = os.getenv("TRACE_FILE", "history/traces.jsonl")
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0") == "1"
+TRACE_MAX_BYTES = int(float(os.getenv("TRACE_MAX_MB", "50")) * 1024 * 1024)
+SERVICE_NAME = "web-chatbot"
+
+class JsonlSpanExporter:
+    """
+    Appends finished spans to a JSON lines file in the OpenTelemetry (OTLP/JSON)
+    span shape: traceId, spanId, parentSpanId, name, start/end unix nanos,
+    typed attributes and status. The file is rotated once it exceeds max_bytes.
+    """
+
+    def __init__(self, path = TRACE_FILE, max_bytes = TRACE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.file = None
+        atexit.register(self.close)
+
+    @staticmethod
+    def attribute(key, value):
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def export(self, span):
+        record = {
+            "resource": {"service.name": SERVICE_NAME},
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": span.start_ns,
+            "endTimeUnixNano": span.end_ns,
+            "attributes": [self.attribute(key, value) for key, value in span.attributes.items() if value is not None],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+        }
+
+        with self.lock:
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok = True)
+                self.file = open(self.path, "a", encoding = "utf-8", buffering = 1)
+            self.file.write(json.dumps(record) + "\n")
+
+            if self.file.tell() > self.max_bytes:
+                self.file.close()
+                os.replace(self.path, self.path + ".1")
+                self.file = None
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+_exporter = JsonlSpanExporter()
+
+class Span:
+    def __init__(self, name, parent = None, attributes = None, start_ns = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or {})
+        self.start_ns = start_ns or time.time_ns()
+        self.start_perf = time.perf_counter()
+        self.end_ns = None
+        self.error = None
+        # direct children durations by name, only collected under a Trace
+        self.stages = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, end_ns = None):
+        if end_ns is None:
+            end_ns = self.start_ns + int((time.perf_counter() - self.start_perf) * 1e9)
+        self.end_ns = end_ns
+
+        if self.parent is not None and self.parent.stages is not None:
+            seconds = (self.end_ns - self.start_ns) / 1e9
+            self.parent.stages[self.name] = self.parent.stages.get(self.name, 0.0) + seconds
+        if TRACE_ENABLED:
+            _exporter.export(self)
+
+# span currently open in this thread / asyncio task
+_current = contextvars.ContextVar("current_span", default = None)
+
+# function to time a block as a child of the current span
+@contextmanager
+def span(name, **attributes):
+    current = Span(name, parent = _current.get(), attributes = attributes)
+    token = _current.set(current)
+
+    try:
+        yield current
+    except Exception as ex:
+        current.error = f"{type(ex).__name__}: {ex}"
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+# decorator to time every call of a function as a span
+def traced(name):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# function to run fn in a worker thread as a child of the span current here
+# (thread pools do not inherit context variables)
+def propagate(fn):
+    parent = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return run
+
+class Trace:
+    """
+    Root span of one measured operation (e.g. one answer) that sums the duration
+    of its direct child spans by name: the per-stage breakdown stored with each
+    result. activate() makes it the parent of spans opened in a block, so it can
+    be used around the non-yielding parts of a generator; record() adds a stage
+    timed by hand (perf_counter seconds).
+    """
+
+    def __init__(self, name, **attributes):
+        self.root = Span(name, parent = _current.get(), attributes = attributes)
+        self.root.stages = {}
+
+    @contextmanager
+    def activate(self):
+        token = _current.set(self.root)
+        try:
+            yield self.root
+        finally:
+            _current.reset(token)
+
+    def record(self, name, start, end, **attributes):
+        offset_ns = int((start - self.root.start_perf) * 1e9)
+        child = Span(name, parent = self.root, attributes = attributes, start_ns = self.root.start_ns + offset_ns)
+        child.end(end_ns = child.start_ns + int((end - start) * 1e9))
+
+    # function to close the trace, returns {stage: seconds} rounded to the millisecond
+    def finish(self, **attributes):
+        self.root.set(**attributes)
+        self.root.end()
+        return {name: round(seconds, 3) for name, seconds in self.root.stages.items()}